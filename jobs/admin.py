@@ -0,0 +1,26 @@
+from django.contrib import admin
+
+from jobs.models import Job
+from utilities.admin import BaseAdmin
+
+
+@admin.register(Job)
+class JobAdmin(BaseAdmin):
+    list_display = [
+        'task',
+        'queue',
+        'status',
+        'attempts',
+        'run_at',
+        'started_at',
+        'finished_at',
+        'manage_buttons',
+    ]
+    list_filter = [
+        'status',
+        'queue',
+    ]
+    search_fields = [
+        'task',
+        'dedup_key',
+    ]
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    name = 'jobs'
+
+    def ready(self):
+        # registers the tasks of every app, the worker processes run them by name
+        autodiscover_modules('tasks')
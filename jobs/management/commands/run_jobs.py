@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = "Run the queued background jobs on a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queues', nargs='*', help="Queues to run, all the JOB_QUEUES by default.")
+        parser.add_argument(
+            '--processes', type=int,
+            help="Size of the process pool, 0 runs the jobs in this process. JOB_WORKER_PROCESSES by default.",
+        )
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due.")
+        parser.add_argument('--max-jobs', type=int, help="Exit after running this many jobs.")
+
+    def handle(self, *args, **options):
+        worker = Worker(queues=options['queues'], processes=options['processes'], log=self.stderr.write)
+        self.stdout.write(f"worker {worker.name} running {dict(worker.limits)} on {worker.processes} processes.")
+        stats = worker.run(burst=options['burst'], max_jobs=options['max_jobs'])
+        self.stdout.write(self.style.SUCCESS(f"ran {stats['claimed']} jobs, {stats['failed']} failed."))
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='modified at')),
+                ('queue', models.CharField(max_length=50, verbose_name='queue')),
+                ('task', models.CharField(max_length=255, verbose_name='task')),
+                ('arguments', models.TextField(default='{}', verbose_name='arguments')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'queued'), (2, 'running'), (3, 'done'), (4, 'failed')], default=1, verbose_name='status')),
+                ('dedup_key', models.CharField(blank=True, max_length=255, null=True, verbose_name='deduplication key')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=1, verbose_name='max attempts')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='run at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='locked until')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='worker')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+            ],
+            options={
+                'verbose_name': 'job',
+                'verbose_name_plural': 'jobs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'queue', 'run_at'], name='jobs_job_status_be0287_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(status=1), fields=('dedup_key',), name='jobs_job_queued_dedup_key'),
+        ),
+    ]
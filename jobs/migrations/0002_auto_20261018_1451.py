@@ -0,0 +1,17 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'finished_at'], name='jobs_job_status_d700c4_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from utilities.models import BaseModel
+
+
+class Job(BaseModel):
+    QUEUED = 1
+    RUNNING = 2
+    DONE = 3
+    FAILED = 4
+
+    STATUS_CHOICES = (
+        (QUEUED, "queued"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    )
+
+    queue = models.CharField(
+        max_length=50,
+        verbose_name=_("queue")
+    )
+    task = models.CharField(
+        max_length=255,
+        verbose_name=_("task")
+    )
+    arguments = models.TextField(
+        default='{}',
+        verbose_name=_("arguments")
+    )
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+        verbose_name=_("status")
+    )
+    dedup_key = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        verbose_name=_("deduplication key")
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_("attempts")
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name=_("max attempts")
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_("run at")
+    )
+    started_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("started at")
+    )
+    finished_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("finished at")
+    )
+    locked_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("locked until")
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_("worker")
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name=_("last error")
+    )
+
+    class Meta:
+        verbose_name = _("job")
+        verbose_name_plural = _("jobs")
+        indexes = [
+            models.Index(fields=['status', 'queue', 'run_at', ]),
+            models.Index(fields=['status', 'finished_at', ]),
+        ]
+        constraints = [
+            # a queued job absorbs the identical ones enqueued before it runs
+            models.UniqueConstraint(
+                fields=['dedup_key', ], condition=Q(status=1), name='jobs_job_queued_dedup_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.task} - {self.pk}'
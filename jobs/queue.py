@@ -0,0 +1,191 @@
+"""
+Durable job queue stored in the `Job` table. Jobs are claimed by a conditional UPDATE, only the
+worker whose UPDATE changed the row runs it, so any number of workers can share the table.
+A claimed job holds its lock for `JOB_TIMEOUT` seconds, the ones whose worker died are retried
+once it expires. Failed jobs are retried with an exponential backoff up to their `max_attempts`.
+"""
+import json
+import math
+import random
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.tasks import get_task
+
+
+def queue_limits():
+    """The `JOB_QUEUES` setting as `{queue: concurrency limit}`."""
+    limits = OrderedDict()
+    for queue in settings.JOB_QUEUES:
+        name, limit = queue.split(':')
+        limits[name.strip()] = int(limit)
+    return limits
+
+
+def enqueue(task, args=(), kwargs=None, queue='default', dedup_key=None, delay=0, max_attempts=1):
+    arguments = json.dumps({'args': list(args), 'kwargs': kwargs or {}})
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    queue=queue, task=task, arguments=arguments, dedup_key=dedup_key, max_attempts=max_attempts,
+                    run_at=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            if dedup_key is None:
+                raise
+            existing = Job.objects.filter(dedup_key=dedup_key, status=Job.QUEUED).first()
+            if existing is not None:
+                return existing
+            # the queued duplicate was claimed meanwhile, this run still has to happen
+    raise IntegrityError(f"could not enqueue {task} with the deduplication key {dedup_key}")
+
+
+def claim(limits, slots, worker):
+    """
+    Marks up to `slots` due jobs as running for `worker`, at most `limit` running jobs per queue
+    counting the ones of the other workers, and returns them.
+    """
+    now = timezone.now()
+    running = dict(
+        Job.objects.filter(status=Job.RUNNING, queue__in=list(limits)).order_by().values('queue').annotate(
+            total=Count('pk')
+        ).values_list('queue', 'total')
+    )
+    claimed = []
+    for queue, limit in limits.items():
+        free = min(limit - running.get(queue, 0), slots - len(claimed))
+        if free <= 0:
+            continue
+        due = Job.objects.filter(queue=queue, status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+        for pk in due.values_list('pk', flat=True)[:free]:
+            updated = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, attempts=F('attempts') + 1, started_at=now, worker=worker,
+                locked_until=now + timedelta(seconds=settings.JOB_TIMEOUT), modified_at=now,
+            )
+            if updated:
+                claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def run(job):
+    """Runs a claimed job in this process."""
+    arguments = json.loads(job.arguments)
+    with transaction.atomic():
+        get_task(job.task)(*arguments['args'], **arguments['kwargs'])
+
+
+def complete(job):
+    now = timezone.now()
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(
+        status=Job.DONE, finished_at=now, locked_until=None, modified_at=now,
+    )
+
+
+def retry_delay(attempts):
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    # jittered so the jobs failing together don't all come back together
+    return random.uniform(delay / 2, delay)
+
+
+def fail(job, error):
+    """Queues the job again after its backoff, or marks it failed once it used all its attempts."""
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        values = {'status': Job.QUEUED, 'run_at': now + timedelta(seconds=retry_delay(job.attempts))}
+    else:
+        values = {'status': Job.FAILED, 'finished_at': now}
+    claimed = Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts)
+    try:
+        with transaction.atomic():
+            claimed.update(last_error=error, locked_until=None, modified_at=now, **values)
+    except IntegrityError:
+        # an identical job was queued meanwhile, it does the work of this retry
+        claimed.update(status=Job.DONE, finished_at=now, last_error=error, locked_until=None, modified_at=now)
+
+
+def requeue_expired():
+    """Fails the attempt of the running jobs whose lock expired, their worker died or hung."""
+    expired = list(Job.objects.filter(status=Job.RUNNING, locked_until__lt=timezone.now()))
+    for job in expired:
+        fail(job, f"timed out on {job.worker}")
+    return len(expired)
+
+
+def prune(batch_size=1000):
+    """Deletes the done jobs finished more than `JOB_RETENTION` seconds ago, by batches, returns their number."""
+    expired = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=timezone.now() - timedelta(seconds=settings.JOB_RETENTION)
+    ).order_by('finished_at')
+    pruned = 0
+    while True:
+        pks = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return pruned
+        pruned += Job.objects.filter(pk__in=pks).delete()[0]
+
+
+def metrics():
+    """Depth of every queue and the wait / run times of the jobs finished in the last `JOB_METRICS_WINDOW` seconds."""
+    now = timezone.now()
+    limits = queue_limits()
+    queues = OrderedDict()
+
+    def queue_metrics(queue):
+        if queue not in queues:
+            queues[queue] = OrderedDict([
+                ('limit', limits.get(queue)), ('queued', 0), ('due', 0), ('running', 0), ('failed', 0),
+                ('oldest_due_seconds', None),
+            ])
+        return queues[queue]
+
+    for queue in limits:
+        queue_metrics(queue)
+
+    names = {Job.QUEUED: 'queued', Job.RUNNING: 'running', Job.FAILED: 'failed'}
+    totals = Job.objects.exclude(status=Job.DONE).order_by().values('queue', 'status').annotate(total=Count('pk'))
+    for row in totals:
+        queue_metrics(row['queue'])[names[row['status']]] = row['total']
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by().values('queue').annotate(
+        total=Count('pk'), oldest=Min('run_at')
+    )
+    for row in due:
+        queue_metrics(row['queue'])['due'] = row['total']
+        queue_metrics(row['queue'])['oldest_due_seconds'] = round((now - row['oldest']).total_seconds(), 3)
+
+    finished = Job.objects.filter(
+        status=Job.DONE, finished_at__gte=now - timedelta(seconds=settings.JOB_METRICS_WINDOW)
+    ).order_by('-finished_at').values_list('queue', 'run_at', 'started_at', 'finished_at')[:10000]
+    samples = {}
+    for queue, run_at, started_at, finished_at in finished:
+        waits, runs = samples.setdefault(queue, ([], []))
+        waits.append((started_at - run_at).total_seconds())
+        runs.append((finished_at - started_at).total_seconds())
+    for queue, (waits, runs) in samples.items():
+        queue_metrics(queue).update([
+            ('finished', len(runs)),
+            ('wait_ms', latency(waits)),
+            ('run_ms', latency(runs)),
+        ])
+    return queues
+
+
+def latency(durations):
+    durations = sorted(durations)
+
+    def percentile(value):
+        index = min(len(durations) - 1, max(0, math.ceil(value / 100 * len(durations)) - 1))
+        return round(durations[index] * 1000, 3)
+
+    return OrderedDict([
+        ('mean', round(sum(durations) / len(durations) * 1000, 3)),
+        ('p50', percentile(50)),
+        ('p95', percentile(95)),
+        ('max', round(durations[-1] * 1000, 3)),
+    ])
@@ -0,0 +1,52 @@
+"""
+Task registry: functions decorated with `@task(queue=...)` keep being callable inline and gain
+`enqueue(*args, **kwargs)`, which stores a job the workers run later by the task name.
+The arguments are stored as JSON.
+"""
+from django.conf import settings
+
+registry = {}
+
+
+class Task:
+    def __init__(self, function, queue='default', max_attempts=None):
+        self.function = function
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.name = f'{function.__module__}.{function.__name__}'
+        self.__doc__ = function.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.function(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def enqueue(self, *args, dedup_key=None, delay=0, **kwargs):
+        """
+        Queues a run of the task and returns its job, or the queued job with the same `dedup_key`.
+        With `JOBS_EAGER` the task runs right away instead and nothing is returned.
+        """
+        if settings.JOBS_EAGER:
+            self.function(*args, **kwargs)
+            return None
+        from jobs.queue import enqueue
+        return enqueue(
+            self.name, args, kwargs, queue=self.queue, dedup_key=dedup_key, delay=delay,
+            max_attempts=self.max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+
+
+def task(queue='default', max_attempts=None):
+    def register(function):
+        registered = Task(function, queue=queue, max_attempts=max_attempts)
+        registry[registered.name] = registered
+        return registered
+    return register
+
+
+def get_task(name):
+    try:
+        return registry[name]
+    except KeyError:
+        raise LookupError(f"unknown task {name}")
@@ -0,0 +1,105 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from jobs import queue
+from jobs.models import Job
+from jobs.tasks import task
+from jobs.worker import Worker
+from utilities.models import ImportCheckpoint
+
+User = get_user_model()
+
+
+@task()
+def record(name):
+    ImportCheckpoint.objects.create(name=name)
+
+
+@task(queue='maintenance', max_attempts=2)
+def broken():
+    raise ValueError("broken task")
+
+
+class JobQueueTest(APITestCase):
+    def test_enqueue_deduplicates_queued_jobs(self):
+        first = record.enqueue('first', dedup_key='record:first')
+        self.assertEqual(record.enqueue('first', dedup_key='record:first'), first)
+        self.assertEqual(queue.claim({'default': 1}, 1, 'worker'), [first])
+        # the queued job already started, the new one has to run again
+        self.assertNotEqual(record.enqueue('first', dedup_key='record:first').pk, first.pk)
+
+    def test_jobs_run_inline_when_eager(self):
+        with self.settings(JOBS_EAGER=True):
+            self.assertIsNone(record.enqueue('eager'))
+        self.assertTrue(ImportCheckpoint.objects.filter(name='eager').exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = broken.enqueue()
+        with self.settings(JOB_RETRY_BACKOFF=60):
+            stats = Worker(processes=0).run(burst=True)
+        self.assertEqual((stats['claimed'], stats['failed']), (1, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=29))
+        self.assertIn("ValueError: broken task", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        Worker(processes=0).run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_claims_respect_the_queue_limits(self):
+        running = record.enqueue('running')
+        Job.objects.filter(pk=running.pk).update(status=Job.RUNNING, worker='other')
+        queued = [record.enqueue(str(index)) for index in range(3)]
+        self.assertEqual(queue.claim({'default': 2}, 5, 'worker'), queued[:1])
+        self.assertEqual(queue.claim({'default': 2}, 5, 'worker'), [])
+
+    def test_jobs_of_dead_workers_are_retried(self):
+        job = record.enqueue('expired')
+        queue.claim({'default': 1}, 1, 'dead')
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        with self.settings(JOB_RETRY_BACKOFF=0):
+            self.assertEqual(Worker(processes=0).run(burst=True)['done'], 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+        self.assertEqual(job.last_error, "timed out on dead")
+
+    def test_expired_done_jobs_are_pruned(self):
+        expired, recent, failed = record.enqueue('expired'), record.enqueue('recent'), broken.enqueue()
+        now = timezone.now()
+        Job.objects.filter(pk=expired.pk).update(status=Job.DONE, finished_at=now - timedelta(days=2))
+        Job.objects.filter(pk=recent.pk).update(status=Job.DONE, finished_at=now - timedelta(hours=1))
+        Job.objects.filter(pk=failed.pk).update(status=Job.FAILED, finished_at=now - timedelta(days=2))
+        with self.settings(JOB_RETENTION=24 * 3600):
+            self.assertEqual(Worker(processes=0).run(burst=True)['pruned'], 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, failed.pk})
+
+    def test_metrics(self):
+        record.enqueue('done')
+        broken.enqueue(delay=60)
+        Worker(processes=0, queues=['default']).run(burst=True)
+
+        self.client.force_authenticate(User.objects.create_user(username='not_admin', password='x'))
+        self.assertEqual(self.client.get(reverse('job-metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', email='a@a.com', password='x'))
+        metrics = self.client.get(reverse('job-metrics')).json()
+        self.assertEqual(metrics['default']['finished'], 1)
+        self.assertIn('p95', metrics['default']['run_ms'])
+        self.assertEqual((metrics['maintenance']['queued'], metrics['maintenance']['due']), (1, 0))
+
+
+class JobWorkerProcessTest(APITransactionTestCase):
+    def test_process_pool(self):
+        for index in range(4):
+            record.enqueue(f'process {index}')
+        stats = Worker(processes=2).run(burst=True)
+        self.assertEqual(stats['done'], 4)
+        self.assertEqual(ImportCheckpoint.objects.count(), 4)
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {Job.DONE})
@@ -0,0 +1,14 @@
+from rest_framework import status
+from rest_framework.generics import GenericAPIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from jobs.queue import metrics
+
+
+class JobMetricsAPIView(GenericAPIView):
+    """Depth of the job queues and wait / run times of the recently finished jobs."""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics(), status=status.HTTP_200_OK)
@@ -0,0 +1,121 @@
+"""
+Job worker: claims the due jobs within the per-queue limits and runs them on a process pool.
+The worker process records the outcome of every job, the pool processes only run the tasks.
+"""
+import os
+import socket
+import time
+import traceback
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.db import connections
+
+from jobs import queue
+
+
+def execute(job):
+    """Runs a job in a pool process, returns the traceback of its failure."""
+    try:
+        queue.run(job)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        connections.close_all()
+    return None
+
+
+class Worker:
+    def __init__(self, queues=None, processes=None, poll_interval=None, log=None):
+        self.limits = OrderedDict(
+            (name, limit) for name, limit in queue.queue_limits().items() if not queues or name in queues
+        )
+        self.processes = settings.JOB_WORKER_PROCESSES if processes is None else processes
+        self.poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.log = log or (lambda message: None)
+        self.stats = Counter()
+        self.pool = None
+        self.running = {}
+        self.pruned_at = None
+
+    def start_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+        # the forked pool processes must not share the database connections of this one
+        connections.close_all()
+        self.pool = ProcessPoolExecutor(max_workers=self.processes, initializer=django.setup)
+
+    def run(self, burst=False, max_jobs=None):
+        """Runs jobs until stopped, with `burst` until no job is due, or until `max_jobs` were claimed."""
+        if self.processes > 0:
+            self.start_pool()
+        try:
+            while max_jobs is None or self.stats['claimed'] < max_jobs:
+                queue.requeue_expired()
+                self.prune()
+                slots = max(self.processes, 1) - len(self.running)
+                if max_jobs is not None:
+                    slots = min(slots, max_jobs - self.stats['claimed'])
+                jobs = queue.claim(self.limits, slots, self.name) if slots > 0 else []
+                for job in jobs:
+                    self.start(job)
+                if self.running:
+                    self.collect(timeout=self.poll_interval)
+                elif not jobs:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+        finally:
+            while self.running:
+                self.collect(timeout=None)
+            if self.pool is not None:
+                self.pool.shutdown()
+        return self.stats
+
+    def prune(self):
+        """Deletes the expired done jobs every `JOB_PRUNE_INTERVAL` seconds."""
+        now = time.monotonic()
+        if self.pruned_at is not None and now - self.pruned_at < settings.JOB_PRUNE_INTERVAL:
+            return
+        self.pruned_at = now
+        self.stats['pruned'] += queue.prune()
+
+    def start(self, job):
+        self.stats['claimed'] += 1
+        if self.pool is None:
+            try:
+                queue.run(job)
+                error = None
+            except Exception:
+                error = traceback.format_exc()
+            self.finish(job, error)
+        else:
+            self.running[self.pool.submit(execute, job)] = job
+
+    def collect(self, timeout):
+        done, pending = wait(list(self.running), timeout=timeout, return_when=FIRST_COMPLETED)
+        broken = False
+        for future in done:
+            job = self.running.pop(future)
+            try:
+                error = future.result()
+            except BrokenProcessPool:
+                # a pool process died (killed, out of memory), its jobs are retried
+                error = traceback.format_exc()
+                broken = True
+            self.finish(job, error)
+        if broken and not self.running:
+            self.start_pool()
+
+    def finish(self, job, error):
+        if error is None:
+            queue.complete(job)
+            self.stats['done'] += 1
+        else:
+            queue.fail(job, error)
+            self.stats['failed'] += 1
+            self.log(f"{job} failed, attempt {job.attempts} of {job.max_attempts}:\n{error}")
@@ -10,6 +10,8 @@ class PostAdmin(BaseAdmin):
         'user',
         'text',
         'is_draft',
+        'likes_count',
+        'comments_count',
         'created_at',
         'modified_at',
         'manage_buttons',
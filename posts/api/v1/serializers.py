@@ -1,22 +1,49 @@
+from django.conf import settings
 from django_restql.mixins import DynamicFieldsMixin
 from rest_framework import serializers
+from posts.bulk import LIKE, TOGGLE, UNLIKE
 from posts.models import Post, Like, Comment, Attachment
-from users.api.v1.serializers import UserDetailsSerializer
+from users.api.v1.serializers import CompactUserDetailsSerializer, UserDetailsSerializer
+from utilities import compact
+from utilities.uploads import variant_urls
 
 
 class AttachmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Attachment
         fields = [
             'id',
             'post',
             'file',
+            'variants',
         ]
 
+    def get_variants(self, attachment):
+        return variant_urls(
+            attachment.file, attachment.content_hash, attachment.has_variants, self.context.get('request')
+        )
+
+
+class PostListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated and 'is_liked' in self.child.fields:
+            self.context['liked_post_ids'] = set(
+                Like.objects.filter(
+                    user_id=request.user.id,
+                    post_id__in=[post.pk for post in posts],
+                ).values_list('post_id', flat=True)
+            )
+        return super(PostListSerializer, self).to_representation(posts)
+
 
 class PostSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     is_liked = serializers.SerializerMethodField()
-    post_attachments = AttachmentSerializer('post_attachments', many=True, fields=['id', 'file', ], read_only=True)
+    post_attachments = AttachmentSerializer('post_attachments', many=True, fields=['id', 'file', 'variants', ],
+                                            read_only=True)
 
     class Meta:
         model = Post
@@ -34,6 +61,7 @@ class PostSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         extra_kwargs = {
             'user': {'read_only': True, },
         }
+        list_serializer_class = PostListSerializer
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -42,16 +70,20 @@ class PostSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     def to_representation(self, post):
         data = super(PostSerializer, self).to_representation(post)
-        data['user'] = UserDetailsSerializer(
-            post.user,
-            context=self.context
-        ).data
+        if 'user' in data:
+            data['user'] = UserDetailsSerializer(
+                post.user,
+                context=self.context
+            ).data
         return data
 
     def get_is_liked(self, post):
+        liked_post_ids = self.context.get('liked_post_ids')
+        if liked_post_ids is not None:
+            return post.pk in liked_post_ids
         request = self.context.get('request')
-        if request:
-            return Like.objects.filter(post=post, user=request.user).exists()
+        if request and request.user.is_authenticated:
+            return Like.objects.filter(post=post, user_id=request.user.id).exists()
         return False
 
 
@@ -81,3 +113,85 @@ class CommentSerializer(serializers.ModelSerializer):
             context=self.context
         ).data
         return data
+
+
+class CompactAttachmentSerializer(compact.CompactSerializer):
+    model = Attachment
+    fields = {
+        'id': compact.Field(),
+        'post': compact.Field(),
+        'file': compact.FileField(),
+        'variants': compact.VariantsField('file', 'content_hash', 'has_variants'),
+    }
+
+
+class IsLikedField(compact.Field):
+    """`PostSerializer.is_liked`, the likes of the requesting user on the page are read by one query."""
+
+    def compile(self, serializer, name, query):
+        request = serializer.context.get('request')
+        column = serializer.prefix + 'id'
+        liked_post_ids = set()
+
+        def prepare(rows):
+            liked_post_ids.clear()
+            if request and request.user.is_authenticated and rows:
+                liked_post_ids.update(Like.objects.filter(
+                    user_id=request.user.id,
+                    post_id__in=[row[column] for row in rows],
+                ).values_list('post_id', flat=True))
+
+        serializer.preparations.append(prepare)
+        return [column], lambda row: row[column] in liked_post_ids
+
+
+class CompactPostSerializer(compact.CompactSerializer):
+    model = Post
+    fields = {
+        'id': compact.Field(),
+        'user': compact.NestedField(CompactUserDetailsSerializer),
+        'text': compact.Field(),
+        'is_draft': compact.Field(),
+        'time_since': compact.TimeSinceField(),
+        'is_liked': IsLikedField(),
+        'likes_count': compact.Field(),
+        'comments_count': compact.Field(),
+        'post_attachments': compact.ManyField(
+            CompactAttachmentSerializer, 'post_attachments', fields=['id', 'file', 'variants', ]
+        ),
+    }
+
+
+class CompactCommentSerializer(compact.CompactSerializer):
+    model = Comment
+    # CommentSerializer has no restql fields, its nested users do
+    restql = False
+    fields = {
+        'id': compact.Field(),
+        'user': compact.NestedField(CompactUserDetailsSerializer),
+        'post': compact.Field(),
+        'text': compact.Field(),
+        'time_since': compact.TimeSinceField(),
+    }
+
+
+class LikeActionSerializer(serializers.Serializer):
+    post = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=[TOGGLE, LIKE, UNLIKE, ], default=TOGGLE)
+
+
+class BulkLikeSerializer(serializers.Serializer):
+    actions = serializers.ListField(
+        child=LikeActionSerializer(), min_length=1, max_length=settings.BULK_MAX_ITEMS
+    )
+
+
+class CommentItemSerializer(serializers.Serializer):
+    post = serializers.IntegerField()
+    text = serializers.CharField()
+
+
+class BulkCommentSerializer(serializers.Serializer):
+    comments = serializers.ListField(
+        child=serializers.DictField(), min_length=1, max_length=settings.BULK_MAX_ITEMS
+    )
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from posts.api.v1.views import PostResource, CommentResource, AttachmentResource
+from posts.api.v1.views import PostResource, CommentResource, AttachmentResource, FeedResource
 
 app_name = "posts"
 
@@ -10,6 +10,7 @@ router = DefaultRouter()
 router.register(r'posts', PostResource, basename='posts')
 router.register(r'attachments', AttachmentResource, basename='attachments')
 router.register(r'comments', CommentResource, basename='comments')
+router.register(r'feed', FeedResource, basename='feed')
 
 urlpatterns = (
     path("", include(router.urls)),
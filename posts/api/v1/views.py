@@ -1,33 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils.translation import gettext_lazy as _
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
+from rest_framework.mixins import ListModelMixin
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
-from posts.api.v1.serializers import PostSerializer, CommentSerializer, AttachmentSerializer
-from posts.models import Post, Comment, Attachment
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
+from posts.bulk import apply_like_actions, create_comments
+from posts.exports import comments_export, posts_export
+from posts.feed import feed_queryset
+from posts.api.v1.serializers import (
+    PostSerializer, CommentSerializer, AttachmentSerializer, BulkLikeSerializer, BulkCommentSerializer,
+    CommentItemSerializer, CompactCommentSerializer, CompactPostSerializer
+)
+from posts.models import Post, Comment, Attachment, Like
+from utilities.caching import CachedResponseMixin
+from utilities.paginations import CustomKeysetPagination
+from utilities.search import FullTextSearchFilter
 from utilities.viewsets import (
-    PostFilterClass, post_field_expand, comment_field_expand,
-    attachment_field_expand
+    CompactListMixin, ExportMixin, PostFilterClass, QueryOptimizationMixin, post_field_expand, comment_field_expand,
+    attachment_field_expand, feed_field_expand, export_field_expand
 )
 
+User = get_user_model()
+
+user_details_columns = [
+    'user',
+    'user__id',
+    'user__username',
+    'user__email',
+    'user__personal_image',
+    'user__personal_image_hash',
+    'user__personal_image_has_variants',
+    'user__role',
+]
+
 
 @method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=post_field_expand))
-class PostResource(ModelViewSet):
+@method_decorator(name='export', decorator=swagger_auto_schema(manual_parameters=export_field_expand))
+class PostResource(CachedResponseMixin, CompactListMixin, ExportMixin, QueryOptimizationMixin, ModelViewSet):
     http_method_names = ['post', 'get', 'patch', 'put', 'head']
     serializer_class = PostSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    compact_serializer_class = CompactPostSerializer
+    exporter = posts_export
+    cache_dependencies = [Post, Like, Comment, Attachment, User, ]
+    cache_per_user_fields = ['is_liked', ]
+    cache_per_user_params = ['is_liked', ]
+    select_related = {
+        'user': 'user',
+    }
+    prefetch_related = {
+        'post_attachments': Prefetch(
+            'post_attachments', queryset=Attachment.objects.only('id', 'post', 'file', 'content_hash', 'has_variants')
+        ),
+    }
+    only_fields = {
+        'user': user_details_columns,
+        'time_since': ['created_at', ],
+        'is_liked': [],
+        'post_attachments': [],
+    }
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_fields = [
         'user',
+        'user__username',
         'is_draft',
         'is_liked',
     ]
     filter_class = PostFilterClass
     search_fields = [
-        'user__username',
         'text',
     ]
     ordering_fields = [
@@ -40,7 +85,7 @@ class PostResource(ModelViewSet):
             queryset = Post.objects.filter(user_id=self.request.user.id, is_draft=False)
         else:
             queryset = Post.objects.filter(is_draft=False)
-        return queryset.order_by('-created_at')
+        return self.get_eager_queryset(queryset.order_by('-created_at'))
 
     @action(detail=True, methods=['post', ], url_path='like-dislike', url_name='like_dislike')
     def like_unlike(self, request, pk):
@@ -59,18 +104,80 @@ class PostResource(ModelViewSet):
             status=status.HTTP_200_OK,
         )
 
+    @action(detail=True, methods=['post', ], url_path='like', url_name='like')
+    def like(self, request, pk):
+        post = self.get_object()
+        post.like(self.request.user.id)
+        return Response(
+            {
+                "details": _("post liked"),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=True, methods=['post', ], url_path='unlike', url_name='unlike')
+    def unlike(self, request, pk):
+        post = self.get_object()
+        post.unlike(self.request.user.id)
+        return Response(
+            {
+                "details": _("post disliked"),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @swagger_auto_schema(request_body=BulkLikeSerializer)
+    @action(detail=False, methods=['post', ], url_path='bulk-like-dislike', url_name='bulk_like_dislike')
+    def bulk_like_unlike(self, request):
+        serializer = BulkLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_like_actions(
+            self.request.user.id,
+            [(item['post'], item['action']) for item in serializer.validated_data['actions']],
+        )
+        return Response(
+            {
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=feed_field_expand))
+class FeedResource(CompactListMixin, QueryOptimizationMixin, ListModelMixin, GenericViewSet):
+    serializer_class = PostSerializer
+    compact_serializer_class = CompactPostSerializer
+    pagination_class = CustomKeysetPagination
+    select_related = PostResource.select_related
+    prefetch_related = PostResource.prefetch_related
+    only_fields = PostResource.only_fields
+
+    def get_queryset(self):
+        return self.get_eager_queryset(feed_queryset(self.request.user.id))
+
 
 @method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=comment_field_expand))
-class CommentResource(ModelViewSet):
+@method_decorator(name='export', decorator=swagger_auto_schema(manual_parameters=export_field_expand))
+class CommentResource(CachedResponseMixin, CompactListMixin, ExportMixin, QueryOptimizationMixin, ModelViewSet):
     http_method_names = ['post', 'get', 'patch', 'put', 'head']
     serializer_class = CommentSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    compact_serializer_class = CompactCommentSerializer
+    exporter = comments_export
+    cache_dependencies = [Comment, User, ]
+    select_related = {
+        'user': 'user',
+    }
+    only_fields = {
+        'user': user_details_columns,
+        'time_since': ['created_at', ],
+    }
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_fields = [
         'user',
+        'user__username',
         'post',
     ]
     search_fields = [
-        'user__username',
         'text',
     ]
     ordering_fields = [
@@ -83,13 +190,40 @@ class CommentResource(ModelViewSet):
             queryset = Comment.objects.filter(user_id=self.request.user.id)
         else:
             queryset = Comment.objects.all()
-        return queryset.order_by('-created_at')
+        return self.get_eager_queryset(queryset.order_by('-created_at'))
+
+    @swagger_auto_schema(request_body=BulkCommentSerializer)
+    @action(detail=False, methods=['post', ], url_path='bulk', url_name='bulk_create')
+    def bulk_create_comments(self, request):
+        serializer = BulkCommentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [CommentItemSerializer(data=item) for item in serializer.validated_data['comments']]
+        created = iter(create_comments(
+            self.request.user, [item.validated_data for item in items if item.is_valid()]
+        ))
+
+        results = []
+        for item in items:
+            if item.errors:
+                results.append({'status': status.HTTP_400_BAD_REQUEST, 'errors': item.errors})
+                continue
+            result = next(created)
+            if 'comment' in result:
+                result['data'] = CommentSerializer(result.pop('comment'), context=self.get_serializer_context()).data
+            results.append(result)
+        return Response(
+            {
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
+        )
 
 
 @method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=attachment_field_expand))
-class AttachmentResource(ModelViewSet):
+class AttachmentResource(CachedResponseMixin, ModelViewSet):
     http_method_names = ['get', 'post']
     serializer_class = AttachmentSerializer
+    cache_dependencies = [Attachment, ]
     filter_backends = [DjangoFilterBackend, ]
     filterset_fields = [
         'post',
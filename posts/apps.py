@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        import posts.signals  # noqa: F401
+        from posts.models import Attachment, Comment, Like, Post, TimelineEntry
+        from utilities.caching import track_writes
+        track_writes(Post, Comment, Like, Attachment, TimelineEntry)
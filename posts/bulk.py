@@ -0,0 +1,92 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+
+from posts.models import Comment, Like, Post
+from utilities.caching import bump_generation
+from utilities.models import bulk_delete, bulk_insert
+
+LIKE = 'like'
+UNLIKE = 'unlike'
+TOGGLE = 'toggle'
+
+
+def apply_like_actions(user_id, actions):
+    """
+    Replays `(post_id, action)` like actions of one user in order and writes only their net
+    effect: one DELETE, one INSERT and one UPDATE per distinct counter delta.
+    Returns the per-action results, the like state after each action.
+    """
+    post_ids = {post_id for post_id, action in actions}
+    published = set(Post.objects.filter(pk__in=post_ids, is_draft=False).values_list('pk', flat=True))
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                results, changed = write_like_actions(user_id, actions, published)
+            break
+        except IntegrityError:
+            # a concurrent like of the same post committed first, the retry reads it back
+            if attempt:
+                raise
+    if changed:
+        bump_generation(Like)
+        bump_generation(Post)
+    return results
+
+
+def write_like_actions(user_id, actions, published):
+    """Writes the net effect of the like actions, returns their results and whether any like changed."""
+    current = dict(
+        Like.objects.select_for_update().filter(
+            user_id=user_id, post_id__in=published
+        ).values_list('post_id', 'pk')
+    )
+    liked = dict.fromkeys(current, True)
+    results = []
+    for post_id, action in actions:
+        if post_id not in published:
+            results.append({'post': post_id, 'status': status.HTTP_404_NOT_FOUND, 'details': _("Not found.")})
+            continue
+        liked[post_id] = not liked.get(post_id, False) if action == TOGGLE else action == LIKE
+        results.append({'post': post_id, 'status': status.HTTP_200_OK, 'liked': liked[post_id]})
+
+    removed = {post_id: pk for post_id, pk in current.items() if not liked[post_id]}
+    added = [post_id for post_id, state in liked.items() if state and post_id not in current]
+    # the counters and the cache generations only follow the writes that changed rows
+    if removed and not bulk_delete(Like, removed.values()):
+        removed = {}
+    Like.objects.bulk_create([Like(user_id=user_id, post_id=post_id) for post_id in added])
+
+    # the bulk writes skip the like signals, the counters are adjusted here
+    deltas = dict.fromkeys(removed, -1)
+    deltas.update(dict.fromkeys(added, 1))
+    Post.adjust_counters_in_bulk(likes=deltas)
+    return results, bool(removed or added)
+
+
+def create_comments(user, items):
+    """
+    Creates the `{'post': id, 'text': str}` comments of one user with a single INSERT.
+    Returns the per-item results, the created comment or the reason it wasn't created.
+    """
+    existing = set(Post.objects.filter(pk__in={item['post'] for item in items}).values_list('pk', flat=True))
+    results = []
+    comments = []
+    for item in items:
+        if item['post'] in existing:
+            comment = Comment(user=user, post_id=item['post'], text=item['text'])
+            comments.append(comment)
+            results.append({'status': status.HTTP_201_CREATED, 'comment': comment})
+        else:
+            results.append({'status': status.HTTP_400_BAD_REQUEST, 'errors': {'post': [_("Invalid post.")]}})
+
+    if comments:
+        with transaction.atomic():
+            bulk_insert(Comment, comments)
+            Post.adjust_counters_in_bulk(comments=Counter(comment.post_id for comment in comments))
+        bump_generation(Comment)
+        bump_generation(Post)
+    return results
@@ -0,0 +1,26 @@
+from django.db.models import Prefetch
+
+from posts.api.v1.serializers import CommentSerializer, PostSerializer
+from posts.models import Attachment, Comment, Post
+from utilities.export import Export
+
+posts_export = Export(
+    'posts',
+    Post.objects.filter(is_draft=False),
+    PostSerializer,
+    select_related=['user', ],
+    prefetch_related=[
+        Prefetch(
+            'post_attachments',
+            queryset=Attachment.objects.only('id', 'post', 'file', 'content_hash', 'has_variants'),
+        ),
+    ],
+    exclude=['is_liked', ],
+)
+
+comments_export = Export(
+    'comments',
+    Comment.objects.all(),
+    CommentSerializer,
+    select_related=['user', ],
+)
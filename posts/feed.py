@@ -0,0 +1,77 @@
+"""
+Friends feed: posts are fanned out on write into the `TimelineEntry` table of every
+accepted friend of their author, authors with more than `FEED_FANOUT_MAX_FRIENDS`
+friends are skipped on write and merged into their friends feeds on read.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from posts.models import Post, TimelineEntry
+from users.graph import friends_counts, friends_of
+from utilities.caching import bump_generation
+
+
+def is_fanned_out_on_read(friends_count):
+    return friends_count > settings.FEED_FANOUT_MAX_FRIENDS
+
+
+def fan_out_post(post):
+    """Pushes a published post into the timelines of its author and the author friends."""
+    if post.is_draft:
+        return
+    receivers = {post.user_id}
+    friends = friends_of(post.user_id)
+    if not is_fanned_out_on_read(len(friends)):
+        receivers |= friends
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post.pk) for user_id in receivers],
+        ignore_conflicts=True,
+    )
+    # bulk_create skips the model signals
+    bump_generation(TimelineEntry)
+
+
+def connect_timelines(user_id, friend_id):
+    connect_timelines_many([(user_id, friend_id)])
+
+
+def connect_timelines_many(pairs):
+    """Backfills the latest posts of new friends into each other's timeline."""
+    counts = friends_counts({user_id for pair in pairs for user_id in pair})
+    latest = {}
+    entries = []
+    for pair in pairs:
+        for owner_id, author_id in (pair, pair[::-1]):
+            if is_fanned_out_on_read(counts[author_id]):
+                continue
+            if author_id not in latest:
+                latest[author_id] = list(Post.objects.filter(user_id=author_id, is_draft=False).order_by(
+                    '-created_at', '-id'
+                ).values_list('pk', flat=True)[:settings.FEED_BACKFILL_SIZE])
+            entries.extend(TimelineEntry(user_id=owner_id, post_id=post_id) for post_id in latest[author_id])
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    bump_generation(TimelineEntry)
+
+
+def disconnect_timelines(user_id, friend_id):
+    disconnect_timelines_many([(user_id, friend_id)])
+
+
+def disconnect_timelines_many(pairs):
+    condition = Q()
+    for user_id, friend_id in pairs:
+        condition |= Q(user_id=user_id, post__user_id=friend_id) | Q(user_id=friend_id, post__user_id=user_id)
+    if condition:
+        TimelineEntry.objects.filter(condition).delete()
+
+
+def feed_queryset(user_id):
+    """Published posts of the user and their friends, newest first."""
+    friends = friends_of(user_id)
+    read_authors = [
+        author_id for author_id, count in friends_counts(friends).items() if is_fanned_out_on_read(count)
+    ]
+    condition = Q(pk__in=TimelineEntry.objects.filter(user_id=user_id).values('post_id'))
+    if read_authors:
+        condition |= Q(user_id__in=read_authors)
+    return Post.objects.filter(condition, is_draft=False).order_by('-created_at', '-id')
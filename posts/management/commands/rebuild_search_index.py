@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Comment, Post
+from utilities.search import get_search_backend
+
+SEARCH_INDEXES = [
+    (Post, ['text', ]),
+    (Comment, ['text', ]),
+]
+
+
+class Command(BaseCommand):
+    help = "Create the full-text search indexes of posts and comments if missing and rebuild them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild.")
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(connections[options['database']])
+        for model, fields in SEARCH_INDEXES:
+            backend.install(model._meta.db_table, fields)
+            backend.rebuild(model._meta.db_table, fields)
+            self.stdout.write(f"rebuilt {model._meta.label} search index.")
+        self.stdout.write(self.style.SUCCESS("done."))
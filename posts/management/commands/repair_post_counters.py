@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.tasks import repair_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored likes/comments counters of posts and repair the drifted ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of posts checked per batch.",
+        )
+        parser.add_argument(
+            '--enqueue', action='store_true',
+            help="Queue one background job per batch instead of repairing them here.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        checked = repaired = queued = 0
+        while True:
+            ids = list(
+                Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            if options['enqueue']:
+                repair_counters.enqueue(ids[0], ids[-1], dedup_key=f'repair-counters:{ids[0]}-{ids[-1]}')
+                queued += 1
+            else:
+                repaired += repair_counters(ids[0], ids[-1])
+            checked += len(ids)
+            last_id = ids[-1]
+
+        if options['enqueue']:
+            self.stdout.write(self.style.SUCCESS(f"queued {queued} jobs checking {checked} posts."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"checked {checked} posts, repaired {repaired}."))
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.24 on 2026-10-18 13:48
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    Comment = apps.get_model('posts', 'Comment')
+    Post.objects.update(
+        likes_count=Coalesce(Subquery(
+            Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ), 0),
+        comments_count=Coalesce(Subquery(
+            Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_auto_20210628_0502'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comments count'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='likes count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.24 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at', '-id'], name='posts_comme_created_278bcf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='posts_post_created_a7e5d4_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.24 on 2026-10-18 13:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    FriendShip = apps.get_model('users', 'FriendShip')
+
+    def latest_post_ids(author_id):
+        return Post.objects.filter(user_id=author_id, is_draft=False).order_by(
+            '-created_at', '-id'
+        ).values_list('pk', flat=True)[:settings.FEED_BACKFILL_SIZE]
+
+    pairs = set(FriendShip.objects.filter(status='accepted').values_list('sender_id', 'receiver_id'))
+    pairs |= {(receiver_id, sender_id) for sender_id, receiver_id in pairs}
+    pairs |= {(user_id, user_id) for user_id in Post.objects.values_list('user_id', flat=True).distinct()}
+    for owner_id, author_id in pairs:
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=owner_id, post_id=post_id) for post_id in latest_post_ids(author_id)],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0005_keyset_indexes'),
+        ('users', '0002_auto_20210628_0502'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'timeline entry',
+                'verbose_name_plural': 'timeline entries',
+                'unique_together': {('user', 'post')},
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.24 on 2026-10-18 13:55
+
+from django.db import migrations
+
+from utilities.search import get_search_backend
+
+SEARCH_INDEXES = [
+    ('posts_post', ['text', ]),
+    ('posts_comment', ['text', ]),
+]
+
+
+def install_search_indexes(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection)
+    for table, fields in SEARCH_INDEXES:
+        backend.install(table, fields)
+        backend.rebuild(table, fields)
+
+
+def uninstall_search_indexes(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection)
+    for table, fields in SEARCH_INDEXES:
+        backend.uninstall(table, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='posts_post_text_74d9a2_idx',
+        ),
+        migrations.RunPython(install_search_indexes, uninstall_search_indexes),
+    ]
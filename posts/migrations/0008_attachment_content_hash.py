@@ -0,0 +1,29 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import utilities.uploads
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='has_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='has variants'),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=utilities.uploads.ContentAddressedFileField(hash_field='content_hash', upload_to='attachments/', variants_field='has_variants', verbose_name='file'),
+        ),
+    ]
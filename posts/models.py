@@ -1,11 +1,19 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.utils.timesince import timesince
 from django.utils.translation import gettext_lazy as _
 from preventia_social.settings import AUTH_USER_MODEL
-from utilities.models import BaseModel
+from utilities.caching import bump_generation
+from utilities.models import BaseModel, delete_where
+from utilities.uploads import ContentAddressedFileField
 
 
 class Post(BaseModel):
+    COUNTER_FIELDS = ('likes_count', 'comments_count', )
+
     user = models.ForeignKey(
         AUTH_USER_MODEL,
         on_delete=models.PROTECT,
@@ -19,13 +27,23 @@ class Post(BaseModel):
         default=False,
         verbose_name=_("is draft")
     )
+    likes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("likes count")
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("comments count")
+    )
 
     class Meta:
         verbose_name = _("post")
         verbose_name_plural = _("posts")
         ordering = ['-id']
         indexes = [
-            models.Index(fields=['text', ]),
+            models.Index(fields=['-created_at', '-id', ]),
         ]
 
     def __str__(self):
@@ -35,22 +53,117 @@ class Post(BaseModel):
     def time_since(self):
         return timesince(self.created_at)
 
-    @property
-    def likes_count(self):
-        return self.favorite_posts.count()
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # the counters are only written by UPDATEs shifting them (`adjust_counters`), saving the
+        # in-memory values of a loaded post would undo the likes and comments made since
+        if update_fields is None and not force_insert and not self._state.adding:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super(Post, self).save(force_insert, force_update, using, update_fields)
 
-    @property
-    def comments_count(self):
-        return self.post_comments.count()
+    @classmethod
+    def adjust_counters(cls, post_id, likes=0, comments=0):
+        """
+        Shift the stored counters of one post by the given deltas in a single UPDATE,
+        never letting them go below zero.
+        """
+        values = {}
+        if likes:
+            values['likes_count'] = Greatest(F('likes_count') + likes, 0)
+        if comments:
+            values['comments_count'] = Greatest(F('comments_count') + comments, 0)
+        if values:
+            cls.objects.filter(pk=post_id).update(**values)
+
+    @classmethod
+    def adjust_counters_in_bulk(cls, likes=None, comments=None):
+        """
+        Shift the stored counters of many posts, `likes` and `comments` map post ids to deltas,
+        posts sharing the same deltas are updated by the same UPDATE.
+        """
+        likes, comments = likes or {}, comments or {}
+        groups = defaultdict(list)
+        for post_id in set(likes) | set(comments):
+            groups[(likes.get(post_id, 0), comments.get(post_id, 0))].append(post_id)
+        for (likes_delta, comments_delta), post_ids in groups.items():
+            values = {}
+            if likes_delta:
+                values['likes_count'] = Greatest(F('likes_count') + likes_delta, 0)
+            if comments_delta:
+                values['comments_count'] = Greatest(F('comments_count') + comments_delta, 0)
+            if values:
+                cls.objects.filter(pk__in=post_ids).update(**values)
+
+    @classmethod
+    def repair_counters(cls, queryset=None):
+        """
+        Recompute the stored counters of the given posts from the like/comment tables,
+        only rewriting the rows that drifted, returns the number of repaired posts.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+        real_likes = Coalesce(Subquery(
+            Like.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ), 0)
+        real_comments = Coalesce(Subquery(
+            Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ), 0)
+        drifted = list(
+            queryset.annotate(
+                real_likes=real_likes,
+                real_comments=real_comments,
+            ).exclude(
+                likes_count=F('real_likes'),
+                comments_count=F('real_comments'),
+            ).values_list('pk', flat=True)
+        )
+        if drifted:
+            cls.objects.filter(pk__in=drifted).update(
+                likes_count=real_likes,
+                comments_count=real_comments,
+            )
+        return len(drifted)
 
     def like_dislike(self, user_id):
-        likes = Like.objects.filter(post=self, user_id=user_id)
-        if likes.exists():
-            likes.delete()
+        """
+        Toggles the like of a user: a DELETE, and only when it found nothing an INSERT whose unique
+        conflict means a concurrent toggle liked the post first, which this one then undoes.
+        """
+        if self.unlike(user_id):
             return False
-        else:
-            Like.objects.create(post=self, user_id=user_id)
+        if self.like(user_id):
             return True
+        self.unlike(user_id)
+        return False
+
+    def like(self, user_id):
+        """Adds the like of a user if it is missing, returns whether it was added."""
+        try:
+            with transaction.atomic():
+                Like.objects.create(post=self, user_id=user_id)
+        except IntegrityError:
+            return False
+        return True
+
+    def unlike(self, user_id):
+        """
+        Removes the like of a user if it exists, returns whether it was removed. Only the DELETE
+        that removed the row shifts the counter, so concurrent unlikes can't both decrement it.
+        """
+        with transaction.atomic():
+            deleted = delete_where(Like, post=self.pk, user=user_id)
+            if deleted:
+                Post.adjust_counters(self.pk, likes=-deleted)
+                bump_generation(Like)
+        return bool(deleted)
 
 
 class Attachment(BaseModel):
@@ -60,9 +173,24 @@ class Attachment(BaseModel):
         related_name="post_attachments",
         verbose_name=_("post")
     )
-    file = models.FileField(
+    file = ContentAddressedFileField(
+        upload_to='attachments/',
+        hash_field='content_hash',
+        variants_field='has_variants',
         verbose_name=_("file")
     )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name=_("content hash")
+    )
+    has_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name=_("has variants")
+    )
 
     class Meta:
         verbose_name = _("attachment")
@@ -91,6 +219,9 @@ class Comment(BaseModel):
     class Meta:
         verbose_name = _("post comment")
         verbose_name_plural = _("post comments")
+        indexes = [
+            models.Index(fields=['-created_at', '-id', ]),
+        ]
 
     def __str__(self):
         return f'{self.text}'
@@ -122,3 +253,26 @@ class Like(BaseModel):
 
     def __str__(self):
         return f'{self.post}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name=_("user")
+    )
+    post = models.ForeignKey(
+        "posts.Post",
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name=_("post")
+    )
+
+    class Meta:
+        verbose_name = _("timeline entry")
+        verbose_name_plural = _("timeline entries")
+        unique_together = ('user', 'post',)
+
+    def __str__(self):
+        return f'{self.post}'
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from posts.models import Comment, Like, Post, TimelineEntry
+from posts.tasks import connect_timelines, disconnect_timelines, fan_out_post
+from users.models import FriendShip
+from users.signals import friendships_accepted, friendships_removed
+
+
+@receiver(post_save, sender=Like)
+def increase_likes_count(sender, instance, created, **kwargs):
+    if created:
+        Post.adjust_counters(instance.post_id, likes=1)
+
+
+@receiver(post_delete, sender=Like)
+def decrease_likes_count(sender, instance, **kwargs):
+    Post.adjust_counters(instance.post_id, likes=-1)
+
+
+@receiver(post_save, sender=Comment)
+def increase_comments_count(sender, instance, created, **kwargs):
+    if created:
+        Post.adjust_counters(instance.post_id, comments=1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrease_comments_count(sender, instance, **kwargs):
+    Post.adjust_counters(instance.post_id, comments=-1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_published_post(sender, instance, created, **kwargs):
+    if instance.is_draft:
+        return
+    if created or not TimelineEntry.objects.filter(user_id=instance.user_id, post=instance).exists():
+        fan_out_post.enqueue(instance.pk, dedup_key=f'fan-out:{instance.pk}')
+
+
+@receiver(post_save, sender=FriendShip)
+def connect_friends_timelines(sender, instance, **kwargs):
+    if instance.status == FriendShip.ACCEPTED:
+        connect_timelines.enqueue([(instance.sender_id, instance.receiver_id)])
+
+
+@receiver(post_delete, sender=FriendShip)
+def disconnect_friends_timelines(sender, instance, **kwargs):
+    if instance.status == FriendShip.ACCEPTED:
+        disconnect_timelines.enqueue([(instance.sender_id, instance.receiver_id)])
+
+
+@receiver(friendships_accepted, sender=FriendShip)
+def connect_accepted_friends_timelines(sender, pairs, **kwargs):
+    connect_timelines.enqueue(pairs)
+
+
+@receiver(friendships_removed, sender=FriendShip)
+def disconnect_removed_friends_timelines(sender, pairs, **kwargs):
+    disconnect_timelines.enqueue(pairs)
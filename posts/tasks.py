@@ -0,0 +1,32 @@
+from jobs.tasks import task
+from posts import feed
+from posts.models import Post
+from users.graph import are_friends
+
+
+@task(queue='feed')
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only('pk', 'user_id', 'is_draft').first()
+    if post is not None:
+        feed.fan_out_post(post)
+
+
+@task(queue='feed')
+def connect_timelines(pairs):
+    """Backfills the timelines of the given pairs, skipping the ones no longer friends when the job runs."""
+    feed.connect_timelines_many(
+        [(user_id, friend_id) for user_id, friend_id in pairs if are_friends(user_id, friend_id)]
+    )
+
+
+@task(queue='feed')
+def disconnect_timelines(pairs):
+    """Empties the timelines of the given pairs, skipping the ones friends again when the job runs."""
+    feed.disconnect_timelines_many(
+        [(user_id, friend_id) for user_id, friend_id in pairs if not are_friends(user_id, friend_id)]
+    )
+
+
+@task(queue='maintenance')
+def repair_counters(first_id, last_id):
+    return Post.repair_counters(Post.objects.filter(pk__gte=first_id, pk__lte=last_id))
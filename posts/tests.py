@@ -1,11 +1,35 @@
+import hashlib
 import json
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.crypto import get_random_string
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APITestCase
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from jobs.worker import Worker
+from posts.api.v1.views import PostResource
+from posts.models import Attachment, Comment, Like, Post, TimelineEntry
+from users.api.v1.serializers import UserDetailsSerializer, UserSerializer
+from users.models import FriendShip
+from utilities.authentication import token_cache
+from utilities.caching import cache_stats, get_generations
+from utilities.uploads import build_field_variants, variant_name
 
-from users.api.v1.serializers import UserSerializer
+User = get_user_model()
 
 
 class FrequentlyUsedObjects:
@@ -27,6 +51,7 @@ class CustomAPITestCase(APITestCase):
 
     def _pre_setup(self):
         super(CustomAPITestCase, self)._pre_setup()
+        cache.clear()
         self.frequent_objects = self.frequent_class()
 
 
@@ -114,3 +139,503 @@ class CommentTest(CustomAPITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+
+class PostCountersTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.post = Post.objects.create(user=self.token.user, text="post content")
+
+    def test_counters_follow_likes_and_comments(self):
+        self.assertTrue(self.post.like_dislike(self.token.user_id))
+        Comment.objects.create(user=self.token.user, post=self.post, text="first")
+        comment = Comment.objects.create(user=self.token.user, post=self.post, text="second")
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 2))
+
+        self.assertFalse(self.post.like_dislike(self.token.user_id))
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (0, 1))
+
+    def test_repair_post_counters_command(self):
+        Like.objects.create(user=self.token.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, comments_count=3)
+
+        call_command('repair_post_counters', batch_size=1, stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 0))
+
+    def test_updates_keep_the_concurrent_counter_changes(self):
+        get_object = PostResource.get_object
+
+        def get_object_then_like(view):
+            post = get_object(view)
+            # a like and a comment land between the read and the save of the update
+            Post.adjust_counters(post.pk, likes=1, comments=1)
+            return post
+
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+        with mock.patch.object(PostResource, 'get_object', get_object_then_like):
+            response = self.client.patch(
+                path=reverse('posts:posts-detail', kwargs={'pk': self.post.pk}), data={'text': "edited"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.text, self.post.likes_count, self.post.comments_count), ("edited", 1, 1))
+
+
+class PostIsLikedTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.posts = [Post.objects.create(user=self.token.user, text=f"post {i}") for i in range(4)]
+        self.posts[1].like_dislike(self.token.user_id)
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+
+    def test_list_resolves_is_liked_per_page(self):
+        response = self.client.get(path=reverse('posts:posts-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        liked = {item['id']: item['is_liked'] for item in response.json()['results']}
+        self.assertEqual(liked, {post.pk: post.pk == self.posts[1].pk for post in self.posts})
+
+    def test_retrieve_is_liked(self):
+        response = self.client.get(path=reverse('posts:posts-detail', kwargs={'pk': self.posts[1].pk}))
+        self.assertTrue(response.json()['is_liked'])
+
+
+class PostQueryPlanningTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        for i in range(5):
+            Post.objects.create(user=self.token.user, text=f"post {i}")
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+
+    def list_queries(self, **params):
+        cache.clear()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path=reverse('posts:posts-list'), data=params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_list_queries_do_not_scale_with_page(self):
+        _, few = self.list_queries(page_size=1)
+        _, many = self.list_queries(page_size=5)
+        self.assertEqual(len(few), len(many))
+
+    def test_unrequested_relations_are_not_loaded(self):
+        response, queries = self.list_queries(query='{id, text}')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'text'})
+        self.assertFalse([sql for sql in queries if 'posts_attachment' in sql])
+        self.assertFalse([sql for sql in queries if 'posts_post' in sql and 'users_user' in sql])
+
+    def test_comment_users_are_joined_whatever_the_query(self):
+        post = Post.objects.first()
+        for i in range(5):
+            Comment.objects.create(post=post, user=self.token.user, text=f"comment {i}")
+        counts = []
+        for params in [{}, {'query': '{id}'}, {'query': '{n: id, username}'}]:
+            cache.clear()
+            token_cache.clear()
+            # CommentSerializer ignores the query, it renders every comment user
+            with self.settings(COMPACT_SERIALIZERS=False), CaptureQueriesContext(connection) as context:
+                response = self.client.get(path=reverse('posts:comments-list'), data=params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts, [counts[0]] * 3)
+
+
+class KeysetPaginationTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.posts = [Post.objects.create(user=self.token.user, text=f"post {i}") for i in range(5)]
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        response = self.client.get(path=reverse('posts:posts-list'), data={'pagination': 'cursor', 'page_size': 2})
+        first = response.json()
+        self.assertIsNone(first['count'])
+        self.assertIsNone(first['previous'])
+
+        seen = [item['id'] for item in first['results']]
+        next_link = first['next']
+        while next_link:
+            page = self.client.get(next_link).json()
+            seen.extend(item['id'] for item in page['results'])
+            previous_link, next_link = page['previous'], page['next']
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+        previous = self.client.get(previous_link).json()
+        self.assertEqual([item['id'] for item in previous['results']], seen[2:4])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(path=reverse('posts:posts-list'), data={'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_mode_refuses_ordering_and_search(self):
+        path = reverse('posts:posts-list')
+        response = self.client.get(path=path, data={'pagination': 'cursor', 'ordering': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', response.json())
+        self.assertEqual(self.client.get(path=path, data={'pagination': 'cursor', 'search': 'post'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        # the default cursor mode falls back to pages, in the requested order
+        with self.settings(PAGINATION_MODE='cursor'):
+            data = self.client.get(path=path, data={'ordering': 'created_at', 'page_size': 2}).json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([item['id'] for item in data['results']], [post.pk for post in self.posts[:2]])
+
+
+class PaginationCountTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        for i in range(3):
+            Post.objects.create(user=self.token.user, text=f"post {i}")
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+
+    def test_count_is_cached_until_a_write(self):
+        self.assertEqual(self.client.get(path=reverse('posts:posts-list')).json()['count'], 3)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(path=reverse('posts:posts-list'))
+        self.assertFalse([query for query in context.captured_queries if 'COUNT' in query['sql']])
+
+        Post.objects.create(user=self.token.user, text="post 3")
+        self.assertEqual(self.client.get(path=reverse('posts:posts-list')).json()['count'], 4)
+
+    def test_page_size_is_clamped(self):
+        with self.settings(PAGINATION_MAX_PAGE_SIZE=2):
+            response = self.client.get(path=reverse('posts:posts-list'), data={'page_size': 100000})
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class FeedTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.friend = self.frequent_objects.create_user().user
+        self.stranger = self.frequent_objects.create_user().user
+        self.old_post = Post.objects.create(user=self.friend, text="before the friendship")
+        FriendShip.objects.create(sender=self.token.user, receiver=self.friend).accept()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+
+    def feed_ids(self):
+        # the fan-out and backfill jobs run before the feed is read
+        Worker(processes=0).run(burst=True)
+        response = self.client.get(path=reverse('posts:feed-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_feed_contains_friends_posts(self):
+        own = Post.objects.create(user=self.token.user, text="own")
+        friend = Post.objects.create(user=self.friend, text="friend")
+        Post.objects.create(user=self.stranger, text="stranger")
+        Post.objects.create(user=self.friend, text="draft", is_draft=True)
+        self.assertEqual(self.feed_ids(), [friend.pk, own.pk, self.old_post.pk])
+
+        FriendShip.objects.get(sender=self.token.user, receiver=self.friend).delete()
+        self.assertEqual(self.feed_ids(), [own.pk])
+
+    def test_feed_reads_popular_authors_posts(self):
+        with self.settings(FEED_FANOUT_MAX_FRIENDS=0):
+            post = Post.objects.create(user=self.friend, text="popular")
+            self.assertFalse(TimelineEntry.objects.filter(user=self.token.user, post=post).exists())
+            self.assertEqual(self.feed_ids()[0], post.pk)
+
+
+class SearchTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+        self.weak = Post.objects.create(user=self.token.user, text="a garden with a long story about nothing much")
+        self.strong = Post.objects.create(user=self.token.user, text="garden garden")
+        self.other = Post.objects.create(user=self.token.user, text="unrelated")
+
+    def search_ids(self, term):
+        response = self.client.get(path=reverse('posts:posts-list'), data={'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_search_is_ranked_and_synced(self):
+        self.assertEqual(self.search_ids("garden"), [self.strong.pk, self.weak.pk])
+        self.assertEqual(self.search_ids("gard"), [self.strong.pk, self.weak.pk])
+
+        self.other.text = "a garden"
+        self.other.save()
+        self.strong.delete()
+        self.assertEqual(set(self.search_ids("garden")), {self.weak.pk, self.other.pk})
+        self.assertEqual(self.search_ids('"!'), [])
+
+    def test_rebuild_search_index_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search_ids("unrelated"), [self.other.pk])
+
+
+class ResponseCacheTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+        self.post = Post.objects.create(user=self.token.user, text="cached")
+        self.path = reverse('posts:posts-detail', kwargs={'pk': self.post.pk})
+
+    def test_retrieve_is_cached_until_a_write(self):
+        first = self.client.get(path=self.path)
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(path=self.path)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(context.captured_queries), 0)
+
+        Like.objects.create(user=self.token.user, post=self.post)
+        third = self.client.get(path=self.path)
+        self.assertTrue(third.json()['is_liked'])
+        self.assertEqual(third.json()['likes_count'], 1)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_is_liked_is_cached_per_user(self):
+        Like.objects.create(user=self.token.user, post=self.post)
+        self.assertTrue(self.client.get(path=self.path).json()['is_liked'])
+
+        other = self.frequent_objects.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {other}')
+        self.assertFalse(self.client.get(path=self.path).json()['is_liked'])
+
+    def test_if_none_match_answers_not_modified(self):
+        etag = self.client.get(path=self.path)['ETag']
+        before = cache_stats.snapshot()
+        response = self.client.get(path=self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cache_stats.snapshot()['not_modified'], before.get('not_modified', 0) + 1)
+
+        self.post.text = "changed"
+        self.post.save()
+        self.assertEqual(cache_stats.snapshot()['invalidations'], before['invalidations'] + 1)
+        self.assertEqual(self.client.get(path=self.path, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+
+class BulkActionsTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+        self.posts = [Post.objects.create(user=self.token.user, text=f"post {index}") for index in range(10)]
+
+    def test_bulk_like_dislike_replays_in_order(self):
+        first, second = self.posts[:2]
+        Like.objects.create(user=self.token.user, post=second)
+        response = self.client.post(path=reverse('posts:posts-bulk_like_dislike'), data={'actions': [
+            {'post': first.pk},
+            {'post': first.pk},
+            {'post': first.pk, 'action': 'like'},
+            {'post': second.pk, 'action': 'unlike'},
+            {'post': 0},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['status'], item.get('liked')) for item in response.json()['results']],
+            [(200, True), (200, False), (200, True), (200, False), (404, None)]
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.likes_count, second.likes_count), (1, 0))
+        self.assertEqual(list(Like.objects.values_list('post_id', flat=True)), [first.pk])
+        self.assertEqual(Post.repair_counters(), 0)
+
+    def test_bulk_like_dislike_queries_do_not_scale(self):
+        actions = [{'post': post.pk} for post in self.posts] * 10
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                path=reverse('posts:posts-bulk_like_dislike'), data={'actions': actions}, format='json'
+            )
+        self.assertEqual(len(response.json()['results']), 100)
+        self.assertLessEqual(len(context.captured_queries), 10)
+
+    def test_bulk_actions_without_net_change_keep_the_caches(self):
+        tables = [Like._meta.db_table, Post._meta.db_table]
+        generations = get_generations(tables)
+        response = self.client.post(path=reverse('posts:posts-bulk_like_dislike'), data={'actions': [
+            {'post': self.posts[0].pk, 'action': 'like'}, {'post': self.posts[0].pk, 'action': 'unlike'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_generations(tables), generations)
+
+    def test_bulk_comments(self):
+        first, second = self.posts[:2]
+        response = self.client.post(path=reverse('posts:comments-bulk_create'), data={'comments': [
+            {'post': first.pk, 'text': "one"},
+            {'post': first.pk, 'text': ""},
+            {'post': second.pk, 'text': "two"},
+            {'post': 0, 'text': "three"},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([item['status'] for item in results], [201, 400, 201, 400])
+        self.assertEqual(
+            [results[0]['data']['id'], results[2]['data']['id']],
+            list(Comment.objects.order_by('id').values_list('id', flat=True))
+        )
+        self.assertEqual(results[2]['data']['text'], "two")
+        first.refresh_from_db()
+        self.assertEqual(first.comments_count, 1)
+        self.assertEqual(Post.repair_counters(), 0)
+
+
+class ConcurrentLikeTest(APITransactionTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        token_cache.clear()
+        self.tokens = [FrequentlyUsedObjects().create_user() for _ in range(6)]
+        self.post = Post.objects.create(user=self.tokens[0].user, text="popular")
+
+    def hammer(self, token, path, times, statuses):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f' Token {token}')
+        try:
+            for _ in range(times):
+                statuses.append(client.post(path=path).status_code)
+        finally:
+            connection.close()
+
+    def test_toggles_from_many_threads(self):
+        toggle = reverse('posts:posts-like_dislike', kwargs={'pk': self.post.pk})
+        like = reverse('posts:posts-like', kwargs={'pk': self.post.pk})
+        statuses = []
+        jobs = [(token, toggle, 5) for token in self.tokens[:4]]
+        # double taps: the same user toggling from 3 clients at once, 12 toggles in total
+        jobs += [(self.tokens[4], toggle, 4) for _ in range(3)]
+        jobs += [(self.tokens[5], like, 5) for _ in range(3)]
+        threads = [threading.Thread(target=self.hammer, args=job + (statuses,)) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [status.HTTP_200_OK] * 47)
+        likers = set(Like.objects.filter(post=self.post).values_list('user_id', flat=True))
+        self.assertEqual(likers, {token.user_id for token in self.tokens[:4]} | {self.tokens[5].user_id})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 5)
+
+    def test_explicit_like_and_unlike_are_idempotent(self):
+        self.assertTrue(self.post.like(self.tokens[1].user_id))
+        self.assertFalse(self.post.like(self.tokens[1].user_id))
+        self.assertTrue(self.post.unlike(self.tokens[1].user_id))
+        self.assertFalse(self.post.unlike(self.tokens[1].user_id))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+
+class ExportTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.admin = User.objects.create_superuser(username='admin_export', email='admin@example.com', password='x')
+        self.client.force_authenticate(self.admin)
+        self.posts = [Post.objects.create(user=self.token.user, text=f"post {index}") for index in range(5)]
+        Post.objects.create(user=self.token.user, text="draft", is_draft=True)
+        Comment.objects.create(user=self.token.user, post=self.posts[0], text="first")
+
+    def stream(self, name, **params):
+        response = self.client.get(path=reverse(name), data=params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export_in_chunks(self):
+        with self.settings(EXPORT_CHUNK_SIZE=2), CaptureQueriesContext(connection) as context:
+            lines = self.stream('posts:posts-export').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [post.pk for post in self.posts])
+        self.assertEqual(rows[0]['user']['username'], self.token.user.username)
+        self.assertNotIn('is_liked', rows[0])
+        # 3 chunks and the empty one, each chunk loading its attachments in one query
+        self.assertEqual(len(context.captured_queries), 7)
+
+    def test_csv_export_and_filters(self):
+        lines = self.stream('posts:comments-export', export_format='csv', post=self.posts[0].pk).splitlines()
+        self.assertEqual(lines[0], 'id,user.id,user.username,user.email,user.personal_image,user.role.key,'
+                                   'user.role.value,post,text,time_since')
+        self.assertEqual(len(lines), 2)
+
+    def test_invalid_query_is_rejected_before_streaming(self):
+        response = self.client.get(path=reverse('posts:posts-export'), data={'query': '{id, bogus}'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.streaming)
+        lines = self.stream('posts:posts-export', query='{id}').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'id': post.pk} for post in self.posts])
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(self.token.user)
+        self.assertEqual(self.client.get(path=reverse('users:users-export')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_command(self):
+        output = StringIO()
+        call_command('export_data', 'users', stdout=output)
+        self.assertEqual([json.loads(line)['username'] for line in output.getvalue().splitlines()],
+                         [self.token.user.username])
+
+
+class UploadPipelineTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.media_root = tempfile.mkdtemp()
+        media = self.settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS=['thumbnail:20x20', 'medium:50x50'])
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        self.token = self.frequent_objects.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+        self.post = Post.objects.create(user=self.token.user, text="post")
+
+    @staticmethod
+    def image(name='image.png', size=(120, 80)):
+        output = BytesIO()
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(output, 'PNG')
+        output.seek(0)
+        output.name = name
+        return output
+
+    def upload(self, file):
+        response = self.client.post(
+            path=reverse('posts:attachments-list'), data={'post': self.post.pk, 'file': file}, format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Attachment.objects.get(pk=response.data['id'])
+
+    def test_identical_uploads_share_one_stored_file(self):
+        first = self.upload(self.image('first.png'))
+        second = self.upload(self.image('second.PNG'))
+        digest = hashlib.sha256(self.image().getvalue()).hexdigest()
+        self.assertEqual(first.content_hash, digest)
+        self.assertEqual(first.file.name, f'attachments/{digest[:2]}/{digest}.png')
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'attachments', digest[:2])), [f'{digest}.png'])
+
+    def test_variants_are_exposed_once_built(self):
+        attachment = self.upload(self.image())
+        url = reverse('posts:attachments-detail', kwargs={'pk': attachment.pk})
+        self.assertEqual(self.client.get(path=url).data['variants'], {})
+
+        self.assertEqual(Worker(processes=0, queues=['images']).run(burst=True)['done'], 1)
+        variants = self.client.get(path=url).data['variants']
+        self.assertEqual(set(variants), {'thumbnail', 'medium'})
+        self.assertTrue(variants['thumbnail'].startswith('http://testserver/media/variants/'))
+        with Image.open(os.path.join(self.media_root, variant_name(attachment.content_hash, 'thumbnail'))) as image:
+            self.assertEqual(image.size, (20, 13))
+
+        response = self.client.get(path=reverse('posts:posts-detail', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.data['post_attachments'][0]['variants'], variants)
+
+    def test_files_which_arent_images_get_no_variants(self):
+        document = BytesIO(b'%PDF-1.4 not an image')
+        document.name = 'document.pdf'
+        attachment = self.upload(document)
+        self.assertFalse(build_field_variants('posts.Attachment', attachment.pk, 'file'))
+        attachment.refresh_from_db()
+        self.assertFalse(attachment.has_variants)
+
+    def test_personal_image_variants(self):
+        user = self.token.user
+        user.personal_image = SimpleUploadedFile('me.png', self.image(size=(40, 40)).getvalue())
+        user.save()
+        self.assertTrue(build_field_variants('users.User', user.pk, 'personal_image'))
+        user.refresh_from_db()
+        data = UserDetailsSerializer(user).data
+        self.assertEqual(data['personal_image'], f'/media/user-images/{user.personal_image_hash[:2]}/'
+                                                 f'{user.personal_image_hash}.png')
+        self.assertEqual(set(data['personal_image_variants']), {'thumbnail', 'medium'})
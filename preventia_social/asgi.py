@@ -0,0 +1,14 @@
+"""
+ASGI config for preventia_social project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+serve it with any ASGI server, e.g. ``uvicorn preventia_social.asgi:application``.
+"""
+
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'preventia_social.settings')
+
+from utilities.asgi import get_asgi_application  # noqa: E402
+
+application = get_asgi_application()
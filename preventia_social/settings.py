@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -45,11 +45,15 @@ INSTALLED_APPS = [
     'drf_yasg',
 
     # project apps
+    'utilities',
+    'jobs',
     'users',
     'posts',
 ]
 
 MIDDLEWARE = [
+    'utilities.middleware.RequestMetricsMiddleware',
+    'utilities.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Translation MiddleWare
@@ -62,6 +66,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'preventia_social.urls'
 
+# The tests run against a shared cache of their own.
+TEST_RUNNER = 'utilities.runner.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -79,16 +86,129 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'preventia_social.wsgi.application'
+ASGI_APPLICATION = 'preventia_social.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+# DB_ENGINE is "sqlite" (DB_NAME is the file) or "postgresql" (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT).
+
+DB_ENGINE = config("DB_ENGINE", default="sqlite", cast=str)
+# Seconds a connection is reused across requests, 0 closes it at the end of every request.
+DB_CONN_MAX_AGE = config("DB_CONN_MAX_AGE", default=60, cast=int)
+# Ping the reused connections when a request starts and replace the ones the database dropped.
+DB_HEALTH_CHECKS = config("DB_HEALTH_CHECKS", default=True, cast=bool)
+# PostgreSQL only: a positive DB_POOL_MAX_SIZE borrows the connections from a per-process pool, threads
+# wait up to DB_POOL_TIMEOUT seconds for a connection when all of them are borrowed (by the request,
+# ASGI handler and job threads of the process), the borrowed connections are pinged with DB_HEALTH_CHECKS.
+# DB_DISABLE_SERVER_SIDE_CURSORS is needed behind a transaction pooler (pgbouncer).
+DB_POOL_MIN_SIZE = config("DB_POOL_MIN_SIZE", default=1, cast=int)
+DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", default=0, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=10, cast=float)
+DB_DISABLE_SERVER_SIDE_CURSORS = config("DB_DISABLE_SERVER_SIDE_CURSORS", default=False, cast=bool)
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'utilities.backends.postgresql_pool' if DB_POOL_MAX_SIZE else 'django.db.backends.postgresql',
+            'NAME': config("DB_NAME", default="preventia_social", cast=str),
+            'USER': config("DB_USER", default="", cast=str),
+            'PASSWORD': config("DB_PASSWORD", default="", cast=str),
+            'HOST': config("DB_HOST", default="", cast=str),
+            'PORT': config("DB_PORT", default="", cast=str),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'DISABLE_SERVER_SIDE_CURSORS': DB_DISABLE_SERVER_SIDE_CURSORS,
+            'OPTIONS': {
+                'POOL_MIN_SIZE': DB_POOL_MIN_SIZE,
+                'POOL_MAX_SIZE': DB_POOL_MAX_SIZE,
+                'POOL_TIMEOUT': DB_POOL_TIMEOUT,
+            } if DB_POOL_MAX_SIZE else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config("DB_NAME", default=os.path.join(BASE_DIR, 'db.sqlite3'), cast=str),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'TEST': {
+                # a file rather than the shared in-memory database, whose table locks
+                # fail concurrent writers at once instead of waiting for them
+                'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+            },
+        }
+    }
 
-DATABASES = {
+# Read replicas: DB_REPLICAS lists the replica SQLite files, or the `host[:port]` of the PostgreSQL
+# replicas. Safe-method requests read from one of them, unless the same client wrote in the last
+# DB_REPLICA_STICKY_SECONDS, which must stay above the replication lag.
+DB_REPLICAS = config("DB_REPLICAS", default="", cast=Csv())
+DB_REPLICA_STICKY_SECONDS = config("DB_REPLICA_STICKY_SECONDS", default=5, cast=int)
+# Seconds the cached values computed from a replica live at most, they may miss the writes the replica
+# hadn't received yet (0 never caches them).
+DB_REPLICA_CACHE_TIMEOUT = config("DB_REPLICA_CACHE_TIMEOUT", default=DB_REPLICA_STICKY_SECONDS, cast=int)
+# Models always read from the primary: the token of a client who just signed up or logged in.
+DB_PRIMARY_READ_MODELS = ['authtoken.token', ]
+
+DB_REPLICA_ALIASES = []
+for index, replica in enumerate(DB_REPLICAS, 1):
+    if DB_ENGINE == 'postgresql':
+        host, separator, port = replica.partition(':')
+        replica_settings = dict(DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'])
+    else:
+        replica_settings = dict(DATABASES['default'], NAME=replica)
+    # the tests read the replicas from the test database
+    replica_settings['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica_{index}'] = replica_settings
+    DB_REPLICA_ALIASES.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['utilities.routers.PrimaryReplicaRouter']
+
+# PRAGMAs run on every new SQLite connection: WAL lets the readers run alongside the writer,
+# synchronous=NORMAL only syncs the WAL at checkpoints (still durable against application crashes),
+# mmap_size (bytes) maps the file instead of reading it and busy_timeout (ms) makes a writer wait
+# for the write lock instead of failing at once.
+SQLITE_PRAGMAS = {
+    'journal_mode': config("SQLITE_JOURNAL_MODE", default="wal", cast=str),
+    'synchronous': config("SQLITE_SYNCHRONOUS", default="normal", cast=str),
+    'mmap_size': config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    'busy_timeout': config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),
+}
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/ref/settings/#caches
+# The default cache is a per-process LRU in front of the shared cache, the file based default
+# stands in for memcached (CACHE_BACKEND / CACHE_LOCATION) in development and tests. It isn't atomic
+# (`incr` is a get and a set, concurrent generation bumps can collapse into one), so CACHE_REQUIRE_ATOMIC,
+# on outside DEBUG, makes the `utilities.E001` check refuse it. Its files live in the project directory,
+# the test runner (TEST_RUNNER) and the benchmark override them with their own (`throwaway_cache_settings`)
+# so clearing them doesn't wipe the cache of a dev server.
+CACHE_REQUIRE_ATOMIC = config("CACHE_REQUIRE_ATOMIC", default=not DEBUG, cast=bool)
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'BACKEND': 'utilities.cache_backends.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': config("CACHE_LOCAL_MAX_ENTRIES", default=1000, cast=int),
+            'LOCAL_TIMEOUT': config("CACHE_LOCAL_TIMEOUT", default=5, cast=int),
+            # values changed in place, they are always read from the shared cache
+            'LOCAL_EXCLUDE_PREFIXES': ['generation:', 'lock:', 'replica_pin:', ],
+        },
+    },
+    'shared': {
+        'BACKEND': config("CACHE_BACKEND", default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config("CACHE_LOCATION", default=os.path.join(BASE_DIR, '.cache', 'shared')),
+    },
 }
+if CACHES['shared']['BACKEND'].endswith('.FileBasedCache'):
+    # the default 300 entries would cull the responses, generations and locks together
+    CACHES['shared']['OPTIONS'] = {'MAX_ENTRIES': config("CACHE_MAX_ENTRIES", default=100000, cast=int)}
+# Probabilistic early expiration factor of the cached computations (0 disables it, above 1 favors earlier).
+CACHE_EARLY_EXPIRY_BETA = config("CACHE_EARLY_EXPIRY_BETA", default=1.0, cast=float)
+# Seconds a cached computation is locked for the caller computing it (single flight).
+CACHE_LOCK_TIMEOUT = config("CACHE_LOCK_TIMEOUT", default=10, cast=int)
+# Seconds a missing result (e.g. a 404) stays cached.
+CACHE_NEGATIVE_TIMEOUT = config("CACHE_NEGATIVE_TIMEOUT", default=10, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -108,9 +228,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Preferred password hasher, hashes made by the other ones are upgraded to it on login.
+PASSWORD_HASHER = config("PASSWORD_HASHER", default="utilities.hashers.PBKDF2PasswordHasher", cast=str)
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher for hasher in [
+        'utilities.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    ] if hasher != PASSWORD_HASHER
+]
+# PBKDF2 work factor, 0 keeps Django's default.
+PASSWORD_HASH_ITERATIONS = config("PASSWORD_HASH_ITERATIONS", default=0, cast=int)
+
+# Login password checks run on a bounded pool: concurrent hashes, logins allowed to wait and seconds they wait.
+LOGIN_HASH_WORKERS = config("LOGIN_HASH_WORKERS", default=os.cpu_count() or 1, cast=int)
+LOGIN_HASH_QUEUE_SIZE = config("LOGIN_HASH_QUEUE_SIZE", default=4 * (os.cpu_count() or 1), cast=int)
+LOGIN_HASH_TIMEOUT = config("LOGIN_HASH_TIMEOUT", default=10, cast=int)
+
 # make default user class users.User
 AUTH_USER_MODEL = 'users.User'
 
+# Password checks of the logins (API and admin) hash on the bounded pool above.
+AUTHENTICATION_BACKENDS = ['users.login.PooledPasswordBackend']
+
 LOGIN_URL = '/admin/login/'
 
 # Internationalization
@@ -148,14 +289,100 @@ REST_FRAMEWORK = {
         'utilities.permissions.IsActiveUser',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'utilities.authentication.CachedTokenAuthentication',
     ],
     'DATETIME_FORMAT': "%Y-%m-%d %H:%M:%S",
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
+# Basic authentication hashes the password on every request, keep it for the browsable API / swagger only.
+API_BASIC_AUTHENTICATION = config("API_BASIC_AUTHENTICATION", default=True, cast=bool)
+if API_BASIC_AUTHENTICATION:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].insert(0, 'rest_framework.authentication.BasicAuthentication')
+
+# In-process cache of authenticated tokens: maximum number of tokens and seconds a token stays cached.
+# Saving or deleting a user or a token invalidates its tokens in every process through the shared cache,
+# changes skipping the model signals (queryset updates, raw SQL) reach the cached tokens after the TTL at most.
+AUTH_TOKEN_CACHE_SIZE = config("AUTH_TOKEN_CACHE_SIZE", default=10000, cast=int)
+AUTH_TOKEN_CACHE_TTL = config("AUTH_TOKEN_CACHE_TTL", default=30, cast=int)
+# Seconds a process trusts the revocation generation of a cached token before re-reading it from the shared cache,
+# how late the revocations of other processes arrive at most (0 re-reads it on every request).
+AUTH_TOKEN_GENERATION_TTL = config("AUTH_TOKEN_GENERATION_TTL", default=1, cast=float)
+
+# Pagination mode of the list endpoints: "page" (page number) or "cursor" (keyset on created_at, id),
+# clients can opt into the cursor mode per request with `?pagination=cursor`.
+PAGINATION_MODE = config("PAGINATION_MODE", default="page", cast=str)
+# Upper bound of the `page_size` query parameter.
+PAGINATION_MAX_PAGE_SIZE = config("PAGINATION_MAX_PAGE_SIZE", default=100, cast=int)
+# Seconds a page-number total stays cached, any write to the counted tables invalidates it sooner.
+PAGINATION_COUNT_CACHE_TIMEOUT = config("PAGINATION_COUNT_CACHE_TIMEOUT", default=60, cast=int)
+# Above this many rows the database planner estimate replaces the exact count (0 disables it).
+PAGINATION_ESTIMATED_COUNT_THRESHOLD = config("PAGINATION_ESTIMATED_COUNT_THRESHOLD", default=0, cast=int)
+
+# Response cache of the list/retrieve endpoints, any write to the models a response depends on invalidates it sooner.
+RESPONSE_CACHE_ENABLED = config("RESPONSE_CACHE_ENABLED", default=True, cast=bool)
+RESPONSE_CACHE_TIMEOUT = config("RESPONSE_CACHE_TIMEOUT", default=60, cast=int)
+# Render the posts, comments, users and friendships lists from `values()` rows (utilities.compact).
+COMPACT_SERIALIZERS = config("COMPACT_SERIALIZERS", default=True, cast=bool)
+# Seconds the friend lists and friend counts stay cached, any friendship change invalidates them sooner.
+FRIEND_GRAPH_CACHE_TIMEOUT = config("FRIEND_GRAPH_CACHE_TIMEOUT", default=300, cast=int)
+
+# Dotted path of the full-text search backend, empty picks the one matching the database vendor.
+SEARCH_BACKEND = config("SEARCH_BACKEND", default="", cast=str)
+
+# Friends feed: authors with more friends than this are merged into feeds on read instead of fanned out on write.
+FEED_FANOUT_MAX_FRIENDS = config("FEED_FANOUT_MAX_FRIENDS", default=1000, cast=int)
+# Number of latest posts copied into each other's timeline when a friendship is accepted.
+FEED_BACKFILL_SIZE = config("FEED_BACKFILL_SIZE", default=50, cast=int)
+
+# Upper bound of the actions / items of one bulk request.
+BULK_MAX_ITEMS = config("BULK_MAX_ITEMS", default=500, cast=int)
+# Rows read, serialized and streamed per keyset chunk by the exports.
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=1000, cast=int)
+
+# Uploads are streamed to a temporary file and hashed chunk by chunk, never held in memory.
+FILE_UPLOAD_HANDLERS = ['utilities.uploads.HashingUploadHandler', ]
+# Resized variants of the uploaded images as `name:WIDTHxHEIGHT` (fitted inside, aspect ratio kept),
+# and their JPEG quality, they are built by background jobs of the "images" queue.
+IMAGE_VARIANTS = config("IMAGE_VARIANTS", default="thumbnail:150x150,medium:800x800", cast=Csv())
+IMAGE_VARIANT_QUALITY = config("IMAGE_VARIANT_QUALITY", default=85, cast=int)
+
+# Background jobs (`run_jobs` workers): JOBS_EAGER runs them inline instead of queueing them,
+# JOB_QUEUES is the concurrency limit of every queue (across all workers) as `queue:limit`.
+JOBS_EAGER = config("JOBS_EAGER", default=False, cast=bool)
+JOB_QUEUES = config("JOB_QUEUES", default="default:4,feed:2,images:2,maintenance:1", cast=Csv())
+JOB_WORKER_PROCESSES = config("JOB_WORKER_PROCESSES", default=4, cast=int)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", default=1.0, cast=float)
+# Attempts of a failing job, retried after JOB_RETRY_BACKOFF * 2^(attempt - 1) seconds at most JOB_RETRY_BACKOFF_MAX,
+# and seconds a job may run before it counts as failed.
+JOB_MAX_ATTEMPTS = config("JOB_MAX_ATTEMPTS", default=5, cast=int)
+JOB_RETRY_BACKOFF = config("JOB_RETRY_BACKOFF", default=2, cast=float)
+JOB_RETRY_BACKOFF_MAX = config("JOB_RETRY_BACKOFF_MAX", default=600, cast=float)
+JOB_TIMEOUT = config("JOB_TIMEOUT", default=300, cast=int)
+# Seconds of finished jobs the wait / run time metrics are computed on.
+JOB_METRICS_WINDOW = config("JOB_METRICS_WINDOW", default=3600, cast=int)
+# Seconds the done jobs are kept before the workers delete them (the failed ones are kept for inspection),
+# and seconds between two of these prunes.
+JOB_RETENTION = config("JOB_RETENTION", default=7 * 24 * 3600, cast=int)
+JOB_PRUNE_INTERVAL = config("JOB_PRUNE_INTERVAL", default=600, cast=int)
+
+# ASGI (preventia_social/asgi.py): threads running the Django handler, threads reserved for the hot read
+# endpoints listed in ASGI_READ_VIEWS, and request body bytes kept in memory before spooling to disk.
+ASGI_THREADS = config("ASGI_THREADS", default=8, cast=int)
+ASGI_READ_THREADS = config("ASGI_READ_THREADS", default=8, cast=int)
+ASGI_READ_VIEWS = config(
+    "ASGI_READ_VIEWS",
+    default="posts:posts-list,posts:posts-detail,posts:comments-list,posts:feed-list,users:friendships-list",
+    cast=Csv(),
+)
+ASGI_BODY_MEMORY_SIZE = config("ASGI_BODY_MEMORY_SIZE", default=1024 * 1024, cast=int)
+
+# Request metrics: send the per-request timings back in a `Server-Timing` header (to every client,
+# for debugging only), and log SQL templates executed more than this many times in one request as N+1 patterns.
+REQUEST_METRICS_SERVER_TIMING = config("REQUEST_METRICS_SERVER_TIMING", default=False, cast=bool)
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = config("REQUEST_METRICS_N_PLUS_ONE_THRESHOLD", default=10, cast=int)
+
 # Swagger
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
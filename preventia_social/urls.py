@@ -23,6 +23,9 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework.permissions import AllowAny
 
+from jobs.views import JobMetricsAPIView
+from utilities.views import CacheMetricsAPIView, RequestMetricsAPIView
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Preventia Social API",
@@ -36,6 +39,9 @@ urlpatterns = [
     path('', admin.site.urls),
     path('api/v1/', include('users.api.v1.urls')),
     path('api/v1/', include('posts.api.v1.urls')),
+    path('api/v1/metrics/requests/', RequestMetricsAPIView.as_view(), name='request-metrics'),
+    path('api/v1/metrics/cache/', CacheMetricsAPIView.as_view(), name='cache-metrics'),
+    path('api/v1/metrics/jobs/', JobMetricsAPIView.as_view(), name='job-metrics'),
 
     # swagger
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
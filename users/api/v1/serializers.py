@@ -1,12 +1,17 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import SetPasswordForm
+from django.contrib.auth.hashers import make_password
 from django.utils.translation import gettext_lazy as _
 from django_restql.mixins import DynamicFieldsMixin
 from rest_framework import serializers
-from rest_framework.authtoken.models import Token
 from rest_framework.validators import UniqueTogetherValidator
 
+from users.bulk import ACCEPT, REJECT
+from users.login import get_token_key
 from users.models import FriendShip
+from utilities import compact
+from utilities.uploads import variant_urls
 
 User = get_user_model()
 
@@ -40,15 +45,13 @@ class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
+        # hashed before the INSERT so that the user is written once
+        validated_data.pop('new_password1')
+        validated_data['password'] = make_password(validated_data.pop('new_password2'))
         try:
-            validated_data.pop('new_password1')
-            new_password2 = validated_data.pop('new_password2')
-            user = super(UserSerializer, self).create(validated_data)
+            return super(UserSerializer, self).create(validated_data)
         except Exception as e:
             raise serializers.ValidationError({"error": [e]})
-        user.set_password(new_password2)
-        user.save()
-        return user
 
     def update(self, instance, validated_data):
         validated_data.pop('new_password1', None)
@@ -58,6 +61,8 @@ class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
 
 class UserDetailsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    personal_image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = User
         fields = [
@@ -65,6 +70,7 @@ class UserDetailsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
             'username',
             'email',
             'personal_image',
+            'personal_image_variants',
             'role',
         ]
 
@@ -76,6 +82,30 @@ class UserDetailsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         }
         return data
 
+    def get_personal_image_variants(self, user):
+        return variant_urls(
+            user.personal_image, user.personal_image_hash, user.personal_image_has_variants,
+            self.context.get('request')
+        )
+
+
+class CompactUserDetailsSerializer(compact.CompactSerializer):
+    model = User
+    fields = {
+        'id': compact.Field(),
+        'username': compact.Field(),
+        'email': compact.Field(),
+        'personal_image': compact.FileField(),
+        'personal_image_variants': compact.VariantsField(
+            'personal_image', 'personal_image_hash', 'personal_image_has_variants'
+        ),
+        'role': compact.DisplayField(),
+    }
+
+    def get_selected_fields(self, selected):
+        # UserDetailsSerializer sets the role whatever the query selects
+        return selected if 'role' in selected else selected + ['role']
+
 
 class UserLoginDataSerializer(serializers.ModelSerializer):
     token = serializers.SerializerMethodField()
@@ -91,8 +121,7 @@ class UserLoginDataSerializer(serializers.ModelSerializer):
         ]
 
     def get_token(self, user):
-        token, created = Token.objects.get_or_create(user=user)
-        return token.key
+        return get_token_key(user)
 
 
 class LoginSerializer(serializers.Serializer):
@@ -119,12 +148,35 @@ class FriendShipSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     def to_representation(self, friend_ship):
         data = super(FriendShipSerializer, self).to_representation(friend_ship)
-        data['sender'] = UserDetailsSerializer(
-            friend_ship.sender,
-            context=self.context
-        ).data
-        data['receiver'] = UserDetailsSerializer(
-            friend_ship.receiver,
-            context=self.context
-        ).data
+        if 'sender' in data:
+            data['sender'] = UserDetailsSerializer(
+                friend_ship.sender,
+                context=self.context
+            ).data
+        if 'receiver' in data:
+            data['receiver'] = UserDetailsSerializer(
+                friend_ship.receiver,
+                context=self.context
+            ).data
         return data
+
+
+class CompactFriendShipSerializer(compact.CompactSerializer):
+    model = FriendShip
+    fields = {
+        'id': compact.Field(),
+        'sender': compact.NestedField(CompactUserDetailsSerializer),
+        'receiver': compact.NestedField(CompactUserDetailsSerializer),
+        'status': compact.Field(),
+    }
+
+
+class FriendShipActionSerializer(serializers.Serializer):
+    friendship = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=[ACCEPT, REJECT, ])
+
+
+class BulkFriendShipSerializer(serializers.Serializer):
+    actions = serializers.ListField(
+        child=FriendShipActionSerializer(), min_length=1, max_length=settings.BULK_MAX_ITEMS
+    )
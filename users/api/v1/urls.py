@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from users.api.v1.views import UserResource, LoginAPIView, FriendShipResource
+from users.api.v1.views import UserResource, LoginAPIView, LoginMetricsAPIView, FriendShipResource
 
 app_name = 'users'
 
@@ -12,4 +12,5 @@ router.register(r'friendships', FriendShipResource, basename='friendships')
 urlpatterns = [
     path('', include(router.urls)),
     path('login/', LoginAPIView.as_view(), name='login'),
+    path('login/metrics/', LoginMetricsAPIView.as_view(), name='login_metrics'),
 ]
@@ -1,4 +1,5 @@
-from django.contrib.auth import get_user_model, authenticate
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,22 +9,35 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.generics import GenericAPIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
-from users.models import FriendShip
+from users.bulk import apply_friendship_actions
+from users.exports import users_export
+from users.login import issue_token, password_verifier, verify_credentials
+from users.models import FriendEdge, FriendShip
+from utilities.caching import CachedResponseMixin
 from utilities.exceptions import Http400
-from utilities.viewsets import UserFilterClass, user_field_expand, friendship_field_expand
+from utilities.viewsets import (
+    CompactListMixin, ExportMixin, QueryOptimizationMixin, UserFilterClass, user_field_expand, friendship_field_expand,
+    export_field_expand
+)
 from users.api.v1.serializers import (
     UserDetailsSerializer, UserSerializer, UserLoginDataSerializer, LoginSerializer,
-    FriendShipSerializer
+    FriendShipSerializer, BulkFriendShipSerializer, CompactFriendShipSerializer, CompactUserDetailsSerializer
 )
 
 User = get_user_model()
 
 
 @method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=user_field_expand))
-class UserResource(ModelViewSet):
+@method_decorator(name='export', decorator=swagger_auto_schema(manual_parameters=export_field_expand))
+class UserResource(CachedResponseMixin, CompactListMixin, ExportMixin, ModelViewSet):
     http_method_names = ['post', 'get', 'patch', 'put', 'head']
+    compact_serializer_class = CompactUserDetailsSerializer
+    exporter = users_export
+    cache_dependencies = [User, FriendShip, FriendEdge, ]
+    cache_per_user_params = ['friends', ]
     queryset = User.objects.filter(is_superuser=False, is_staff=False, is_active=True).order_by('-created_at')
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = [
@@ -56,7 +70,9 @@ class UserResource(ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = self.perform_create(serializer)
+        with transaction.atomic():
+            user = self.perform_create(serializer)
+            issue_token(user)
         headers = self.get_success_headers(serializer.data)
         data = UserLoginDataSerializer(user, many=False, context={'request': request}).data
         return Response(data, status=status.HTTP_201_CREATED, headers=headers)
@@ -71,7 +87,7 @@ class LoginAPIView(GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
-        user = authenticate(request=request, username=data['username'], password=data['password'])
+        user = verify_credentials(request=request, username=data['username'], password=data['password'])
         if user:
             return Response({
                 'data': UserLoginDataSerializer(user, context={'request': request}).data
@@ -80,9 +96,21 @@ class LoginAPIView(GenericAPIView):
         raise AuthenticationFailed()
 
 
+class LoginMetricsAPIView(GenericAPIView):
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        return Response(password_verifier.metrics(), status=status.HTTP_200_OK)
+
+
 @method_decorator(name='list', decorator=swagger_auto_schema(manual_parameters=friendship_field_expand))
-class FriendShipResource(ModelViewSet):
+class FriendShipResource(CompactListMixin, QueryOptimizationMixin, ModelViewSet):
     serializer_class = FriendShipSerializer
+    compact_serializer_class = CompactFriendShipSerializer
+    select_related = {
+        'sender': 'sender',
+        'receiver': 'receiver',
+    }
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = [
         'status',
@@ -92,7 +120,9 @@ class FriendShipResource(ModelViewSet):
     ]
 
     def get_queryset(self):
-        return FriendShip.objects.filter(receiver_id=self.request.user.id).order_by('-created_at')
+        return self.get_eager_queryset(
+            FriendShip.objects.filter(receiver_id=self.request.user.id).order_by('-created_at')
+        )
 
     def create(self, request, *args, **kwargs):
         request.POST._mutable = True
@@ -126,3 +156,14 @@ class FriendShipResource(ModelViewSet):
                 {"details": _("friendship request has been rejected"), }, status=status.HTTP_200_OK,
             )
         raise Http400(_("not available"))
+
+    @swagger_auto_schema(request_body=BulkFriendShipSerializer)
+    @action(methods=['post', ], detail=False, url_path='bulk', url_name='bulk_actions', )
+    def bulk_actions(self, request):
+        serializer = BulkFriendShipSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_friendship_actions(
+            self.request.user.id,
+            [(item['friendship'], item['action']) for item in serializer.validated_data['actions']],
+        )
+        return Response({"results": results, }, status=status.HTTP_200_OK)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = 'users'
+
+    def ready(self):
+        import users.signals  # noqa: F401
+        from users.models import FriendEdge, FriendShip, User
+        from utilities.caching import track_writes
+        track_writes(User, FriendShip, FriendEdge)
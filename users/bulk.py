@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+
+from users import graph
+from users.models import FriendShip
+from users.signals import friendships_accepted, friendships_removed
+from utilities.caching import bump_generation
+from utilities.models import bulk_delete
+
+ACCEPT = 'accept'
+REJECT = 'reject'
+
+
+def apply_friendship_actions(user_id, actions):
+    """
+    Replays `(friendship_id, action)` accept/reject actions on the friendship requests received by
+    one user, with the same rules as the single endpoints, and writes their net effect with one
+    UPDATE and one DELETE. Returns the per-action results.
+    """
+    with transaction.atomic():
+        friendships = FriendShip.objects.select_for_update().filter(
+            receiver_id=user_id, pk__in={friendship_id for friendship_id, action in actions}
+        ).in_bulk()
+        initial = {pk: friendship.status for pk, friendship in friendships.items()}
+        final = dict(initial)
+
+        results = []
+        for friendship_id, action in actions:
+            current = final.get(friendship_id)
+            if current is None:
+                results.append({
+                    'friendship': friendship_id, 'status': status.HTTP_404_NOT_FOUND, 'details': _("Not found."),
+                })
+            elif action == ACCEPT and current == FriendShip.WAITING:
+                final[friendship_id] = FriendShip.ACCEPTED
+                results.append({
+                    'friendship': friendship_id, 'status': status.HTTP_200_OK,
+                    'details': _("friendship request has been accepted"),
+                })
+            elif action == REJECT and current in [FriendShip.WAITING, FriendShip.ACCEPTED]:
+                final[friendship_id] = None
+                results.append({
+                    'friendship': friendship_id, 'status': status.HTTP_200_OK,
+                    'details': _("friendship request has been rejected"),
+                })
+            else:
+                results.append({
+                    'friendship': friendship_id, 'status': status.HTTP_400_BAD_REQUEST,
+                    'details': _("not available"),
+                })
+
+        accepted = [pk for pk, state in final.items() if state == FriendShip.ACCEPTED and initial[pk] != state]
+        deleted = [pk for pk, state in final.items() if state is None]
+        # the graph, the signals and the cache generations only follow the writes that changed rows
+        if accepted and not FriendShip.objects.filter(pk__in=accepted).update(
+            status=FriendShip.ACCEPTED, modified_at=timezone.now()
+        ):
+            accepted = []
+        if deleted and not bulk_delete(FriendShip, deleted):
+            deleted = []
+
+        linked = [(friendships[pk].sender_id, friendships[pk].receiver_id) for pk in accepted]
+        unlinked = unlinked_pairs([friendships[pk] for pk in deleted if initial[pk] == FriendShip.ACCEPTED])
+        if linked:
+            graph.link_many(linked)
+            friendships_accepted.send(sender=FriendShip, pairs=linked)
+        if unlinked:
+            graph.unlink_many(unlinked)
+            friendships_removed.send(sender=FriendShip, pairs=unlinked)
+
+    if accepted or deleted:
+        bump_generation(FriendShip)
+    return results
+
+
+def unlinked_pairs(friendships):
+    """Pairs of the deleted accepted friendships whose users aren't friends through the reverse request."""
+    if not friendships:
+        return []
+    condition = Q()
+    for friendship in friendships:
+        condition |= Q(sender_id=friendship.receiver_id, receiver_id=friendship.sender_id)
+    reverse = set(
+        FriendShip.objects.filter(condition, status=FriendShip.ACCEPTED).values_list('receiver_id', 'sender_id')
+    )
+    return [
+        (friendship.sender_id, friendship.receiver_id) for friendship in friendships
+        if (friendship.sender_id, friendship.receiver_id) not in reverse
+    ]
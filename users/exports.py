@@ -0,0 +1,12 @@
+from django.contrib.auth import get_user_model
+
+from users.api.v1.serializers import UserDetailsSerializer
+from utilities.export import Export
+
+User = get_user_model()
+
+users_export = Export(
+    'users',
+    User.objects.filter(is_superuser=False, is_staff=False, is_active=True),
+    UserDetailsSerializer,
+)
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db.models import Count, Q
+
+from users.models import FriendEdge
+from utilities.caching import bump_generation, get_generations, get_or_compute, make_key
+
+
+def cache_key(prefix, *parts):
+    """Cache key of a graph lookup, edges are only written here so their generation invalidates it."""
+    generation = get_generations([FriendEdge._meta.db_table])[FriendEdge._meta.db_table]
+    return make_key(prefix, generation, *parts)
+
+
+def friends_of(user_id):
+    return get_or_compute(
+        cache_key('friends_of', user_id),
+        lambda: frozenset(FriendEdge.objects.filter(user_id=user_id).values_list('friend_id', flat=True)),
+        timeout=settings.FRIEND_GRAPH_CACHE_TIMEOUT,
+    )
+
+
+def friends_queryset(user_id):
+    """Friend ids of a user as a subquery, for `pk__in` filters."""
+    return FriendEdge.objects.filter(user_id=user_id).values('friend_id')
+
+
+def are_friends(user_id, other_id):
+    return other_id in friends_of(user_id)
+
+
+def mutual_friends(user_id, other_id):
+    return friends_of(user_id) & friends_of(other_id)
+
+
+def friends_counts(user_ids):
+    user_ids = sorted(user_ids)
+
+    def compute():
+        counts = dict.fromkeys(user_ids, 0)
+        rows = FriendEdge.objects.filter(user_id__in=user_ids).order_by().values('user_id').annotate(total=Count('pk'))
+        for row in rows:
+            counts[row['user_id']] = row['total']
+        return counts
+
+    return get_or_compute(
+        cache_key('friends_counts', user_ids), compute, timeout=settings.FRIEND_GRAPH_CACHE_TIMEOUT
+    )
+
+
+def link(user_id, other_id):
+    link_many([(user_id, other_id)])
+
+
+def link_many(pairs):
+    FriendEdge.objects.bulk_create(
+        [FriendEdge(user_id=user_id, friend_id=friend_id) for pair in pairs for user_id, friend_id in (pair, pair[::-1])],
+        ignore_conflicts=True,
+    )
+    bump_generation(FriendEdge)
+
+
+def unlink(user_id, other_id):
+    unlink_many([(user_id, other_id)])
+
+
+def unlink_many(pairs):
+    condition = Q()
+    for user_id, other_id in pairs:
+        condition |= Q(user_id=user_id, friend_id=other_id) | Q(user_id=other_id, friend_id=user_id)
+    if condition:
+        FriendEdge.objects.filter(condition).delete()
+    bump_generation(FriendEdge)
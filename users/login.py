@@ -0,0 +1,155 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authtoken.models import Token
+
+from utilities.exceptions import Http503
+
+User = get_user_model()
+
+
+class PasswordVerifier:
+    """
+    Runs the password hasher on a bounded thread pool (hashlib releases the GIL while hashing),
+    at most `max_workers` hashes run at once and at most `max_pending` logins wait for one,
+    further logins are refused right away instead of pinning every server worker.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.executor = None
+        self.slots = None
+        self.workers = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                workers = self.max_workers or settings.LOGIN_HASH_WORKERS
+                pending = self.max_pending if self.max_pending is not None else settings.LOGIN_HASH_QUEUE_SIZE
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-verifier')
+                self.slots = threading.BoundedSemaphore(workers + pending)
+                self.workers = workers
+
+    def run(self, function, *args):
+        self.start()
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise Http503(_("Too many logins in progress, please retry."))
+
+        submitted = time.perf_counter()
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        def measured():
+            started = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                finished = time.perf_counter()
+                with self.lock:
+                    self.wait_seconds += started - submitted
+                    self.hash_seconds += finished - started
+                    self.completed += 1
+                    self.in_flight -= 1
+                self.slots.release()
+
+        future = self.executor.submit(measured)
+        try:
+            return future.result(timeout=settings.LOGIN_HASH_TIMEOUT)
+        except FutureTimeoutError:
+            with self.lock:
+                self.timed_out += 1
+            raise Http503(_("Login timed out, please retry."))
+
+    def metrics(self):
+        with self.lock:
+            completed = self.completed or 1
+            return {
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'queue_depth': max(0, self.in_flight - (self.workers or 0)),
+                'peak_in_flight': self.peak_in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'mean_wait_ms': round(self.wait_seconds / completed * 1000, 3),
+                'mean_hash_ms': round(self.hash_seconds / completed * 1000, 3),
+            }
+
+
+password_verifier = PasswordVerifier()
+
+
+class PooledPasswordBackend(ModelBackend):
+    """
+    ModelBackend running only the hasher on `password_verifier`, the queries stay on the request
+    thread. Hashes made with a non preferred hasher or work factor are upgraded after a successful check.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Run the default hasher once to keep the timing of unknown usernames close to the known ones.
+            password_verifier.run(get_hasher().encode, password, get_hasher().salt())
+            return None
+        if not password_verifier.run(check_password, password, user.password) or not self.user_can_authenticate(user):
+            return None
+
+        if needs_rehash(user.password):
+            user.set_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+
+def verify_credentials(request, username, password):
+    """Checks the credentials of a login against `AUTHENTICATION_BACKENDS`, returns the user or None."""
+    return authenticate(request, username=username, password=password)
+
+
+def needs_rehash(encoded):
+    preferred = get_hasher()
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def issue_token(user):
+    """Creates the auth token of a new user, `user.auth_token` holds it afterwards."""
+    return Token.objects.create(user=user)
+
+
+def get_token_key(user):
+    """
+    Auth token key of a user, issued on first use. It is read from the database (one indexed
+    lookup) rather than cached, the shared cache is no place for credentials.
+    """
+    try:
+        return user.auth_token.key
+    except Token.DoesNotExist:
+        token, created = Token.objects.get_or_create(user=user)
+        return token.key
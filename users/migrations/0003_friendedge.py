@@ -0,0 +1,54 @@
+# Generated by Django 2.2.24 on 2026-10-18 13:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_friend_edges(apps, schema_editor):
+    FriendShip = apps.get_model('users', 'FriendShip')
+    FriendEdge = apps.get_model('users', 'FriendEdge')
+    edges = []
+    for sender_id, receiver_id in FriendShip.objects.filter(status='accepted').values_list('sender_id', 'receiver_id'):
+        edges.append(FriendEdge(user_id=sender_id, friend_id=receiver_id))
+        edges.append(FriendEdge(user_id=receiver_id, friend_id=sender_id))
+    FriendEdge.objects.bulk_create(edges, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20210628_0502'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendEdge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'friend edge',
+                'verbose_name_plural': 'friend edges',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['receiver', '-created_at'], name='users_frien_receive_334e53_idx'),
+        ),
+        migrations.AddField(
+            model_name='friendedge',
+            name='friend',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='friend'),
+        ),
+        migrations.AddField(
+            model_name='friendedge',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_edges', to=settings.AUTH_USER_MODEL, verbose_name='user'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='friendedge',
+            unique_together={('user', 'friend')},
+        ),
+        migrations.RunPython(fill_friend_edges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import utilities.uploads
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_friendedge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='personal_image_has_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='personal image has variants'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='personal_image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='personal image hash'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='personal_image',
+            field=utilities.uploads.ContentAddressedImageField(blank=True, hash_field='personal_image_hash', null=True, upload_to='user-images/', variants_field='personal_image_has_variants', verbose_name='personal image'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.utils.translation import gettext_lazy as _
 from django.db import models
 from preventia_social.settings import AUTH_USER_MODEL
 from utilities.models import BaseModel
+from utilities.uploads import ContentAddressedImageField
 
 
 class User(AbstractUser):
@@ -27,12 +28,25 @@ class User(AbstractUser):
         null=True,
         verbose_name=_('email address')
     )
-    personal_image = models.ImageField(
+    personal_image = ContentAddressedImageField(
         upload_to='user-images/',
+        hash_field='personal_image_hash',
+        variants_field='personal_image_has_variants',
         blank=True,
         null=True,
         verbose_name=_("personal image")
     )
+    personal_image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name=_("personal image hash")
+    )
+    personal_image_has_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name=_("personal image has variants")
+    )
     role = models.PositiveSmallIntegerField(
         choices=ROLE_CHOICES,
         default=NORMAL,
@@ -54,7 +68,7 @@ class User(AbstractUser):
         if self.pk is None:
             if self.is_superuser or self.is_staff:
                 self.role = self.ADMIN
-        return super(User, self).save()
+        return super(User, self).save(*args, **kwargs)
 
 
 class FriendShip(BaseModel):
@@ -92,6 +106,9 @@ class FriendShip(BaseModel):
         constraints = [
             models.UniqueConstraint(fields=['sender', 'receiver'], name='unique_friend_request'),
         ]
+        indexes = [
+            models.Index(fields=['receiver', '-created_at', ]),
+        ]
 
     def __str__(self):
         return f'{self.get_status_display()}'
@@ -99,3 +116,30 @@ class FriendShip(BaseModel):
     def accept(self):
         self.status = self.ACCEPTED
         self.save()
+
+
+class FriendEdge(models.Model):
+    """
+    One direction of an accepted friendship, every accepted `FriendShip`
+    is stored as two edges so friends lookups only scan the `user` index.
+    """
+    user = models.ForeignKey(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='friend_edges',
+        verbose_name=_("user"),
+    )
+    friend = models.ForeignKey(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_("friend"),
+    )
+
+    class Meta:
+        verbose_name = _("friend edge")
+        verbose_name_plural = _("friend edges")
+        unique_together = ('user', 'friend',)
+
+    def __str__(self):
+        return f'{self.user_id} - {self.friend_id}'
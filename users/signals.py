@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from rest_framework.authtoken.models import Token
+
+from users import graph
+from users.models import FriendShip, User
+from utilities.authentication import token_cache
+
+# Sent by the bulk friendship actions, which skip the model signals,
+# with the `(sender_id, receiver_id)` pairs that became friends / stopped being friends.
+friendships_accepted = Signal(providing_args=['pairs'])
+friendships_removed = Signal(providing_args=['pairs'])
+
+
+@receiver(post_save, sender=FriendShip)
+def add_friend_edges(sender, instance, **kwargs):
+    if instance.status == FriendShip.ACCEPTED:
+        graph.link(instance.sender_id, instance.receiver_id)
+
+
+@receiver(post_delete, sender=FriendShip)
+def remove_friend_edges(sender, instance, **kwargs):
+    if instance.status != FriendShip.ACCEPTED:
+        return
+    reverse_accepted = FriendShip.objects.filter(
+        sender_id=instance.receiver_id, receiver_id=instance.sender_id, status=FriendShip.ACCEPTED
+    ).exists()
+    if not reverse_accepted:
+        graph.unlink(instance.sender_id, instance.receiver_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
@@ -1,11 +1,27 @@
 import json
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import user_login_failed
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.crypto import get_random_string
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
+from jobs.worker import Worker
+from posts.models import Post, TimelineEntry
+from users import graph
 from users.api.v1.serializers import UserSerializer
+from users.login import PasswordVerifier
+from users.models import FriendShip, User
+from utilities.authentication import TokenCache
+from utilities.caching import get_generations
+from utilities.exceptions import Http503
 
 
 class FrequentlyUsedObjects:
@@ -27,6 +43,7 @@ class CustomAPITestCase(APITestCase):
 
     def _pre_setup(self):
         super(CustomAPITestCase, self)._pre_setup()
+        cache.clear()
         self.frequent_objects = self.frequent_class()
 
 
@@ -158,3 +175,212 @@ class FriendShipTest(CustomAPITestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FriendGraphTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.tokens = [self.frequent_objects.create_user() for _ in range(4)]
+        self.users = [token.user for token in self.tokens]
+        first, second, third, _ = self.users
+        FriendShip.objects.create(sender=first, receiver=second).accept()
+        FriendShip.objects.create(sender=third, receiver=first).accept()
+        FriendShip.objects.create(sender=second, receiver=third).accept()
+        FriendShip.objects.create(sender=self.users[3], receiver=first)
+
+    def test_adjacency_lookups(self):
+        first, second, third, fourth = (user.pk for user in self.users)
+        self.assertEqual(graph.friends_of(first), {second, third})
+        self.assertTrue(graph.are_friends(third, first))
+        self.assertFalse(graph.are_friends(first, fourth))
+        self.assertEqual(graph.mutual_friends(first, second), {third})
+
+        FriendShip.objects.get(sender_id=first, receiver_id=second).delete()
+        self.assertEqual(graph.friends_of(second), {third})
+
+    def test_friends_filter(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.tokens[0]}')
+        response = self.client.get(path=reverse('users:users-list'), data={'friends': 'true'})
+        self.assertEqual(
+            {item['id'] for item in response.json()['results']},
+            {self.users[1].pk, self.users[2].pk}
+        )
+
+    def test_friends_count_follows_accepted_friendships(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.tokens[0]}')
+        self.assertEqual(self.client.get(path=reverse('users:users-list'), data={'friends': 'true'}).json()['count'], 2)
+        pending = FriendShip.objects.get(sender=self.users[3], receiver=self.users[0])
+        response = self.client.post(path=reverse('users:friendships-accept_friendship', kwargs={'pk': pending.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = self.client.get(path=reverse('users:users-list'), data={'friends': 'true'}).json()
+        self.assertEqual(data['count'], 3)
+        self.assertIn(self.users[3].pk, {item['id'] for item in data['results']})
+
+
+class TokenCacheTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token}')
+
+    def friendships_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path=reverse('users:friendships-list'))
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_warm_token_skips_the_token_query(self):
+        self.friendships_queries()
+        response, queries = self.friendships_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([sql for sql in queries if 'authtoken_token' in sql])
+
+    def test_deactivation_and_token_deletion_invalidate(self):
+        self.friendships_queries()
+        user = self.token.user
+        user.is_active = False
+        user.save()
+        response, _ = self.friendships_queries()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        user.is_active = True
+        user.save()
+        self.friendships_queries()
+        self.token.delete()
+        response, _ = self.friendships_queries()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_warm_token_skips_the_shared_cache(self):
+        self.friendships_queries()
+        with mock.patch('utilities.authentication.get_generations', wraps=get_generations) as generations:
+            response, _ = self.friendships_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        generations.assert_not_called()
+
+    def test_invalidations_of_other_processes(self):
+        with self.settings(AUTH_TOKEN_GENERATION_TTL=0.5):
+            self.friendships_queries()
+            # another process deactivates the user, its own token cache stands in for the other process
+            User.objects.filter(pk=self.token.user_id).update(is_active=False)
+            TokenCache().invalidate_user(self.token.user_id)
+            response, _ = self.friendships_queries()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            time.sleep(0.6)
+            response, _ = self.friendships_queries()
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LoginPathTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.token = self.frequent_objects.create_user()
+        self.payload = {"username": self.token.user.username, "password": "Dx123123"}
+
+    def login(self):
+        return self.client.post(path=reverse('users:login'), data=json.dumps(self.payload),
+                                content_type='application/json')
+
+    def test_rehash_on_login(self):
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['data']['token'], self.token.key)
+        self.token.user.refresh_from_db()
+        self.assertTrue(self.token.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_logins_go_through_the_authentication_backends(self):
+        failures = []
+
+        def login_failed(sender, credentials, **kwargs):
+            failures.append(credentials)
+
+        user_login_failed.connect(login_failed)
+        self.addCleanup(user_login_failed.disconnect, login_failed)
+        self.payload['password'] = 'wrong'
+        self.assertEqual(self.login().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(failures, [{'username': self.token.user.username, 'password': '********************'}])
+
+        self.payload['password'] = 'Dx123123'
+        with self.settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']), \
+                mock.patch('users.login.password_verifier') as verifier:
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        verifier.run.assert_not_called()
+
+    def test_token_keys_stay_out_of_the_cache(self):
+        shared = caches['shared']
+        with mock.patch.object(shared, 'set', wraps=shared.set) as cache_set, \
+                mock.patch.object(shared, 'add', wraps=shared.add) as cache_add:
+            for _ in range(2):
+                self.assertEqual(self.login().json()['data']['token'], self.token.key)
+        self.assertFalse([call for call in cache_set.call_args_list + cache_add.call_args_list
+                          if self.token.key in repr(call)])
+
+    def test_verifier_refuses_when_full(self):
+        verifier = PasswordVerifier(max_workers=1, max_pending=0)
+        release = threading.Event()
+        blocked = threading.Thread(target=verifier.run, args=(release.wait,))
+        blocked.start()
+        while verifier.metrics()['in_flight'] == 0:
+            time.sleep(0.001)
+        with self.assertRaises(Http503):
+            verifier.run(bool)
+        release.set()
+        blocked.join()
+        self.assertEqual(verifier.metrics()['rejected'], 1)
+
+
+class BulkFriendShipTest(CustomAPITestCase):
+    def setUp(self) -> None:
+        self.tokens = [self.frequent_objects.create_user() for _ in range(4)]
+        self.users = [token.user for token in self.tokens]
+        receiver = self.users[0]
+        self.requests = [FriendShip.objects.create(sender=sender, receiver=receiver) for sender in self.users[1:]]
+        self.requests[2].accept()
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.tokens[0]}')
+
+    def test_bulk_accept_and_reject(self):
+        first, second, accepted = self.requests
+        post = Post.objects.create(user=self.users[1], text="before the friendship")
+        response = self.client.post(path=reverse('users:friendships-bulk_actions'), data={'actions': [
+            {'friendship': first.pk, 'action': 'accept'},
+            {'friendship': first.pk, 'action': 'accept'},
+            {'friendship': second.pk, 'action': 'reject'},
+            {'friendship': accepted.pk, 'action': 'reject'},
+            {'friendship': 0, 'action': 'reject'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in response.json()['results']], [200, 400, 200, 200, 404])
+
+        owner = self.users[0].pk
+        self.assertEqual(list(FriendShip.objects.values_list('pk', 'status')), [(first.pk, FriendShip.ACCEPTED)])
+        self.assertEqual(graph.friends_of(owner), {self.users[1].pk})
+        self.assertEqual(graph.friends_of(self.users[3].pk), set())
+        self.assertEqual(Worker(processes=0).run(burst=True)['done'], 4)
+        self.assertTrue(TimelineEntry.objects.filter(user_id=owner, post=post).exists())
+
+
+class SignupTest(CustomAPITestCase):
+    def test_signup_writes_the_user_once(self):
+        payload = {
+            "username": "signup_user",
+            "email": "signup_user@example.com",
+            "new_password1": "Dx123123",
+            "new_password2": "Dx123123",
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(path=reverse('users:users-list'), data=payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user_writes = [
+            query['sql'].split()[0] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE')) and '"users_user"' in query['sql']
+        ]
+        self.assertEqual(user_writes, ['INSERT'])
+
+        user = User.objects.get(username="signup_user")
+        self.assertTrue(user.check_password("Dx123123"))
+        self.assertEqual(response.json()['token'], Token.objects.get(user=user).key)
+
+    def test_save_honors_update_fields(self):
+        user = self.frequent_objects.create_user().user
+        user.email = "changed@example.com"
+        user.first_name = "changed"
+        user.save(update_fields=['first_name'])
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.email == "changed@example.com"), ("changed", False))
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+
+
+class UtilitiesConfig(AppConfig):
+    name = 'utilities'
+
+    def ready(self):
+        import utilities.checks  # noqa: F401
+        from utilities.db import check_connections, configure_sqlite
+        connection_created.connect(configure_sqlite)
+        request_started.connect(check_connections)
@@ -0,0 +1,167 @@
+"""
+ASGI entry point for the Django 2.2 request handler, which is synchronous only.
+
+The event loop receives the request body (spooled to disk past `ASGI_BODY_MEMORY_SIZE`) and sends
+the response, only the Django handler itself runs on a bounded thread pool. A slow client holds a
+coroutine while it uploads or reads, not a thread, so a few threads serve many slow clients.
+The hot read endpoints (`ASGI_READ_VIEWS`) run on their own pool, logins, uploads and other
+writes can't take all the threads they need. Streaming responses are drained on a thread of their own.
+"""
+import asyncio
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import Resolver404, resolve
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AsgiHandler:
+    def __init__(self, threads=None, read_threads=None):
+        self.threads = threads
+        self.read_threads = read_threads
+        self.handler = WSGIHandler()
+        self.lock = threading.Lock()
+        self.executors = {}
+
+    def executor(self, name):
+        with self.lock:
+            if name not in self.executors:
+                if name == 'read':
+                    workers = self.read_threads or settings.ASGI_READ_THREADS
+                else:
+                    workers = self.threads or settings.ASGI_THREADS
+                self.executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'asgi-{name}')
+            return self.executors[name]
+
+    def shutdown(self):
+        with self.lock:
+            executors, self.executors = self.executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"unsupported ASGI scope type {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=settings.ASGI_BODY_MEMORY_SIZE)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            size = body.tell()
+            body.seek(0)
+
+            loop = asyncio.get_running_loop()
+            executor = self.executor(self.pool_name(scope))
+            environ = self.get_environ(scope, body, size)
+            status, headers, content, chunks = await loop.run_in_executor(executor, self.run, environ)
+
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if chunks is None:
+                await send({'type': 'http.response.body', 'body': content})
+                return
+            # streaming responses (exports) are produced one chunk at a time, all on one thread of their own
+            # so their queries share a database connection, which closing the response closes
+            stream = ThreadPoolExecutor(max_workers=1, thread_name_prefix='asgi-stream')
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(stream, next, chunks, None)
+                    if chunk is None:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                await loop.run_in_executor(stream, content.close)
+                stream.shutdown(wait=False)
+        finally:
+            body.close()
+
+    @staticmethod
+    def pool_name(scope):
+        if scope['method'] not in READ_METHODS:
+            return 'default'
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return 'default'
+        return 'read' if match.view_name in settings.ASGI_READ_VIEWS else 'default'
+
+    @staticmethod
+    def get_environ(scope, body, size):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'CONTENT_LENGTH': str(size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = str(scope['client'][0])
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+        for name, value in scope.get('headers', []):
+            name, value = name.decode('latin1').upper().replace('-', '_'), value.decode('latin1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            if name != 'CONTENT_TYPE':
+                name = f'HTTP_{name}'
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+        return environ
+
+    def run(self, environ):
+        """Runs the Django handler, the whole body of regular responses is read in the same thread."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+        response = self.handler(environ, start_response)
+        if getattr(response, 'streaming', False):
+            return started['status'], started['headers'], response, iter(response)
+        try:
+            content = b''.join(response)
+        finally:
+            # sends request_finished, closing this thread's database connection
+            response.close()
+        return started['status'], started['headers'], content, None
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return AsgiHandler()
@@ -0,0 +1,126 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from utilities.caching import bump_table_generation, get_generations
+
+
+def user_generation(user_id):
+    return f'auth_user:{user_id}'
+
+
+class TokenCache:
+    """
+    Bounded LRU of token key -> (user, token) snapshots expiring after a TTL,
+    indexed by user id so saving or deleting a user drops all of their tokens.
+    Every snapshot is checked against the generation of its user in the shared cache,
+    bumped by `invalidate_user`, so the invalidations of a process reach all the others.
+    A checked generation is trusted for `generation_ttl` seconds, so warm hits within it
+    stay in process and the invalidations of other processes arrive that late at most.
+    """
+
+    def __init__(self, max_size=None, ttl=None, generation_ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation_ttl = generation_ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.user_keys = {}
+
+    def get_limits(self):
+        max_size = self.max_size if self.max_size is not None else settings.AUTH_TOKEN_CACHE_SIZE
+        ttl = self.ttl if self.ttl is not None else settings.AUTH_TOKEN_CACHE_TTL
+        return max_size, ttl
+
+    def get_generation_ttl(self):
+        return self.generation_ttl if self.generation_ttl is not None else settings.AUTH_TOKEN_GENERATION_TTL
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, token, generation, expires_at, checked_until = entry
+            if expires_at < now:
+                self._remove(key)
+                return None
+            if now < checked_until:
+                self.entries.move_to_end(key)
+                return user, token
+        if get_generations([user_generation(user.pk)])[user_generation(user.pk)] != generation:
+            self.invalidate_key(key)
+            return None
+        with self.lock:
+            if self.entries.get(key) is entry:
+                self.entries[key] = (user, token, generation, expires_at, now + self.get_generation_ttl())
+                self.entries.move_to_end(key)
+        return user, token
+
+    def set(self, key, user, token):
+        max_size, ttl = self.get_limits()
+        if max_size <= 0:
+            return
+        generation = get_generations([user_generation(user.pk)])[user_generation(user.pk)]
+        now = time.monotonic()
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (user, token, generation, now + ttl, now + self.get_generation_ttl())
+            self.user_keys.setdefault(user.pk, set()).add(key)
+            while len(self.entries) > max_size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_key(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        bump_table_generation(user_generation(user_id))
+        with self.lock:
+            for key in list(self.user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.user_keys.get(entry[0].pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.user_keys[entry[0].pk]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication answering warm tokens from the in-process `token_cache`,
+    every request gets its own copy of the cached user.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super(CachedTokenAuthentication, self).authenticate_credentials(key)
+            token_cache.set(key, user, token)
+            return copy.copy(user), token
+
+        user, token = cached
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return copy.copy(user), token
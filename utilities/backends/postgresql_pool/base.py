@@ -0,0 +1,116 @@
+"""
+PostgreSQL backend borrowing its connections from a process-wide psycopg2 pool instead of opening
+a new one per thread, sized by the `POOL_MIN_SIZE` / `POOL_MAX_SIZE` options. A thread finding all
+the connections borrowed waits up to `POOL_TIMEOUT` seconds for one, and with `DB_HEALTH_CHECKS` every
+borrowed connection is pinged first. Closing the Django connection (at the end of the request with
+CONN_MAX_AGE=0, or once CONN_MAX_AGE expired) hands it back to the pool, rolled back.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+
+try:
+    import psycopg2
+    from psycopg2 import pool
+except ImportError as error:
+    raise ImproperlyConfigured(f"Error loading psycopg2 module: {error}")
+
+POOL_OPTIONS = ('POOL_MIN_SIZE', 'POOL_MAX_SIZE', 'POOL_TIMEOUT')
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class BlockingConnectionPool:
+    """
+    `ThreadedConnectionPool` whose `getconn` waits for a returned connection once `max_size`
+    are borrowed, instead of raising `PoolError` right away.
+    """
+
+    def __init__(self, min_size, max_size, timeout, **conn_params):
+        self.pool = pool.ThreadedConnectionPool(min_size, max_size, **conn_params)
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise pool.PoolError(
+                f"all the {self.max_size} connections of the pool stayed borrowed for {self.timeout} seconds"
+            )
+        try:
+            return self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, connection, close=False):
+        try:
+            self.pool.putconn(connection, close=close)
+        finally:
+            self.slots.release()
+
+
+def is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        conn_params = super(DatabaseWrapper, self).get_connection_params()
+        for option in POOL_OPTIONS:
+            conn_params.pop(option, None)
+        return conn_params
+
+    def get_pool(self, conn_params):
+        # forked processes (job workers) can't share the sockets of their parent, they get their own pool
+        key = (os.getpid(), self.alias)
+        with pools_lock:
+            if key not in pools:
+                options = self.settings_dict['OPTIONS']
+                pools[key] = BlockingConnectionPool(
+                    options.get('POOL_MIN_SIZE', 1), options.get('POOL_MAX_SIZE', 10), options.get('POOL_TIMEOUT', 10),
+                    **conn_params
+                )
+            return pools[key]
+
+    def borrow(self, conn_params):
+        connections = self.get_pool(conn_params)
+        while True:
+            connection = connections.getconn()
+            if connection.closed:
+                connections.putconn(connection, close=True)
+            elif settings.DB_HEALTH_CHECKS and not is_usable(connection):
+                # dropped by the database (restart, idle timeout) while it sat in the pool
+                connections.putconn(connection, close=True)
+            else:
+                return connection
+
+    def get_new_connection(self, conn_params):
+        connection = self.borrow(conn_params)
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # the pool rolls back an open transaction and drops the broken connections
+                self.get_pool(self.get_connection_params()).putconn(
+                    self.connection, close=bool(self.connection.closed)
+                )
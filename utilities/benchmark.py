@@ -0,0 +1,537 @@
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from posts.api.v1.views import CommentResource, PostResource
+from posts.models import Attachment, Comment, Like, Post, TimelineEntry
+from users.api.v1.views import FriendShipResource, UserResource
+from users.models import FriendEdge, FriendShip
+from utilities.asgi import AsgiHandler
+from utilities.caching import bump_generation
+
+User = get_user_model()
+
+BENCHMARK_PASSWORD = 'Bench-123123'
+
+DEFAULT_DATASET = OrderedDict([
+    ('users', 200),
+    ('friends_per_user', 10),
+    ('posts_per_user', 5),
+    ('comments_per_post', 3),
+    ('likes_per_post', 5),
+    ('attachments_per_post', 1),
+])
+
+WORDS = (
+    'garden', 'river', 'coffee', 'music', 'travel', 'sunset', 'family', 'football', 'recipe', 'weekend',
+    'mountain', 'book', 'movie', 'city', 'friends', 'summer', 'project', 'holiday', 'morning', 'dinner',
+)
+
+
+def random_text(rand, words=12):
+    return ' '.join(rand.choice(WORDS) for _ in range(words))
+
+
+def seed_dataset(users, friends_per_user, posts_per_user, comments_per_post, likes_per_post,
+                 attachments_per_post, seed=0, batch_size=400):
+    """
+    Bulk loads a synthetic social graph, the bulk inserts skip the model signals
+    so the derived tables (counters, friend edges, timelines) are filled here.
+    """
+    rand = random.Random(seed)
+    prefix = f'bench{seed}_'
+    password = make_password(BENCHMARK_PASSWORD)
+
+    User.objects.bulk_create(
+        [
+            User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', password=password)
+            for index in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.filter(username__startswith=prefix).values_list('pk', flat=True))
+
+    pairs = set()
+    for user_id in user_ids:
+        for friend_id in rand.sample(user_ids, min(friends_per_user, len(user_ids))):
+            if friend_id != user_id and (friend_id, user_id) not in pairs:
+                pairs.add((user_id, friend_id))
+    FriendShip.objects.bulk_create(
+        [FriendShip(sender_id=sender_id, receiver_id=receiver_id, status=FriendShip.ACCEPTED)
+         for sender_id, receiver_id in pairs],
+        batch_size=batch_size,
+    )
+    FriendEdge.objects.bulk_create(
+        [FriendEdge(user_id=user_id, friend_id=friend_id) for pair in pairs for user_id, friend_id in (pair, pair[::-1])],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    bump_generation(FriendEdge)
+
+    Post.objects.bulk_create(
+        [Post(user_id=user_id, text=random_text(rand)) for user_id in user_ids for _ in range(posts_per_user)],
+        batch_size=batch_size,
+    )
+    posts = list(Post.objects.filter(user_id__in=user_ids).values_list('pk', 'user_id'))
+    post_ids = [post_id for post_id, _ in posts]
+
+    Comment.objects.bulk_create(
+        [
+            Comment(user_id=rand.choice(user_ids), post_id=post_id, text=random_text(rand, 6))
+            for post_id in post_ids for _ in range(comments_per_post)
+        ],
+        batch_size=batch_size,
+    )
+    Like.objects.bulk_create(
+        [
+            Like(user_id=user_id, post_id=post_id)
+            for post_id in post_ids
+            for user_id in rand.sample(user_ids, min(likes_per_post, len(user_ids)))
+        ],
+        batch_size=batch_size,
+    )
+    Attachment.objects.bulk_create(
+        [
+            Attachment(post_id=post_id, file=f'bench/{post_id}_{index}.jpg')
+            for post_id in post_ids for index in range(attachments_per_post)
+        ],
+        batch_size=batch_size,
+    )
+
+    friends = {user_id: {user_id} for user_id in user_ids}
+    for sender_id, receiver_id in pairs:
+        friends[sender_id].add(receiver_id)
+        friends[receiver_id].add(sender_id)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id) for post_id, author_id in posts for user_id in friends[author_id]],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    bump_generation(TimelineEntry)
+    Post.repair_counters(Post.objects.filter(pk__in=post_ids))
+
+    return OrderedDict([
+        ('users', len(user_ids)),
+        ('friendships', len(pairs)),
+        ('posts', len(post_ids)),
+        ('comments', len(post_ids) * comments_per_post),
+        ('likes', Like.objects.filter(post_id__in=post_ids).count()),
+        ('attachments', len(post_ids) * attachments_per_post),
+        ('usernames', [f'{prefix}{index}' for index in range(users)]),
+    ])
+
+
+def get_scenarios(dataset, rand):
+    """Endpoint scenarios as (name, method, path factory, payload factory)."""
+    post_ids = list(Post.objects.filter(user__username__in=dataset['usernames']).values_list('pk', flat=True))
+    signups = itertools.count()
+    return [
+        ('posts-list', 'get', lambda: reverse('posts:posts-list'), None),
+        ('posts-retrieve', 'get', lambda: reverse('posts:posts-detail', kwargs={'pk': rand.choice(post_ids)}), None),
+        ('posts-like-dislike', 'post',
+         lambda: reverse('posts:posts-like_dislike', kwargs={'pk': rand.choice(post_ids)}), lambda: {}),
+        ('posts-bulk-like-dislike', 'post', lambda: reverse('posts:posts-bulk_like_dislike'),
+         lambda: {'actions': [{'post': rand.choice(post_ids)} for _ in range(100)]}),
+        ('posts-search', 'get', lambda: reverse('posts:posts-list') + f'?search={rand.choice(WORDS)}', None),
+        ('feed', 'get', lambda: reverse('posts:feed-list'), None),
+        ('comments-list', 'get', lambda: reverse('posts:comments-list'), None),
+        ('users-friends', 'get', lambda: reverse('users:users-list') + '?friends=true', None),
+        ('friendships-list', 'get', lambda: reverse('users:friendships-list'), None),
+        ('users-signup', 'post', lambda: reverse('users:users-list'),
+         lambda: signup_payload(f"signup_{rand.random():.12f}_{next(signups)}")),
+        ('login', 'post', lambda: reverse('users:login'),
+         lambda: {'username': rand.choice(dataset['usernames']), 'password': BENCHMARK_PASSWORD}),
+    ]
+
+
+def signup_payload(username):
+    return {
+        'username': username,
+        'email': f'{username}@example.com',
+        'new_password1': BENCHMARK_PASSWORD,
+        'new_password2': BENCHMARK_PASSWORD,
+    }
+
+
+def summarize(durations, queries, elapsed):
+    durations = sorted(durations)
+
+    def percentile(value):
+        index = min(len(durations) - 1, max(0, math.ceil(value / 100 * len(durations)) - 1))
+        return round(durations[index] * 1000, 3)
+
+    return OrderedDict([
+        ('requests', len(durations)),
+        ('throughput_rps', round(len(durations) / elapsed, 2) if elapsed else None),
+        ('mean_ms', round(statistics.mean(durations) * 1000, 3)),
+        ('p50_ms', percentile(50)),
+        ('p90_ms', percentile(90)),
+        ('p95_ms', percentile(95)),
+        ('p99_ms', percentile(99)),
+        ('max_ms', round(durations[-1] * 1000, 3)),
+        ('queries_mean', round(statistics.mean(queries), 2) if queries else None),
+        ('queries_max', max(queries) if queries else None),
+    ])
+
+
+def run_benchmark(dataset, iterations=50, warmup=5, only=None, seed=0, response_cache=False):
+    """
+    Latency and queries of every endpoint. The response cache would answer the measured GETs
+    after the warmup, it is off unless `response_cache` measures the cached responses instead.
+    """
+    with override_settings(RESPONSE_CACHE_ENABLED=response_cache):
+        return measure_endpoints(dataset, iterations, warmup, only, seed)
+
+
+def measure_endpoints(dataset, iterations, warmup, only, seed):
+    rand = random.Random(seed)
+    user = User.objects.get(username=dataset['usernames'][0])
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    results = OrderedDict()
+    for name, method, path, payload in get_scenarios(dataset, rand):
+        if only and name not in only:
+            continue
+        cache.clear()
+        request = getattr(client, method)
+        for _ in range(warmup):
+            request(path(), data=payload() if payload else None, format='json')
+
+        durations, queries = [], []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                response = request(path(), data=payload() if payload else None, format='json')
+                durations.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name} answered {response.status_code}: {response.content[:200]}')
+            queries.append(len(context.captured_queries))
+        results[name] = summarize(durations, queries, time.perf_counter() - started)
+    return results
+
+
+def run_login_benchmark(dataset, concurrency=4, requests=100, seed=0):
+    """Logins per second (and per core) with `concurrency` clients logging in at the same time."""
+    rand = random.Random(seed)
+    payloads = [
+        {'username': rand.choice(dataset['usernames']), 'password': BENCHMARK_PASSWORD} for _ in range(requests)
+    ]
+    statuses = []
+    lock = threading.Lock()
+
+    def client_loop(payloads):
+        client = APIClient()
+        try:
+            for payload in payloads:
+                response = client.post(reverse('users:login'), data=payload, format='json')
+                with lock:
+                    statuses.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=client_loop, args=(payloads[index::concurrency],)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    succeeded = statuses.count(200)
+    cores = os.cpu_count() or 1
+    return OrderedDict([
+        ('concurrency', concurrency),
+        ('requests', len(statuses)),
+        ('succeeded', succeeded),
+        ('refused', statuses.count(503)),
+        ('logins_per_second', round(succeeded / elapsed, 2)),
+        ('cores', cores),
+        ('logins_per_second_per_core', round(succeeded / elapsed / cores, 2)),
+    ])
+
+
+def run_concurrency_benchmark(dataset, clients=50, threads=4, requests=200, client_delay=0.05, seed=0):
+    """
+    Throughput and latency of the hot read endpoints for `clients` slow clients, each taking
+    `client_delay` seconds to send its request and as long to read the response, served with
+    `threads` threads: WSGI sync workers, held for the whole exchange, against the ASGI handler,
+    whose threads only run Django.
+    """
+    rand = random.Random(seed)
+    user = User.objects.get(username=dataset['usernames'][0])
+    token, _ = Token.objects.get_or_create(user=user)
+    post_ids = list(Post.objects.filter(user__username__in=dataset['usernames']).values_list('pk', flat=True))
+    paths = [
+        rand.choice([
+            reverse('posts:posts-list'),
+            reverse('posts:posts-detail', kwargs={'pk': rand.choice(post_ids)}),
+            reverse('posts:comments-list'),
+            reverse('posts:feed-list'),
+            reverse('users:friendships-list'),
+        ]) for _ in range(requests)
+    ]
+
+    def scope(path):
+        return {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'http_version': '1.1',
+            'headers': [(b'authorization', f'Token {token.key}'.encode())],
+        }
+
+    def run_wsgi():
+        handler = WSGIHandler()
+        workers = ThreadPoolExecutor(max_workers=threads)
+        statuses = []
+
+        def serve(path):
+            # a sync worker reads the request and writes the response at the client's pace
+            time.sleep(client_delay)
+            response = handler(AsgiHandler.get_environ(scope(path), BytesIO(), 0), lambda status, headers: None)
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            time.sleep(client_delay)
+            return response.status_code
+
+        def client_loop(paths):
+            for path in paths:
+                started = time.perf_counter()
+                statuses.append(workers.submit(serve, path).result())
+                durations.append(time.perf_counter() - started)
+
+        client_threads = [
+            threading.Thread(target=client_loop, args=(paths[index::clients],)) for index in range(clients)
+        ]
+        for thread in client_threads:
+            thread.start()
+        for thread in client_threads:
+            thread.join()
+        workers.shutdown()
+        return statuses
+
+    def run_asgi():
+        application = AsgiHandler(threads=threads, read_threads=threads)
+        statuses = []
+
+        async def request(path):
+            async def receive():
+                await asyncio.sleep(client_delay)
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(client_delay)
+
+            started = time.perf_counter()
+            await application(scope(path), receive, send)
+            durations.append(time.perf_counter() - started)
+
+        async def client_loop(paths):
+            for path in paths:
+                await request(path)
+
+        async def main():
+            await asyncio.gather(*[client_loop(paths[index::clients]) for index in range(clients)])
+
+        asyncio.run(main())
+        application.shutdown()
+        return statuses
+
+    results = OrderedDict()
+    for name, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+        cache.clear()
+        durations = []
+        started = time.perf_counter()
+        statuses = run()
+        elapsed = time.perf_counter() - started
+        if any(status >= 400 for status in statuses):
+            raise RuntimeError(f'{name} answered {sorted(set(statuses))}')
+        results[name] = summarize(durations, None, elapsed)
+    results['settings'] = OrderedDict([
+        ('clients', clients), ('threads', threads), ('client_delay_ms', round(client_delay * 1000, 3)),
+    ])
+    return results
+
+
+def run_write_benchmark(dataset, writers=4, readers=4, requests=200, seed=0, pragmas=None):
+    """
+    Like toggles per second of `writers` concurrent clients while `readers` clients list posts, run once
+    with the SQLite defaults (rollback journal, synchronous=FULL) and once with `SQLITE_PRAGMAS`.
+    """
+    rand = random.Random(seed)
+    post_ids = list(Post.objects.filter(user__username__in=dataset['usernames']).values_list('pk', flat=True))
+    tokens = [
+        Token.objects.get_or_create(user=user)[0].key
+        for user in User.objects.filter(username__in=dataset['usernames'][:writers + readers])
+    ]
+    writes = [reverse('posts:posts-like_dislike', kwargs={'pk': rand.choice(post_ids)}) for _ in range(requests)]
+    pragmas = pragmas or settings.SQLITE_PRAGMAS
+    modes = OrderedDict([
+        ('rollback_journal', dict(pragmas, journal_mode='delete', synchronous='full')),
+        ('tuned', pragmas),
+    ])
+
+    def client_loop(token, paths, method, durations, statuses):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        try:
+            for path in paths:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, format='json')
+                durations.append(time.perf_counter() - started)
+                statuses.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    results = OrderedDict()
+    for name, mode in modes.items():
+        # the journal mode is stored in the database file, it only changes with no other connection open
+        connections.close_all()
+        with override_settings(SQLITE_PRAGMAS=mode, RESPONSE_CACHE_ENABLED=False):
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+            write_durations, write_statuses, read_durations, read_statuses = [], [], [], []
+            threads = [
+                threading.Thread(target=client_loop, args=(
+                    tokens[index], writes[index::writers], 'post', write_durations, write_statuses
+                )) for index in range(writers)
+            ]
+            stop_reading = threading.Event()
+
+            def reads():
+                while not stop_reading.is_set():
+                    yield reverse('posts:posts-list')
+
+            read_threads = [
+                threading.Thread(target=client_loop, args=(
+                    tokens[writers + index], reads(), 'get', read_durations, read_statuses
+                )) for index in range(readers)
+            ]
+            started = time.perf_counter()
+            for thread in threads + read_threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            stop_reading.set()
+            for thread in read_threads:
+                thread.join()
+
+        results[name] = OrderedDict([
+            ('journal_mode', journal_mode),
+            ('writes', summarize(write_durations, None, elapsed)),
+            ('reads', summarize(read_durations, None, elapsed) if read_durations else None),
+            ('errors', sum(status >= 500 for status in write_statuses + read_statuses)),
+        ])
+    connections.close_all()
+    return results
+
+
+def run_serializer_benchmark(dataset, rows=200, iterations=20):
+    """
+    Objects serialized per second by the regular and the compact serializers of the list
+    endpoints, reading `rows` objects of the same list queryset (query time included).
+    """
+    user = User.objects.get(username=dataset['usernames'][0])
+    resources = OrderedDict([
+        ('posts', PostResource),
+        ('comments', CommentResource),
+        ('users', UserResource),
+        # the friendships of every user, the list endpoint only shows the received ones
+        ('friendships', FriendShipResource),
+    ])
+    results = OrderedDict()
+    for name, resource in resources.items():
+        view = resource(request=Request(APIRequestFactory().get('/')), action='list', format_kwarg=None, kwargs={})
+        view.request.user = user
+        queryset = view.get_queryset()
+        if name == 'friendships':
+            queryset = queryset.model.objects.order_by('-created_at').select_related('sender', 'receiver')
+
+        def regular():
+            return view.get_serializer(list(queryset[:rows]), many=True).data
+
+        def compact():
+            serializer = view.compact_serializer_class(context=view.get_serializer_context())
+            return serializer.serialize(serializer.values(queryset, 'created_at')[:rows])
+
+        results[name] = OrderedDict()
+        for variant, serialize in (('regular', regular), ('compact', compact)):
+            serialize()
+            objects = 0
+            started = time.perf_counter()
+            for _ in range(iterations):
+                objects += len(serialize())
+            elapsed = time.perf_counter() - started
+            results[name][variant] = OrderedDict([
+                ('objects', objects),
+                ('objects_per_second', round(objects / elapsed, 1)),
+            ])
+        results[name]['speedup'] = round(
+            results[name]['compact']['objects_per_second'] / results[name]['regular']['objects_per_second'], 2
+        )
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return OrderedDict([
+        ('commit', commit),
+        ('python', platform.python_version()),
+        ('django', django.get_version()),
+        ('database', connection.vendor),
+        ('machine', platform.machine()),
+    ])
+
+
+def compare(baseline, current, metrics=('p50_ms', 'p95_ms', 'throughput_rps', 'queries_mean')):
+    """Relative change of the main metrics of every endpoint present in both reports."""
+    changes = OrderedDict()
+    for name, result in current['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        changes[name] = OrderedDict(
+            (metric, round((result[metric] - previous[metric]) / previous[metric] * 100, 1) if previous[metric] else None)
+            for metric in metrics
+        )
+    return changes
+
+
+def dumps(report):
+    return json.dumps(report, indent=2)
@@ -0,0 +1,181 @@
+import copy
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.test.utils import override_settings
+
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """Process-wide LRU of pickled values, shared by the per-thread cache backend instances."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            pickled, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return pickled
+
+    def set(self, key, pickled, timeout):
+        with self.lock:
+            self.entries[key] = (pickled, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache(BaseCache):
+    """
+    Cache backend keeping a small in-process LRU in front of the shared cache named by `LOCATION`.
+
+    Local copies live at most `LOCAL_TIMEOUT` seconds and deletes only reach the local tier of the
+    process that issued them, so values that change in place (write generations, locks, anything
+    deleted to invalidate it) must match `LOCAL_EXCLUDE_PREFIXES` and are always read from the
+    shared cache. Values keyed on write generations never change and are safe to keep locally.
+    """
+
+    def __init__(self, location, params):
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.local_exclude_prefixes = tuple(options.get('LOCAL_EXCLUDE_PREFIXES', ()))
+        with _local_tiers_lock:
+            self.local = _local_tiers.setdefault(location, LocalTier(options.get('LOCAL_MAX_ENTRIES', 1000)))
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def local_key(self, key, version):
+        return self.make_key(key, version=version)
+
+    def is_local(self, key):
+        return self.local_timeout > 0 and not key.startswith(self.local_exclude_prefixes)
+
+    def set_local(self, key, value, timeout, version):
+        if not self.is_local(key):
+            return
+        timeout = self.get_backend_timeout(timeout)
+        local_timeout = self.local_timeout if timeout is None else min(timeout - time.time(), self.local_timeout)
+        if local_timeout > 0:
+            self.local.set(self.local_key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), local_timeout)
+
+    def get(self, key, default=None, version=None):
+        if self.is_local(key):
+            pickled = self.local.get(self.local_key(key, version))
+            if pickled is not None:
+                return pickle.loads(pickled)
+        missing = object()
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            return default
+        self.set_local(key, value, self.local_timeout, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            pickled = self.local.get(self.local_key(key, version)) if self.is_local(key) else None
+            if pickled is None:
+                remote.append(key)
+            else:
+                found[key] = pickle.loads(pickled)
+        if remote:
+            shared = self.shared.get_many(remote, version=version)
+            for key, value in shared.items():
+                self.set_local(key, value, self.local_timeout, version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self.shared.set(key, value, timeout, version=version)
+        self.set_local(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout, version=version)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self.set_local(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.local_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if self.is_local(key) and self.local.get(self.local_key(key, version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(self.local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self.local.delete(self.local_key(key, version))
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def throwaway_cache_settings():
+    """
+    Settings override for the runs that clear the cache (tests, benchmark): a file based shared cache
+    moves to `.cache/test`, so the cache of a development server survives them, and its atomicity
+    check is waived.
+    """
+    cache_settings = copy.deepcopy(settings.CACHES)
+    if not cache_settings['shared']['BACKEND'].endswith('.FileBasedCache'):
+        return override_settings()
+    cache_settings['shared']['LOCATION'] = os.path.join(settings.BASE_DIR, '.cache', 'test')
+    return override_settings(CACHES=cache_settings, CACHE_REQUIRE_ATOMIC=False)
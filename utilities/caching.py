@@ -0,0 +1,264 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from utilities.routers import routing
+
+tracked_tables = set()
+
+
+class CacheStats:
+    """In-process counters of the cache lookups, recomputations and generation invalidations."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+
+    def incr(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters.get('hits', 0) + counters.get('not_modified', 0) + counters.get('misses', 0)
+        counters['hit_rate'] = round((lookups - counters.get('misses', 0)) / lookups, 4) if lookups else None
+        return counters
+
+
+cache_stats = CacheStats()
+
+
+def expires_early(delta, expires_at, beta):
+    """
+    Probabilistic early expiration: the closer an entry gets to its expiry and the longer
+    it took to compute, the likelier a reader recomputes it before it actually expires.
+    """
+    if expires_at is None:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def get_or_compute(key, compute, timeout=None, negative_timeout=None, beta=None, lock_timeout=None):
+    """
+    Returns the cached value of `key`, computing and caching it on a miss.
+
+    - single flight: a lock in the shared cache lets one caller compute while the others keep
+      serving the previous value, or wait up to `lock_timeout` seconds when there is none.
+    - early expiry: entries are recomputed a little before `timeout` (see `expires_early`).
+    - negative caching: `compute` returning None is cached for `negative_timeout` seconds.
+    - replicas (see `ReplicaRoutingMiddleware`): values computed from a replica may lag behind
+      the generations in their keys, they are stored for `DB_REPLICA_CACHE_TIMEOUT` seconds at
+      most, and the clients pinned to the primary after a write skip the cached values.
+    """
+    beta = settings.CACHE_EARLY_EXPIRY_BETA if beta is None else beta
+    lock_timeout = settings.CACHE_LOCK_TIMEOUT if lock_timeout is None else lock_timeout
+    negative_timeout = settings.CACHE_NEGATIVE_TIMEOUT if negative_timeout is None else negative_timeout
+
+    pinned = routing.pinned
+    entry = None if pinned else cache.get(key)
+    if entry is not None:
+        found, value, delta, expires_at = entry
+        if not expires_early(delta, expires_at, beta):
+            if not found:
+                cache_stats.incr('negative_hits')
+            return value
+        cache_stats.incr('early_recomputes')
+
+    lock_key = f'lock:{key}'
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if not locked and not pinned:
+        if entry is not None:
+            return entry[1]
+        cache_stats.incr('single_flight_waits')
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            waited = cache.get_many([key, lock_key])
+            if key in waited:
+                return waited[key][1]
+            if lock_key not in waited:
+                # the caller computing it failed or didn't store its value, compute it here
+                break
+
+    try:
+        started = time.perf_counter()
+        value = compute()
+        delta = time.perf_counter() - started
+        cache_stats.incr('computes')
+        if routing.read_replica:
+            replica_timeout = settings.DB_REPLICA_CACHE_TIMEOUT
+            if replica_timeout <= 0:
+                return value
+            timeout = min(timeout, replica_timeout) if timeout else replica_timeout
+            negative_timeout = min(negative_timeout, replica_timeout)
+        if value is not None:
+            cache.set(key, (True, value, delta, time.time() + timeout if timeout else None), timeout)
+        elif negative_timeout:
+            cache.set(key, (False, None, delta, time.time() + negative_timeout), negative_timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def generation_key(table):
+    return f'generation:{table}'
+
+
+def get_generations(tables):
+    """
+    Returns the current write generation of every given table, a table that has no
+    generation yet starts from the current time so that restarted caches never reuse one.
+    """
+    keys = {generation_key(table): table for table in tables}
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, int(time.time() * 1000), None)
+            generations[key] = cache.get(key)
+    return {keys[key]: value for key, value in generations.items()}
+
+
+def bump_generation(model):
+    bump_table_generation(model._meta.db_table)
+
+
+def bump_table_generation(table):
+    key = generation_key(table)
+    cache_stats.incr('invalidations')
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def bump_model_generation(sender, **kwargs):
+    bump_generation(sender)
+
+
+def track_writes(*models):
+    """
+    Bumps the generation of the models tables on every save and delete,
+    so cached values built from them can be keyed on `get_generations`.
+    """
+    for model in models:
+        tracked_tables.add(model._meta.db_table)
+        post_save.connect(bump_model_generation, sender=model, dispatch_uid=f'generation_save_{model._meta.label}')
+        post_delete.connect(bump_model_generation, sender=model, dispatch_uid=f'generation_delete_{model._meta.label}')
+
+
+def tables_in(sql):
+    """Returns the tracked tables a compiled SQL statement reads from."""
+    return sorted(table for table in tracked_tables if f'"{table}"' in sql)
+
+
+def untracked_tables_in(sql):
+    """Returns the model tables a compiled SQL statement reads from whose writes aren't tracked."""
+    return sorted(
+        model._meta.db_table for model in apps.get_models()
+        if model._meta.db_table not in tracked_tables and f'"{model._meta.db_table}"' in sql
+    )
+
+
+def make_key(prefix, *parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+class UncachedResponse(Exception):
+    def __init__(self, response):
+        super(UncachedResponse, self).__init__(response.status_code)
+        self.response = response
+
+
+class CachedResponseMixin:
+    """
+    Caches the list/retrieve response data of a viewset keyed on the path, the normalized
+    query parameters and the write generations of `cache_dependencies`, so any save or delete
+    of those models invalidates it. Responses depending on the requesting user (any of
+    `cache_per_user_fields` requested or `cache_per_user_params` present) are cached per user.
+    Responses carry an ETag and `If-None-Match` requests are answered with 304.
+    """
+    cache_actions = ['list', 'retrieve', ]
+    cache_dependencies = []
+    cache_per_user_fields = []
+    cache_per_user_params = []
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super(CachedResponseMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super(CachedResponseMixin, self).retrieve, request, *args, **kwargs)
+
+    def is_per_user_response(self, request):
+        if any(param in request.query_params for param in self.cache_per_user_params):
+            return True
+        if self.cache_per_user_fields and hasattr(self, 'get_requested_fields'):
+            return bool(set(self.cache_per_user_fields) & set(self.get_requested_fields()))
+        return bool(self.cache_per_user_fields)
+
+    def get_response_cache_key(self, request):
+        params = []
+        for name in sorted(request.query_params):
+            values = request.query_params.getlist(name)
+            if name == 'query':
+                values = [''.join(value.split()) for value in values]
+            params.append((name, values))
+        user = request.user.pk if self.is_per_user_response(request) else None
+        tables = [model._meta.db_table for model in self.cache_dependencies]
+        generations = sorted(get_generations(tables).items())
+        return make_key('response', request.path, request.accepted_media_type, params, user, generations)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED or self.action not in self.cache_actions:
+            return view(request, *args, **kwargs)
+
+        computed = []
+
+        def compute():
+            try:
+                response = view(request, *args, **kwargs)
+            except Http404:
+                # cached as a miss, creating the object bumps a generation and changes the key
+                computed.append(None)
+                return None
+            computed.append(response)
+            if response.status_code != status.HTTP_200_OK:
+                raise UncachedResponse(response)
+            etag = quote_etag(hashlib.sha1(
+                json.dumps(response.data, sort_keys=True, default=str).encode('utf-8')
+            ).hexdigest())
+            return response.data, etag
+
+        try:
+            cached = get_or_compute(
+                self.get_response_cache_key(request), compute, timeout=settings.RESPONSE_CACHE_TIMEOUT
+            )
+        except UncachedResponse as error:
+            return error.response
+
+        cache_stats.incr('misses' if computed else 'hits')
+        if cached is None:
+            raise Http404
+        data, etag = cached
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            cache_stats.incr('not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        if computed:
+            computed[0]['ETag'] = etag
+            return computed[0]
+        return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# backends whose `incr` and `add` are atomic across processes
+ATOMIC_CACHE_BACKENDS = ('memcached', 'redis', )
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES['shared']['BACKEND']
+    if not settings.CACHE_REQUIRE_ATOMIC or any(name in backend.lower() for name in ATOMIC_CACHE_BACKENDS):
+        return []
+    return [Error(
+        f"the shared cache backend {backend} isn't atomic, concurrent write generation bumps and locks "
+        f"of different processes can be lost.",
+        hint="Set CACHE_BACKEND / CACHE_LOCATION to a memcached or redis server, or CACHE_REQUIRE_ATOMIC=False.",
+        id='utilities.E001',
+    )]
@@ -0,0 +1,240 @@
+"""
+Compact read serializers for the hot list endpoints. A page is read with `values()` and every
+row dict is turned into the same JSON as the regular serializer by a plan compiled once per
+list: one getter per selected field, nested serializers built once for the whole list, and
+relations loaded in one query per page. The django-restql `query` parameter is honoured, the
+queries the plan can't reproduce (aliases, unknown fields, syntax errors) raise `Unsupported`
+and are left to the regular serializer.
+"""
+from collections import defaultdict
+from operator import itemgetter
+
+from django.utils.timesince import timesince
+from django_restql.exceptions import QueryFormatError
+from django_restql.mixins import RequestQueryParserMixin
+
+from utilities.uploads import stored_variant_urls
+
+REQUEST_QUERY = object()
+
+
+class Unsupported(Exception):
+    pass
+
+
+def parse_query(request):
+    """The parsed restql `query` parameter of the request, None without one."""
+    if request is None or not RequestQueryParserMixin.has_restql_query_param(request):
+        return None
+    try:
+        return RequestQueryParserMixin.get_parsed_restql_query_from_req(request)
+    except (SyntaxError, QueryFormatError):
+        raise Unsupported("invalid query") from None
+
+
+def select_fields(names, nested, query):
+    """
+    Mirrors `DynamicFieldsMixin.get_selected_fields`: the selected field names, in declaration
+    order, and the sub queries of the selected `nested` fields.
+    """
+    if query is None:
+        return list(names), {}
+    if query['aliases']:
+        raise Unsupported("aliases")
+    flat, sub_queries, include_all = [], {}, False
+    for field in query['include']:
+        if field == '*':
+            include_all = True
+        elif isinstance(field, dict):
+            [(name, sub_query)] = field.items()
+            if name not in nested:
+                raise Unsupported(f"{name} isn't a nested field")
+            sub_queries[name] = sub_query
+        elif field in names:
+            flat.append(field)
+        else:
+            raise Unsupported(f"unknown field {field}")
+    mentioned = flat + list(sub_queries) + query['exclude']
+    if len(mentioned) != len(set(mentioned)) or not set(query['exclude']) <= set(names):
+        raise Unsupported("invalid selection")
+
+    if query['exclude']:
+        return [name for name in names if name not in query['exclude']], sub_queries
+    if include_all:
+        return list(names), sub_queries
+    return [name for name in names if name in flat or name in sub_queries], sub_queries
+
+
+class Field:
+    """A column returned as read, `compile` returns the columns a field reads and its getter."""
+    nested = False
+
+    def __init__(self, source=None):
+        self.source = source
+
+    def compile(self, serializer, name, query):
+        column = serializer.prefix + (self.source or name)
+        return [column], itemgetter(column)
+
+
+class FileField(Field):
+    """URL of a stored file, absolute when there is a request, like `serializers.FileField`."""
+
+    def compile(self, serializer, name, query):
+        source = self.source or name
+        column = serializer.prefix + source
+        storage = serializer.model._meta.get_field(source).storage
+        request = serializer.context.get('request')
+
+        def get(row):
+            value = row[column]
+            if not value:
+                return None
+            url = storage.url(value)
+            return request.build_absolute_uri(url) if request is not None else url
+        return [column], get
+
+
+class VariantsField(Field):
+    """The `variant_urls` of the file stored in `file_field`."""
+
+    def __init__(self, file_field, hash_field, ready_field):
+        super(VariantsField, self).__init__()
+        self.file_field = file_field
+        self.hash_field = hash_field
+        self.ready_field = ready_field
+
+    def compile(self, serializer, name, query):
+        columns = [serializer.prefix + field for field in (self.file_field, self.hash_field, self.ready_field)]
+        file_column, hash_column, ready_column = columns
+        storage = serializer.model._meta.get_field(self.file_field).storage
+        request = serializer.context.get('request')
+
+        def get(row):
+            return stored_variant_urls(storage, row[file_column], row[hash_column], row[ready_column], request)
+        return columns, get
+
+
+class TimeSinceField(Field):
+    def __init__(self, source='created_at'):
+        super(TimeSinceField, self).__init__(source)
+
+    def compile(self, serializer, name, query):
+        column = serializer.prefix + self.source
+        return [column], lambda row: timesince(row[column])
+
+
+class DisplayField(Field):
+    """`{'key': value, 'value': get_FOO_display()}` of a field with choices."""
+
+    def compile(self, serializer, name, query):
+        source = self.source or name
+        column = serializer.prefix + source
+        # translated once per list
+        labels = {key: str(label) for key, label in serializer.model._meta.get_field(source).flatchoices}
+        return [column], lambda row: {'key': row[column], 'value': labels.get(row[column], row[column])}
+
+
+class NestedField(Field):
+    """
+    A foreign key rendered by another compact serializer, which reads its columns through the
+    join and, like the regular nested serializers, applies the restql query of the request.
+    """
+
+    def __init__(self, serializer_class, source=None):
+        super(NestedField, self).__init__(source)
+        self.serializer_class = serializer_class
+
+    def compile(self, serializer, name, query):
+        source = self.source or name
+        child = self.serializer_class(
+            context=serializer.context, prefix=f'{serializer.prefix}{source}__', parent=serializer
+        )
+        fk_column = serializer.prefix + source
+
+        def get(row):
+            return None if row[fk_column] is None else child.to_representation(row)
+        return [fk_column] + child.columns, get
+
+
+class ManyField(Field):
+    """
+    A reverse foreign key rendered by another compact serializer, the related rows of the whole
+    page are read by one query. `fields` narrows the child fields like the restql `fields` kwarg.
+    """
+    nested = True
+
+    def __init__(self, serializer_class, source, fields=None):
+        super(ManyField, self).__init__(source)
+        self.serializer_class = serializer_class
+        self.fields = fields
+
+    def compile(self, serializer, name, query):
+        child = self.serializer_class(context=serializer.context, query=query, allowed=self.fields)
+        relation = serializer.model._meta.get_field(self.source)
+        fk_name = relation.field.name
+        pk_column = serializer.prefix + serializer.model._meta.pk.name
+        groups = {}
+
+        def prepare(rows):
+            groups.clear()
+            ids = {row[pk_column] for row in rows}
+            if not ids:
+                return
+            related = child.model._default_manager.filter(**{f'{fk_name}__in': ids})
+            related_rows = list(related.values(*dict.fromkeys([fk_name] + child.columns)))
+            for child_prepare in child.preparations:
+                child_prepare(related_rows)
+            grouped = defaultdict(list)
+            for row in related_rows:
+                grouped[row[fk_name]].append(child.to_representation(row))
+            groups.update(grouped)
+
+        serializer.preparations.append(prepare)
+        return [pk_column], lambda row: groups.get(row[pk_column], [])
+
+
+class CompactSerializer:
+    """
+    Read only serializer of `values()` rows. `fields` maps the output names, in the order of
+    the regular serializer, to compact fields. `restql` tells whether the regular serializer
+    takes the `query` of the request (`DynamicFieldsMixin`).
+    """
+    model = None
+    fields = {}
+    restql = True
+
+    def __init__(self, context=None, query=REQUEST_QUERY, allowed=None, prefix='', parent=None):
+        self.context = context or {}
+        self.prefix = prefix
+        # the preparations of nested serializers run on the rows of the root one
+        self.preparations = parent.preparations if parent is not None else []
+        if query is REQUEST_QUERY:
+            query = parse_query(self.context.get('request')) if self.restql else None
+
+        names = [name for name in self.fields if allowed is None or name in allowed]
+        nested = {name for name in names if self.fields[name].nested}
+        selected, sub_queries = select_fields(names, nested, query)
+        self.plan = []
+        columns = [prefix + self.model._meta.pk.name]
+        for name in self.get_selected_fields(selected):
+            field_columns, getter = self.fields[name].compile(self, name, sub_queries.get(name))
+            columns.extend(field_columns)
+            self.plan.append((name, getter))
+        self.columns = list(dict.fromkeys(columns))
+
+    def get_selected_fields(self, selected):
+        return selected
+
+    def to_representation(self, row):
+        return {name: get(row) for name, get in self.plan}
+
+    def values(self, queryset, *extra):
+        """The rows of a queryset with the columns of the plan and the `extra` ones."""
+        return queryset.prefetch_related(None).values(*dict.fromkeys(self.columns + list(extra)))
+
+    def serialize(self, rows):
+        rows = list(rows)
+        for prepare in self.preparations:
+            prepare(rows)
+        return [self.to_representation(row) for row in rows]
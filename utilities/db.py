@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import connections
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Applies the SQLITE_PRAGMAS to every new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def check_connections(**kwargs):
+    """
+    Closes the persistent connections the database dropped meanwhile (restart, idle timeout),
+    before the request uses them, instead of failing the request with them.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
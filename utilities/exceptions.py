@@ -7,3 +7,7 @@ class Http400(APIException):
 
 class Http404(APIException):
     status_code = 404
+
+
+class Http503(APIException):
+    status_code = 503
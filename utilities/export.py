@@ -0,0 +1,98 @@
+"""
+Streaming exports: rows are read in primary key order by keyset chunks, every chunk loads its
+relations in batches and is serialized and written out before the next one is read, so the
+memory used doesn't depend on the table size.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+EXPORT_FORMATS = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv',
+}
+
+
+class Export:
+    def __init__(self, name, queryset, serializer_class, select_related=(), prefetch_related=(), exclude=None):
+        self.name = name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+        self.exclude = exclude
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def chunks(self, queryset=None, chunk_size=None):
+        chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+        queryset = (self.get_queryset() if queryset is None else queryset).select_related(*self.select_related)
+        queryset = queryset.order_by('pk')
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(page[:chunk_size].iterator(chunk_size=chunk_size))
+            if not chunk:
+                return
+            prefetch_related_objects(chunk, *self.prefetch_related)
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def rows(self, queryset=None, context=None, chunk_size=None):
+        kwargs = {'exclude': self.exclude} if self.exclude else {}
+        for chunk in self.chunks(queryset, chunk_size):
+            yield from self.serializer_class(chunk, many=True, context=context or {}, **kwargs).data
+
+
+def flatten(row, prefix=''):
+    """Flattens the nested objects of a serialized row into `parent.child` columns for CSV."""
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, list):
+            flat[f'{prefix}{key}'] = json.dumps(value, default=str)
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+class Echo:
+    """File-like object handing back what the csv writer writes, so the CSV lines can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+
+def csv_lines(rows):
+    writer = None
+    for row in rows:
+        row = flatten(row)
+        if writer is None:
+            writer = csv.DictWriter(Echo(), fieldnames=list(row), restval='', extrasaction='ignore')
+            yield writer.writeheader()
+        yield writer.writerow(row)
+
+
+def export_lines(rows, export_format):
+    if export_format == CSV:
+        return csv_lines(rows)
+    return ndjson_lines(rows)
+
+
+def export_response(rows, export_format, filename):
+    response = StreamingHttpResponse(export_lines(rows, export_format), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher as DjangoPBKDF2PasswordHasher
+
+
+class PBKDF2PasswordHasher(DjangoPBKDF2PasswordHasher):
+    """
+    PBKDF2 with the work factor taken from `PASSWORD_HASH_ITERATIONS` (0 keeps Django's default),
+    hashes made with another iteration count are upgraded on the next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', 0) or DjangoPBKDF2PasswordHasher.iterations
@@ -0,0 +1,240 @@
+"""
+Bulk import of users, friendships, posts, comments and likes from JSONL, one record per line:
+
+    {"type": "user", "username": "alice", "email": "alice@example.com", "password": "plain text"}
+    {"type": "user", "username": "bob", "password_hash": "pbkdf2_sha256$..."}
+    {"type": "friendship", "sender": "alice", "receiver": "bob", "status": "accepted"}
+    {"type": "post", "user": "alice", "text": "...", "is_draft": false,
+     "comments": [{"user": "bob", "text": "..."}], "likes": ["bob"]}
+
+Users are referenced by username and must be on an earlier line, or the same batch, than the
+records referencing them. Every batch is written with `bulk_create` in one transaction which also
+stores the checkpoint, so an interrupted import resumes after the last committed batch.
+The bulk inserts skip the model signals, the counters, friend edges, timelines and cache
+generations are maintained here.
+"""
+import json
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import transaction
+
+from posts.feed import is_fanned_out_on_read
+from posts.models import Comment, Like, Post, TimelineEntry
+from users import graph
+from users.models import FriendEdge, FriendShip
+from users.signals import friendships_accepted
+from utilities.caching import bump_generation
+from utilities.models import ImportCheckpoint, bulk_insert
+
+User = get_user_model()
+
+USER = 'user'
+FRIENDSHIP = 'friendship'
+POST = 'post'
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+class Importer:
+    def __init__(self, name, batch_size=1000, workers=0, log=None):
+        self.name = name
+        self.batch_size = batch_size
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.stats = Counter()
+        self.pool = None
+
+    def run(self, lines, restart=False):
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=self.name)
+        if restart:
+            checkpoint.line = 0
+        start = checkpoint.line
+        if start:
+            self.log(f"resuming after line {start}")
+
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup)
+        try:
+            batch = []
+            for number, line in enumerate(lines, 1):
+                if number <= start or not line.strip():
+                    continue
+                batch.append((number, line))
+                if len(batch) >= self.batch_size:
+                    self.load_batch(batch, checkpoint)
+                    batch = []
+            if batch:
+                self.load_batch(batch, checkpoint)
+        finally:
+            if self.pool:
+                self.pool.shutdown()
+        return self.stats
+
+    def error(self, number, message):
+        self.stats['errors'] += 1
+        self.log(f"line {number}: {message}")
+
+    def parse(self, batch):
+        records = defaultdict(list)
+        for number, line in batch:
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or record.get('type') not in (USER, FRIENDSHIP, POST):
+                    raise InvalidRecord("unknown record type")
+                records[record['type']].append((number, record))
+            except (ValueError, InvalidRecord) as error:
+                self.error(number, error)
+        return records
+
+    def hash_passwords(self, passwords):
+        """Hashes the plain passwords on the process pool, the hasher is CPU bound."""
+        if not self.pool:
+            return [make_password(password) for password in passwords]
+        chunk_size = max(1, len(passwords) // (self.workers * 4))
+        return list(self.pool.map(make_password, passwords, chunksize=chunk_size))
+
+    def load_batch(self, batch, checkpoint):
+        records = self.parse(batch)
+        users = self.prepare_users(records[USER])
+        with transaction.atomic():
+            self.load_users(users)
+            user_ids = self.resolve_users(records)
+            accepted = self.load_friendships(records[FRIENDSHIP], user_ids)
+            self.load_posts(records[POST], user_ids)
+            if accepted:
+                friendships_accepted.send(sender=FriendShip, pairs=accepted)
+            checkpoint.line = batch[-1][0]
+            checkpoint.save(update_fields=['line', 'modified_at', ])
+
+        for model in (User, FriendShip, Post, Comment, Like, TimelineEntry):
+            bump_generation(model)
+        self.log(f"line {checkpoint.line}: {dict(self.stats)}")
+
+    def prepare_users(self, records):
+        users = OrderedDict()
+        plain = []
+        for number, record in records:
+            username = record.get('username')
+            if not username or username in users:
+                self.error(number, "missing or duplicated username")
+                continue
+            user = User(username=username, email=record.get('email'),
+                        first_name=record.get('first_name', ''), last_name=record.get('last_name', ''))
+            if record.get('password_hash'):
+                try:
+                    identify_hasher(record['password_hash'])
+                except ValueError:
+                    self.error(number, "unknown password hash algorithm")
+                    continue
+                user.password = record['password_hash']
+            elif record.get('password'):
+                plain.append((user, record['password']))
+            else:
+                user.set_unusable_password()
+            users[username] = (number, user)
+
+        hashes = self.hash_passwords([password for user, password in plain])
+        for (user, password), encoded in zip(plain, hashes):
+            user.password = encoded
+        return users
+
+    def load_users(self, users):
+        existing = set(User.objects.filter(username__in=list(users)).values_list('username', flat=True))
+        for username in existing:
+            self.error(users[username][0], f"user {username} already exists")
+        new = [user for username, (number, user) in users.items() if username not in existing]
+        User.objects.bulk_create(new)
+        self.stats['users'] += len(new)
+
+    @staticmethod
+    def resolve_users(records):
+        usernames = set()
+        for number, record in records[FRIENDSHIP]:
+            usernames.update([record.get('sender'), record.get('receiver')])
+        for number, record in records[POST]:
+            usernames.add(record.get('user'))
+            usernames.update(comment.get('user') for comment in record.get('comments', []))
+            usernames.update(record.get('likes', []))
+        usernames.discard(None)
+        return dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+    def load_friendships(self, records, user_ids):
+        pairs = OrderedDict()
+        for number, record in records:
+            sender_id, receiver_id = user_ids.get(record.get('sender')), user_ids.get(record.get('receiver'))
+            status = record.get('status', FriendShip.WAITING)
+            if sender_id is None or receiver_id is None or sender_id == receiver_id:
+                self.error(number, "unknown users")
+            elif status not in (FriendShip.WAITING, FriendShip.ACCEPTED):
+                self.error(number, f"unknown status {status}")
+            elif (sender_id, receiver_id) in pairs:
+                self.error(number, "duplicated friendship")
+            else:
+                pairs[(sender_id, receiver_id)] = (number, status)
+
+        existing = set(FriendShip.objects.filter(
+            sender_id__in={sender_id for sender_id, receiver_id in pairs},
+            receiver_id__in={receiver_id for sender_id, receiver_id in pairs},
+        ).values_list('sender_id', 'receiver_id'))
+        for pair in existing & set(pairs):
+            self.error(pairs.pop(pair)[0], "friendship already exists")
+
+        FriendShip.objects.bulk_create(
+            [FriendShip(sender_id=sender_id, receiver_id=receiver_id, status=status)
+             for (sender_id, receiver_id), (number, status) in pairs.items()],
+        )
+        self.stats['friendships'] += len(pairs)
+        accepted = [pair for pair, (number, status) in pairs.items() if status == FriendShip.ACCEPTED]
+        if accepted:
+            graph.link_many(accepted)
+        return accepted
+
+    def load_posts(self, records, user_ids):
+        posts, comments, likes = [], [], []
+        for number, record in records:
+            author_id = user_ids.get(record.get('user'))
+            if author_id is None or not record.get('text'):
+                self.error(number, "unknown user or missing text")
+                continue
+            post_comments = [
+                (user_ids[comment['user']], comment['text']) for comment in record.get('comments', [])
+                if comment.get('user') in user_ids and comment.get('text')
+            ]
+            likers = {user_ids[username] for username in record.get('likes', []) if username in user_ids}
+            post = Post(user_id=author_id, text=record['text'], is_draft=bool(record.get('is_draft')),
+                        likes_count=len(likers), comments_count=len(post_comments))
+            posts.append(post)
+            comments.append(post_comments)
+            likes.append(likers)
+
+        bulk_insert(Post, posts)
+        Comment.objects.bulk_create(
+            [Comment(post_id=post.pk, user_id=user_id, text=text)
+             for post, post_comments in zip(posts, comments) for user_id, text in post_comments],
+        )
+        Like.objects.bulk_create(
+            [Like(post_id=post.pk, user_id=user_id) for post, likers in zip(posts, likes) for user_id in likers],
+        )
+        self.fan_out([post for post in posts if not post.is_draft])
+        self.stats['posts'] += len(posts)
+        self.stats['comments'] += sum(len(post_comments) for post_comments in comments)
+        self.stats['likes'] += sum(len(likers) for likers in likes)
+
+    def fan_out(self, posts):
+        friends = defaultdict(set)
+        edges = FriendEdge.objects.filter(user_id__in={post.user_id for post in posts})
+        for user_id, friend_id in edges.values_list('user_id', 'friend_id'):
+            friends[user_id].add(friend_id)
+        entries = []
+        for post in posts:
+            receivers = {post.user_id}
+            if not is_fanned_out_on_read(len(friends[post.user_id])):
+                receivers |= friends[post.user_id]
+            entries.extend(TimelineEntry(user_id=user_id, post_id=post.pk) for user_id in receivers)
+        TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
@@ -0,0 +1,118 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from utilities.benchmark import (
+    DEFAULT_DATASET, compare, dumps, environment, run_benchmark, run_concurrency_benchmark, run_login_benchmark,
+    run_serializer_benchmark, run_write_benchmark, seed_dataset
+)
+from utilities.cache_backends import throwaway_cache_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset into a throwaway test database and measure latency percentiles, "
+        "throughput and query counts of the v1 API endpoints, the report is printed as JSON."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_DATASET.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default)
+        parser.add_argument('--iterations', type=int, default=50, help="Measured requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per endpoint.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', help="Endpoints to run, all of them by default.")
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Also measure the endpoints answered from the response cache.")
+        parser.add_argument('--login-concurrency', type=int, default=0,
+                            help="Also measure logins/sec with this many concurrent clients.")
+        parser.add_argument('--login-requests', type=int, default=100)
+        parser.add_argument('--concurrency-clients', type=int, default=0,
+                            help="Also compare WSGI and ASGI serving this many slow clients.")
+        parser.add_argument('--concurrency-threads', type=int, default=4,
+                            help="WSGI workers / ASGI handler threads of the concurrency comparison.")
+        parser.add_argument('--concurrency-requests', type=int, default=200)
+        parser.add_argument('--client-delay-ms', type=float, default=50,
+                            help="Time a slow client takes to send its request, and again to read the response.")
+        parser.add_argument('--write-concurrency', type=int, default=0,
+                            help="Also compare the SQLite journal modes with this many concurrent writers.")
+        parser.add_argument('--write-readers', type=int, default=4,
+                            help="Clients listing posts during the write comparison.")
+        parser.add_argument('--write-requests', type=int, default=200)
+        parser.add_argument('--serializer-rows', type=int, default=0,
+                            help="Also compare the regular and compact serializers on lists of this many objects.")
+        parser.add_argument('--serializer-iterations', type=int, default=20)
+        parser.add_argument('--output', help="Write the report to this file instead of stdout.")
+        parser.add_argument('--compare', help="Previous report to print the relative changes against.")
+
+    def execute(self, *args, **options):
+        # the benchmark clears the cache, it gets one of its own like the tests
+        with throwaway_cache_settings():
+            return super(Command, self).execute(*args, **options)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = seed_dataset(
+                seed=options['seed'], **{name: options[name] for name in DEFAULT_DATASET}
+            )
+            endpoints = run_benchmark(
+                dataset, iterations=options['iterations'], warmup=options['warmup'],
+                only=options['only'], seed=options['seed'],
+            )
+            cached_endpoints = None
+            if options['response_cache']:
+                cached_endpoints = run_benchmark(
+                    dataset, iterations=options['iterations'], warmup=options['warmup'],
+                    only=options['only'], seed=options['seed'], response_cache=True,
+                )
+            logins = None
+            if options['login_concurrency']:
+                logins = run_login_benchmark(
+                    dataset, concurrency=options['login_concurrency'], requests=options['login_requests'],
+                    seed=options['seed'],
+                )
+            concurrency = None
+            if options['concurrency_clients']:
+                concurrency = run_concurrency_benchmark(
+                    dataset, clients=options['concurrency_clients'], threads=options['concurrency_threads'],
+                    requests=options['concurrency_requests'], client_delay=options['client_delay_ms'] / 1000,
+                    seed=options['seed'],
+                )
+            writes = None
+            if options['write_concurrency'] and connection.vendor == 'sqlite':
+                writes = run_write_benchmark(
+                    dataset, writers=options['write_concurrency'], readers=options['write_readers'],
+                    requests=options['write_requests'], seed=options['seed'],
+                )
+            serializers = None
+            if options['serializer_rows']:
+                serializers = run_serializer_benchmark(
+                    dataset, rows=options['serializer_rows'], iterations=options['serializer_iterations'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        dataset.pop('usernames')
+        report = {'environment': environment(), 'dataset': dataset, 'endpoints': endpoints}
+        if cached_endpoints:
+            report['cached_endpoints'] = cached_endpoints
+        if logins:
+            report['logins'] = logins
+        if concurrency:
+            report['concurrency'] = concurrency
+        if writes:
+            report['write_concurrency'] = writes
+        if serializers:
+            report['serializers'] = serializers
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                report['changes_percent'] = compare(json.load(baseline), report)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(dumps(report))
+            self.stdout.write(self.style.SUCCESS(f"report written to {options['output']}."))
+        else:
+            self.stdout.write(dumps(report))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.exports import comments_export, posts_export
+from users.exports import users_export
+from utilities.export import EXPORT_FORMATS, NDJSON, export_lines
+
+EXPORTS = {export.name: export for export in [posts_export, comments_export, users_export]}
+
+
+class Command(BaseCommand):
+    help = "Stream every row of an exported table as NDJSON or CSV, in keyset chunks with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=list(EXPORTS))
+        parser.add_argument('--export-format', choices=list(EXPORT_FORMATS), default=NDJSON)
+        parser.add_argument('--chunk-size', type=int, help="Rows per chunk, EXPORT_CHUNK_SIZE by default.")
+        parser.add_argument('--output', help="Write the rows to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        rows = EXPORTS[options['resource']].rows(chunk_size=options['chunk_size'])
+        lines = export_lines(rows, options['export_format'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"{options['resource']} exported to {options['output']}."))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
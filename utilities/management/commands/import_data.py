@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from utilities.importer import Importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users, friendships, posts, comments and likes from a JSONL file in batched transactions, "
+        "an interrupted import resumes after its last committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSONL file, one record per line.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Lines written per transaction.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes hashing the plain text passwords, 1 hashes in this process.")
+        parser.add_argument('--name', help="Checkpoint name, the absolute input path by default.")
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over.")
+
+    def handle(self, *args, **options):
+        importer = Importer(
+            name=options['name'] or os.path.abspath(options['path']),
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            log=lambda message: self.stderr.write(message),
+        )
+        with open(options['path']) as lines:
+            stats = importer.run(lines, restart=options['restart'])
+        names = ['users', 'friendships', 'posts', 'comments', 'likes', 'errors', ]
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{name}: {stats[name]}' for name in names)))
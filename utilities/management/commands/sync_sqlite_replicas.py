@@ -0,0 +1,27 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the replica files, the stand-in for replication in development."
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("the primary database isn't SQLite, its replicas are kept up to date by the server")
+        primary.ensure_connection()
+        for alias in settings.DB_REPLICA_ALIASES:
+            name = connections[alias].settings_dict['NAME']
+            if name == primary.settings_dict['NAME']:
+                # a test mirror of the primary
+                continue
+            connections[alias].close()
+            target = sqlite3.connect(name)
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stderr.write(self.style.SUCCESS(f"{alias} ({name}) synced."))
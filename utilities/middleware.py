@@ -0,0 +1,209 @@
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from utilities.caching import make_key
+from utilities.routers import routing
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200]
+
+PLACEHOLDERS_RE = re.compile(r'%s(\s*,\s*%s)+')
+
+
+def sql_template(sql):
+    """Collapses the variable length placeholder lists so `IN (...)` queries share a template."""
+    return PLACEHOLDERS_RE.sub('%s, ...', sql)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [f'le_{bucket}' for bucket in self.buckets] + ['inf']
+        return {'sum': round(self.total, 3), 'buckets': dict(zip(labels, self.counts))}
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.render_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.response_bytes = 0
+        self.n_plus_one = Counter()
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'total_ms': self.total_ms.as_dict(),
+            'db_ms': self.db_ms.as_dict(),
+            'render_ms': self.render_ms.as_dict(),
+            'queries': self.queries.as_dict(),
+            'response_bytes': self.response_bytes,
+            'n_plus_one': [
+                {'sql': template, 'requests': count} for template, count in self.n_plus_one.most_common(10)
+            ],
+        }
+
+
+class RequestMetrics:
+    """In-process aggregation of the request measurements per view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view_name, total_ms, db_ms, render_ms, queries, response_bytes, repeated_templates):
+        with self.lock:
+            metrics = self.views.setdefault(view_name, ViewMetrics())
+            metrics.requests += 1
+            metrics.total_ms.add(total_ms)
+            metrics.db_ms.add(db_ms)
+            metrics.render_ms.add(render_ms)
+            metrics.queries.add(queries)
+            metrics.response_bytes += response_bytes or 0
+            metrics.n_plus_one.update(repeated_templates)
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            data = {view_name: metrics.as_dict() for view_name, metrics in sorted(self.views.items())}
+            if reset:
+                self.views = {}
+        return data
+
+
+request_metrics = RequestMetrics()
+
+
+class QueryRecorder:
+    """`execute_wrapper` counting the queries, their time and their SQL templates."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.templates[sql_template(sql)] += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures the SQL queries, database time, response rendering time and response size of every
+    request, sends them back in a `Server-Timing` header with `REQUEST_METRICS_SERVER_TIMING` and
+    aggregates them per view in `request_metrics`. SQL templates repeated more than
+    `REQUEST_METRICS_N_PLUS_ONE_THRESHOLD` times in one request are logged as N+1 patterns.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._metrics_render = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else 'unresolved'
+        threshold = settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD
+        repeated = [template for template, count in recorder.templates.items() if count > threshold]
+        for template in repeated:
+            logger.warning(
+                "N+1 query pattern in %s: %d executions of %s",
+                view_name, recorder.templates[template], template[:300]
+            )
+
+        response_bytes = None if response.streaming else len(response.content)
+        request_metrics.record(
+            view_name,
+            total_ms=total * 1000,
+            db_ms=recorder.duration * 1000,
+            render_ms=request._metrics_render * 1000,
+            queries=recorder.count,
+            response_bytes=response_bytes,
+            repeated_templates=repeated,
+        )
+
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"',
+                f'render;dur={request._metrics_render * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ])
+        return response
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sends the reads of safe-method requests to one of the `DB_REPLICA_ALIASES`. A client which
+    wrote (any other method) is pinned to the primary for `DB_REPLICA_STICKY_SECONDS`, so it reads
+    its own writes while the replicas catch up, the cached values included (see
+    `get_or_compute`). Clients are told apart by their Authorization header or session
+    cookie, the pins live in the shared cache.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def pin_key(request):
+        credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        return make_key('replica_pin', credentials) if credentials else None
+
+    def __call__(self, request):
+        if not settings.DB_REPLICA_ALIASES:
+            return self.get_response(request)
+
+        key = self.pin_key(request)
+        routing.pinned = bool(key and cache.get(key))
+        if request.method in SAFE_METHODS and not routing.pinned:
+            routing.replica = random.choice(settings.DB_REPLICA_ALIASES)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset()
+
+        if request.method not in SAFE_METHODS and key:
+            cache.set(key, True, settings.DB_REPLICA_STICKY_SECONDS)
+        return response
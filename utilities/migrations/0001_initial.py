@@ -0,0 +1,28 @@
+# Generated by Django 2.2.24 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='modified at')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='name')),
+                ('line', models.PositiveIntegerField(default=0, verbose_name='last imported line')),
+            ],
+            options={
+                'verbose_name': 'import checkpoint',
+                'verbose_name_plural': 'import checkpoints',
+            },
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models, router
 from django.utils.translation import gettext_lazy as _
 
 
@@ -14,3 +14,72 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+def bulk_insert(model, objects, batch_size=None):
+    """
+    `bulk_create` that also sets the primary keys of the created objects. Backends which can't
+    return them (SQLite) hold the write lock once the INSERT ran, so inside the caller's
+    transaction the newest rows of the table are the ones just inserted.
+    """
+    objects = model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is None:
+        pks = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objects)]
+        for instance, pk in zip(objects, reversed(list(pks))):
+            instance.pk = pk
+    return objects
+
+
+def bulk_delete(model, pks, batch_size=500):
+    """
+    Deletes the rows of the given primary keys with one DELETE per batch and returns how many
+    were deleted. Like `bulk_create` it skips the model signals and cascades, which the caller
+    maintains itself.
+    """
+    pks = list(pks)
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    deleted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(batch))})', batch)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def delete_where(model, **values):
+    """
+    Deletes the rows whose fields equal the given values with a single DELETE and returns how many
+    were deleted, skipping the model signals and cascades like `bulk_delete`.
+    """
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = [connection.ops.quote_name(model._meta.get_field(name).column) for name in values]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {" AND ".join(f"{column} = %s" for column in columns)}',
+            list(values.values())
+        )
+        return cursor.rowcount
+
+
+class ImportCheckpoint(BaseModel):
+    """Last input line committed by an `import_data` run, updated in the transaction of every batch."""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name=_("name")
+    )
+    line = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("last imported line")
+    )
+
+    class Meta:
+        verbose_name = _("import checkpoint")
+        verbose_name_plural = _("import checkpoints")
+
+    def __str__(self):
+        return f'{self.name} - {self.line}'
@@ -1,17 +1,206 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from utilities.caching import get_generations, get_or_compute, make_key, tables_in, untracked_tables_in
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner row estimate of a queryset, or None when the database can't
+    give one cheaply (SQLite only keeps `ANALYZE` statistics for whole tables).
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+        if connection.vendor == 'sqlite' and not queryset.query.where:
+            try:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx IS NULL',
+                    [queryset.model._meta.db_table]
+                )
+            except Exception:
+                return None
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator caching its total per normalized query, the cache key follows the write
+    generations of the tables the query reads so any write to them invalidates it, the counts
+    of queries reading a table whose writes aren't tracked are never cached.
+    Above `PAGINATION_ESTIMATED_COUNT_THRESHOLD` rows the planner estimate is used instead.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return len(queryset)
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        if untracked_tables_in(sql):
+            return self.compute_count(queryset)
+        generations = get_generations(tables_in(sql))
+        key = make_key('pagination_count', queryset.db, sql, params, sorted(generations.items()))
+        return get_or_compute(
+            key, lambda: self.compute_count(queryset), timeout=getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 60)
+        )
+
+    def compute_count(self, queryset):
+        threshold = getattr(settings, 'PAGINATION_ESTIMATED_COUNT_THRESHOLD', 0)
+        if threshold:
+            estimated = estimate_count(queryset)
+            if estimated is not None and estimated >= threshold:
+                return estimated
+        return queryset.count()
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor pagination keyed on `(created_at, id)`, newest first.
+    Every page is a single indexed range query, no COUNT and no OFFSET.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, created_at, pk = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p') or created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction, created_at, pk
+
+    def encode_cursor(self, direction, instance):
+        if isinstance(instance, dict):
+            # a `values()` row of the compact serializers
+            created_at, pk = instance['created_at'], instance['id']
+        else:
+            created_at, pk = instance.created_at, instance.pk
+        raw = f'{direction}|{created_at.isoformat()}|{pk}'
+        encoded = urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        queryset = queryset.order_by('-created_at', '-id')
+
+        if cursor is None:
+            self.is_reversed = False
+        else:
+            direction, created_at, pk = cursor
+            self.is_reversed = direction == 'p'
+            if self.is_reversed:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                ).reverse()
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.is_reversed:
+            results.reverse()
+
+        self.page = results
+        self.has_next = has_more if not self.is_reversed else True
+        self.has_previous = has_more if self.is_reversed else cursor is not None
+        return results
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor('n', self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor('p', self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", None),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("pages_number", None),
+                    ("results", data),
+                ]
+            )
+        )
 
 
 class CustomPagination(pagination.PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
+    page_size_query_param = 'page_size'
+    pagination_query_param = 'pagination'
+    # the keyset cursor only pages in its own order, not in these
+    ordering_query_params = [api_settings.ORDERING_PARAM, api_settings.SEARCH_PARAM, ]
+    invalid_ordering_message = _('The cursor pagination can not be combined with ordering or search.')
+    keyset = None
+
+    def use_keyset(self, request):
+        params = request.query_params
+        mode = params.get(self.pagination_query_param)
+        requested = mode == 'cursor' or KeysetPagination.cursor_query_param in params
+        if not requested and (mode or getattr(settings, 'PAGINATION_MODE', 'page')) != 'cursor':
+            return False
+        ordered_by = [param for param in self.ordering_query_params if param in params]
+        if ordered_by:
+            if requested:
+                raise ValidationError({param: [self.invalid_ordering_message] for param in ordered_by})
+            # the default cursor mode falls back to pages
+            return False
+        return True
 
     def paginate_queryset(self, queryset, request, view=None):
-        self.page_size = request.query_params.get("page_size", self.page_size)
+        self.max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', None)
+        if self.use_keyset(request):
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view=view)
         return super(CustomPagination, self).paginate_queryset(
             queryset, request, view=None
         )
 
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
         return Response(
             OrderedDict(
                 [
@@ -23,3 +212,10 @@ class CustomPagination(pagination.PageNumberPagination):
                 ]
             )
         )
+
+
+class CustomKeysetPagination(CustomPagination):
+    """CustomPagination always paging with the keyset cursor."""
+
+    def use_keyset(self, request):
+        return True
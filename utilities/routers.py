@@ -0,0 +1,51 @@
+"""
+Primary / replica routing. `ReplicaRoutingMiddleware` picks the replica the current request reads
+from, everything else reads from the primary: writes, transactions, the rest of a request after
+its first write, management commands and job workers.
+"""
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState(threading.local):
+    # alias of the replica the request running in this thread reads from, None for the primary
+    replica = None
+    # whether the request read from a replica, its responses may be stale and aren't cached
+    read_replica = False
+    # whether the client wrote recently, its reads skip the replicas and the cached responses
+    pinned = False
+
+    def reset(self):
+        self.replica = None
+        self.read_replica = False
+        self.pinned = False
+
+
+routing = RoutingState()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = routing.replica
+        if replica is None or model._meta.label_lower in settings.DB_PRIMARY_READ_MODELS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # reads inside a transaction see its writes
+            return DEFAULT_DB_ALIAS
+        routing.read_replica = True
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # the rest of the request reads its own write
+        routing.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas get their schema from the primary
+        return db not in settings.DB_REPLICA_ALIASES
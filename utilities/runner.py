@@ -0,0 +1,16 @@
+from django.test.runner import DiscoverRunner
+
+from utilities.cache_backends import throwaway_cache_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests against a shared cache of their own, see `throwaway_cache_settings`."""
+
+    def setup_test_environment(self, **kwargs):
+        super(TestRunner, self).setup_test_environment(**kwargs)
+        self.cache_settings = throwaway_cache_settings()
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        super(TestRunner, self).teardown_test_environment(**kwargs)
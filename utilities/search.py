@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from rest_framework.filters import SearchFilter
+
+
+class SearchBackend:
+    """
+    Full-text index of some text columns of a table, `install` creates the index
+    structures (kept in sync with the table writes by the database itself),
+    `search` filters a queryset to the matching rows and annotates `search_rank`
+    (lower is more relevant).
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self, table, fields):
+        raise NotImplementedError
+
+    def uninstall(self, table, fields):
+        raise NotImplementedError
+
+    def rebuild(self, table, fields):
+        raise NotImplementedError
+
+    def search(self, queryset, fields, term):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 external content table per indexed table, synced by triggers."""
+
+    @staticmethod
+    def fts_table(table):
+        return f'{table}_fts'
+
+    @staticmethod
+    def match_expression(term):
+        tokens = ['"%s"' % token.replace('"', '""') for token in term.split()]
+        return ' '.join(tokens) + '*'
+
+    def install(self, table, fields):
+        fts = self.fts_table(table)
+        columns = ', '.join(fields)
+        new_values = ', '.join(f'new.{field}' for field in fields)
+        old_values = ', '.join(f'old.{field}' for field in fields)
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{columns}, content='{table}', content_rowid='id', tokenize='unicode61')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        ]
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def uninstall(self, table, fields):
+        fts = self.fts_table(table)
+        with self.connection.cursor() as cursor:
+            for trigger in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+    def rebuild(self, table, fields):
+        fts = self.fts_table(table)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def search(self, queryset, fields, term):
+        table = queryset.model._meta.db_table
+        fts = self.fts_table(table)
+        return queryset.extra(
+            select={'search_rank': f'"{fts}".rank'},
+            tables=[fts],
+            where=[f'"{fts}" MATCH %s', f'"{fts}".rowid = "{table}"."id"'],
+            params=[self.match_expression(term)],
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """GIN index over the `tsvector` of the fields, maintained by Postgres on every write."""
+    config = 'simple'
+
+    def document(self, table, fields):
+        columns = " || ' ' || ".join(f'''coalesce("{table}"."{field}", '')''' for field in fields)
+        return f"to_tsvector('{self.config}', {columns})"
+
+    def install(self, table, fields):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_search ON "{table}" USING GIN ({self.document(table, fields)})'
+            )
+
+    def uninstall(self, table, fields):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX IF EXISTS {table}_search')
+
+    def rebuild(self, table, fields):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {table}_search')
+
+    def search(self, queryset, fields, term):
+        document = self.document(queryset.model._meta.db_table, fields)
+        query = f"plainto_tsquery('{self.config}', %s)"
+        return queryset.extra(
+            select={'search_rank': f'-ts_rank({document}, {query})'},
+            select_params=[term],
+            where=[f'{document} @@ {query}'],
+            params=[term],
+        )
+
+
+class ContainsSearchBackend(SearchBackend):
+    """Unindexed `icontains` fallback for the other databases."""
+
+    def install(self, table, fields):
+        pass
+
+    def uninstall(self, table, fields):
+        pass
+
+    def rebuild(self, table, fields):
+        pass
+
+    def search(self, queryset, fields, term):
+        for token in term.split():
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{f'{field}__icontains': token})
+            queryset = queryset.filter(condition)
+        return queryset.extra(select={'search_rank': '0'})
+
+
+SEARCH_BACKENDS = {
+    'sqlite': 'utilities.search.SQLiteSearchBackend',
+    'postgresql': 'utilities.search.PostgresSearchBackend',
+}
+
+
+def get_search_backend(connection=None):
+    connection = connection or connections['default']
+    path = getattr(settings, 'SEARCH_BACKEND', None) or SEARCH_BACKENDS.get(
+        connection.vendor, 'utilities.search.ContainsSearchBackend'
+    )
+    return import_string(path)(connection)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    `search` query parameter backed by the full-text index of the view `search_fields`,
+    results are ordered by relevance unless an explicit ordering is requested.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        term = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not search_fields or not term:
+            return queryset
+
+        backend = get_search_backend(connections[queryset.db])
+        return backend.search(queryset, search_fields, term).order_by('search_rank', '-created_at')
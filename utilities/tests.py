@@ -0,0 +1,483 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from posts.models import Attachment, Post, TimelineEntry
+from users import graph
+from users.models import FriendShip
+from utilities.asgi import AsgiHandler
+from utilities.benchmark import run_benchmark, run_serializer_benchmark, seed_dataset
+from utilities.caching import cache_stats, get_or_compute
+from utilities.checks import check_shared_cache
+from utilities.compact import CompactSerializer
+from utilities.db import check_connections
+from utilities.middleware import request_metrics
+from utilities.routers import PrimaryReplicaRouter, routing
+
+User = get_user_model()
+
+
+class BenchmarkTest(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_seed_and_run(self):
+        dataset = seed_dataset(
+            users=6, friends_per_user=2, posts_per_user=2, comments_per_post=1, likes_per_post=2,
+            attachments_per_post=1,
+        )
+        self.assertEqual(dataset['posts'], 12)
+        self.assertEqual(Post.objects.filter(likes_count=2, comments_count=1).count(), 12)
+
+        results = run_benchmark(dataset, iterations=2, warmup=1)
+        self.assertIn('login', results)
+        self.assertEqual(results['posts-list']['requests'], 2)
+        # the measured requests reach the database, not the response cache
+        self.assertGreater(results['posts-list']['queries_mean'], 0)
+        self.assertGreater(results['comments-list']['queries_mean'], 0)
+
+        serializers = run_serializer_benchmark(dataset, rows=5, iterations=1)
+        self.assertEqual(serializers['posts']['compact']['objects'], 5)
+        self.assertEqual(serializers['friendships']['regular']['objects'], 5)
+
+
+class RequestMetricsTest(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        request_metrics.snapshot(reset=True)
+        self.admin = User.objects.create_superuser(username='admin_metrics', email='a@example.com', password='x')
+        self.client.force_authenticate(self.admin)
+
+    def test_server_timing_and_aggregation(self):
+        self.assertFalse(self.client.get(reverse('posts:posts-list')).has_header('Server-Timing'))
+        request_metrics.snapshot(reset=True)
+        cache.clear()
+        with self.assertLogs('utilities.middleware', level='WARNING'), \
+                self.settings(REQUEST_METRICS_N_PLUS_ONE_THRESHOLD=0, REQUEST_METRICS_SERVER_TIMING=True):
+            response = self.client.get(reverse('posts:posts-list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+
+        metrics = self.client.get(reverse('request-metrics'), data={'reset': 'true'}).json()
+        self.assertEqual(metrics['posts:posts-list']['requests'], 1)
+        self.assertTrue(metrics['posts:posts-list']['n_plus_one'])
+        self.assertEqual(list(request_metrics.snapshot()), ['request-metrics'])
+
+    def test_metrics_are_admin_only(self):
+        user = User.objects.create_user(username='not_admin', password='x')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(reverse('request-metrics')).status_code, 403)
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_local_tier_serves_unchanged_values(self):
+        cache.set('response:a', {'id': 1}, 60)
+        cache.set('generation:a', 1, 60)
+        caches['shared'].clear()
+        self.assertEqual(cache.get('response:a'), {'id': 1})
+        self.assertIsNone(cache.get('generation:a'))
+
+        cache.delete('response:a')
+        self.assertIsNone(cache.get('response:a'))
+
+    def test_single_flight(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute('flight', compute, timeout=60)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_waiters_stop_once_the_lock_is_released(self):
+        def fail():
+            time.sleep(0.2)
+            raise ValueError("compute failed")
+
+        failing = threading.Thread(target=lambda: self.assertRaises(ValueError, get_or_compute, 'failing', fail, 60))
+        failing.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        self.assertEqual(get_or_compute('failing', lambda: 'value', timeout=60, lock_timeout=5), 'value')
+        failing.join()
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_negative_caching(self):
+        calls = []
+        before = cache_stats.snapshot().get('negative_hits', 0)
+        for _ in range(3):
+            self.assertIsNone(get_or_compute('missing', lambda: calls.append(1), timeout=60, negative_timeout=60))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache_stats.snapshot()['negative_hits'], before + 2)
+
+    def test_early_expiry(self):
+        get_or_compute('early', lambda: time.sleep(0.01) or 1, timeout=60)
+        self.assertEqual(get_or_compute('early', lambda: 2, timeout=60, beta=0), 1)
+        self.assertEqual(get_or_compute('early', lambda: 2, timeout=60, beta=10 ** 9), 2)
+
+    def test_shared_cache_isolation_and_atomicity_check(self):
+        self.assertEqual(os.path.basename(caches['shared']._dir), 'test')
+        self.assertGreater(caches['shared']._max_entries, 300)
+        self.assertEqual(check_shared_cache(None), [])
+        with self.settings(CACHE_REQUIRE_ATOMIC=True):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['utilities.E001'])
+
+
+class ImportDataTest(APITestCase):
+    records = [
+        {'type': 'user', 'username': 'import_alice', 'email': 'alice@example.com', 'password': 'Alice-123'},
+        {'type': 'user', 'username': 'import_bob', 'password_hash': make_password('Bob-123')},
+        {'type': 'user', 'username': 'import_carol'},
+        {'type': 'friendship', 'sender': 'import_alice', 'receiver': 'import_bob', 'status': 'accepted'},
+        {'type': 'friendship', 'sender': 'import_carol', 'receiver': 'import_alice'},
+        {'type': 'friendship', 'sender': 'import_alice', 'receiver': 'nobody'},
+        {'type': 'post', 'user': 'import_alice', 'text': "hello", 'likes': ['import_bob', 'import_carol'],
+         'comments': [{'user': 'import_bob', 'text': "hi"}]},
+        {'type': 'post', 'user': 'import_bob', 'text': "draft", 'is_draft': True},
+    ]
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'import.jsonl')
+        self.write(self.records)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write(self, records, mode='w'):
+        with open(self.path, mode) as output:
+            output.writelines(json.dumps(record) + '\n' for record in records)
+
+    def run_import(self, *args):
+        output, errors = StringIO(), StringIO()
+        call_command('import_data', self.path, '--batch-size', '4', *args, stdout=output, stderr=errors)
+        return output.getvalue()
+
+    def test_import(self):
+        self.assertIn(
+            'users: 3, friendships: 2, posts: 2, comments: 1, likes: 2, errors: 1', self.run_import('--workers', '2')
+        )
+
+        alice = User.objects.get(username='import_alice')
+        self.assertTrue(alice.check_password('Alice-123'))
+        self.assertTrue(User.objects.get(username='import_bob').check_password('Bob-123'))
+        self.assertFalse(User.objects.get(username='import_carol').has_usable_password())
+
+        post = Post.objects.get(text="hello")
+        self.assertEqual((post.likes_count, post.comments_count), (2, 1))
+        self.assertEqual(Post.repair_counters(), 0)
+        self.assertEqual(graph.friends_of(alice.pk), {User.objects.get(username='import_bob').pk})
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post=post).values_list('user__username', flat=True)),
+            {'import_alice', 'import_bob'}
+        )
+
+    def test_resume_after_the_checkpoint(self):
+        self.run_import('--workers', '1')
+        self.write([{'type': 'post', 'user': 'import_carol', 'text': "later"}], mode='a')
+        self.assertIn('users: 0, friendships: 0, posts: 1', self.run_import('--workers', '1'))
+        self.assertEqual(Post.objects.count(), 3)
+
+
+class AsgiHandlerTest(APITransactionTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(username='asgi_user', password='x')
+        self.token = Token.objects.create(user=self.user)
+        self.application = AsgiHandler(threads=2, read_threads=2)
+        self.addCleanup(self.application.shutdown)
+
+    def request(self, method, path, chunks=(b'',)):
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+            'headers': [(b'authorization', f'Token {self.token.key}'.encode()), (b'content-type', b'application/json')],
+        }
+        messages = [
+            {'type': 'http.request', 'body': chunk, 'more_body': index < len(chunks) - 1}
+            for index, chunk in enumerate(chunks)
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+    def test_requests_run_on_the_thread_pools(self):
+        status_code, body = self.request('POST', reverse('posts:posts-list'), [b'{"text": "sent in', b' two chunks"}'])
+        self.assertEqual(status_code, 201)
+        self.assertEqual(Post.objects.get().text, "sent in two chunks")
+
+        status_code, body = self.request('GET', reverse('posts:posts-list'))
+        self.assertEqual(status_code, 200)
+        self.assertEqual(json.loads(body)['results'][0]['text'], "sent in two chunks")
+        self.assertEqual(set(self.application.executors), {'default', 'read'})
+
+    def test_streaming_responses_are_drained_on_one_thread(self):
+        threads = []
+
+        class Response(StreamingHttpResponse):
+            def close(self):
+                threads.append(threading.current_thread())
+                super(Response, self).close()
+
+        def chunks():
+            for chunk in [b'a', b'b', b'c']:
+                threads.append(threading.current_thread())
+                yield chunk
+
+        def handler(environ, start_response):
+            response = Response(chunks())
+            start_response('200 OK', list(response.items()))
+            return response
+
+        with mock.patch.object(self.application, 'handler', handler):
+            status_code, body = self.request('GET', reverse('posts:posts-list'))
+        self.assertEqual((status_code, body), (200, b'abc'))
+        self.assertEqual(len(threads), 4)
+        self.assertEqual(len(set(threads)), 1)
+        self.assertTrue(threads[0].name.startswith('asgi-stream'))
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class DatabaseConfigurationTest(APITestCase):
+    def test_sqlite_pragmas_are_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            values = []
+            for pragma in ['journal_mode', 'synchronous', 'busy_timeout']:
+                cursor.execute(f'PRAGMA {pragma}')
+                values.append(cursor.fetchone()[0])
+        # synchronous=NORMAL reads back as 1
+        self.assertEqual(values, ['wal', 1, 5000])
+
+    def test_health_checks_close_dropped_connections(self):
+        dropped = mock.Mock(connection=object(), in_atomic_block=False, **{'is_usable.return_value': False})
+        healthy = mock.Mock(connection=object(), in_atomic_block=False, **{'is_usable.return_value': True})
+        with mock.patch('utilities.db.connections') as connections:
+            connections.all.return_value = [dropped, healthy]
+            check_connections()
+            with self.settings(DB_HEALTH_CHECKS=False):
+                check_connections()
+        dropped.close.assert_called_once_with()
+        healthy.close.assert_not_called()
+
+
+@override_settings(DB_REPLICA_ALIASES=['replica_test'])
+class ReplicaRoutingTest(APITransactionTestCase):
+    """A second SQLite file, refreshed by `sync_sqlite_replicas` only, stands in for a lagging replica."""
+    databases = {'default', 'replica_test'}
+
+    @classmethod
+    def setUpClass(cls):
+        descriptor, cls.replica_name = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(descriptor)
+        connections.databases['replica_test'] = dict(connections.databases['default'], NAME=cls.replica_name, TEST={})
+        super(ReplicaRoutingTest, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ReplicaRoutingTest, cls).tearDownClass()
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.databases['replica_test']
+        os.remove(cls.replica_name)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(username='replica_user', password='x')
+        self.other = User.objects.create_user(username='other_user', password='x')
+        self.post = Post.objects.create(user=self.user, text='synced')
+        self.token = Token.objects.create(user=self.user)
+        self.other_token = Token.objects.create(user=self.other)
+        call_command('sync_sqlite_replicas', stderr=StringIO())
+        # written on the primary after the last sync
+        self.unsynced = Post.objects.create(user=self.other, text='not replicated yet')
+
+    def get_post(self, post, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {token.key}')
+        return self.client.get(reverse('posts:posts-detail', kwargs={'pk': post.pk}))
+
+    def count_comments(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {token.key}')
+        return self.client.get(reverse('posts:comments-list'), {'post': self.post.pk}).json()['count']
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.get_post(self.post, self.token).status_code, 200)
+        self.assertEqual(self.get_post(self.unsynced, self.token).status_code, 404)
+        self.assertIsNone(routing.replica)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token.key}')
+        response = self.client.post(reverse('posts:posts-like_dislike', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.using('replica_test').get(pk=self.post.pk).likes_count, 0)
+
+        # the writer reads its own like and the unsynced post from the primary
+        self.assertEqual(self.get_post(self.post, self.token).json()['likes_count'], 1)
+        self.assertEqual(self.get_post(self.unsynced, self.token).status_code, 200)
+        # other clients keep reading from the replica
+        self.assertEqual(self.get_post(self.post, self.other_token).json()['likes_count'], 0)
+
+        with self.settings(DB_REPLICA_STICKY_SECONDS=0):
+            self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token.key}')
+            self.client.post(reverse('posts:posts-like_dislike', kwargs={'pk': self.post.pk}))
+        # the pin expired
+        self.assertEqual(self.get_post(self.unsynced, self.token).status_code, 404)
+
+        call_command('sync_sqlite_replicas', stderr=StringIO())
+        self.assertEqual(self.get_post(self.unsynced, self.other_token).status_code, 200)
+
+    def test_cache_keeps_the_writes_of_pinned_clients(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {self.token.key}')
+        response = self.client.post(reverse('posts:comments-list'), {'post': self.post.pk, 'text': 'first'})
+        self.assertEqual(response.status_code, 201)
+
+        # the other client reads the lagging replica, after the generation of comments was bumped
+        with self.settings(DB_REPLICA_CACHE_TIMEOUT=1):
+            self.assertEqual(self.count_comments(self.other_token), 0)
+            hits = cache_stats.snapshot().get('hits', 0)
+            self.assertEqual(self.count_comments(self.other_token), 0)
+        # the replica read is cached for the other clients, the writer skips it
+        self.assertEqual(cache_stats.snapshot().get('hits', 0), hits + 1)
+        self.assertEqual(self.count_comments(self.token), 1)
+
+        call_command('sync_sqlite_replicas', stderr=StringIO())
+        # until DB_REPLICA_CACHE_TIMEOUT
+        time.sleep(1.1)
+        self.assertEqual(self.count_comments(self.other_token), 1)
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        routing.replica = 'replica_test'
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica_test')
+            self.assertEqual(router.db_for_read(Token), 'default')
+            # after a write the request reads from the primary
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), 'default')
+        finally:
+            routing.replica = None
+        self.assertTrue(router.allow_migrate('default', 'posts'))
+        self.assertFalse(router.allow_migrate('replica_test', 'posts'))
+
+
+class CompactSerializerParityTest(APITestCase):
+    """The compact serializers render the same JSON as the regular ones, the fallbacks included."""
+
+    def setUp(self) -> None:
+        cache.clear()
+        dataset = seed_dataset(
+            users=6, friends_per_user=3, posts_per_user=3, comments_per_post=2, likes_per_post=3,
+            attachments_per_post=2,
+        )
+        # a receiver of friendships, for the friendships list
+        self.user = User.objects.get(pk=FriendShip.objects.order_by('pk').values_list('receiver', flat=True)[0])
+        User.objects.filter(username=dataset['usernames'][1]).update(
+            personal_image='users/aa/image.jpg', personal_image_hash='a' * 64, personal_image_has_variants=True,
+        )
+        attachment = Attachment.objects.order_by('pk').first()
+        Attachment.objects.filter(pk=attachment.pk).update(content_hash='b' * 64, has_variants=True)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f' Token {token.key}')
+
+    def assertSameResponses(self, url, params=None, fallback=False):
+        responses = []
+        for compact in (False, True):
+            with self.settings(COMPACT_SERIALIZERS=compact, RESPONSE_CACHE_ENABLED=False), mock.patch.object(
+                CompactSerializer, 'serialize', autospec=True, side_effect=CompactSerializer.serialize
+            ) as serialize:
+                responses.append(self.client.get(url, params or {}))
+        regular, compact = responses
+        self.assertEqual(serialize.called, not fallback, (url, params))
+        self.assertEqual(compact.status_code, regular.status_code, (url, params, regular.content))
+        self.assertEqual(compact.content, regular.content, (url, params))
+        return regular
+
+    def test_posts(self):
+        url = reverse('posts:posts-list')
+        posts = self.assertSameResponses(url).json()['results']
+        self.assertEqual(len(posts), 18)
+        self.assertTrue(any(post['user']['personal_image_variants'] for post in posts))
+        self.assertTrue(any(attachment['variants'] for post in posts for attachment in post['post_attachments']))
+        for params in [
+            {'query': '{id, text, is_liked}'},
+            {'query': '{*}'},
+            {'query': '{id, post_attachments{id, variants}}'},
+            {'is_liked': 'true'},
+            {'pagination': 'cursor', 'page_size': 4},
+            {'search': 'a'},
+        ]:
+            self.assertSameResponses(url, params)
+        # served by PostSerializer: aliases, and the errors of the nested users rejecting the fields of posts
+        self.assertEqual(self.assertSameResponses(url, {'query': '{renamed: id}'}, fallback=True).status_code, 200)
+        for query in ['{id, user}', '{-post_attachments}', '{id']:
+            self.assertEqual(self.assertSameResponses(url, {'query': query}, fallback=True).status_code, 400)
+
+    def test_feed(self):
+        response = self.assertSameResponses(reverse('posts:feed-list'), {'page_size': 5})
+        self.assertSameResponses(response.json()['next'])
+
+    def test_comments(self):
+        url = reverse('posts:comments-list')
+        for params in [{}, {'query': '{id, username}'}, {'pagination': 'cursor'}]:
+            self.assertSameResponses(url, params)
+
+    def test_users(self):
+        url = reverse('users:users-list')
+        for params in [{}, {'query': '{id, username}'}, {'query': '{-email}'}, {'friends': 'true'}]:
+            self.assertSameResponses(url, params)
+
+    def test_friendships(self):
+        url = reverse('users:friendships-list')
+        self.assertTrue(self.assertSameResponses(url).json()['results'])
+        for params in [{'query': '{id, status}'}, {'status': 'accepted'}]:
+            self.assertSameResponses(url, params)
+        self.assertSameResponses(url, {'query': '{id, sender}'}, fallback=True)
@@ -0,0 +1,207 @@
+"""
+Upload pipeline: request bodies are streamed to a temporary file chunk by chunk while their sha256
+is computed, files are stored under a name derived from that hash so identical uploads share one
+stored file, and images get resized variants built by a background job once their row is
+committed. Until the variants exist the serializers only expose the original file.
+"""
+import hashlib
+import io
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import models
+from django.db.models.fields.files import FieldFile, ImageFieldFile
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps
+
+from jobs.tasks import task
+from utilities.caching import bump_generation
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Writes every upload to a temporary file and hashes its chunks on the way, nothing is kept in memory."""
+
+    def new_file(self, *args, **kwargs):
+        super(HashingUploadHandler, self).new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super(HashingUploadHandler, self).receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super(HashingUploadHandler, self).file_complete(file_size)
+        file.content_hash = self.sha256.hexdigest()
+        return file
+
+
+def content_hash(file):
+    """sha256 of a file, the one computed by `HashingUploadHandler` or read back chunk by chunk."""
+    digest = getattr(file, 'content_hash', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ContentAddressedFieldFileMixin:
+    def save(self, name, content, save=True):
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()[:8]
+        name = self.field.generate_filename(self.instance, f'{digest[:2]}/{digest}{extension}')
+        if not self.storage.exists(name):
+            self.name = self.storage.save(name, content, max_length=self.field.max_length)
+        else:
+            # the same content was uploaded before, point to the stored file
+            self.name = name
+        setattr(self.instance, self.field.name, self.name)
+        self._committed = True
+
+        setattr(self.instance, self.field.hash_field, digest)
+        if self.field.variants_field:
+            setattr(self.instance, self.field.variants_field, False)
+            setattr(self.instance, self.field.pending_attname, True)
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
+
+
+class ContentAddressedFieldFile(ContentAddressedFieldFileMixin, FieldFile):
+    pass
+
+
+class ContentAddressedImageFieldFile(ContentAddressedFieldFileMixin, ImageFieldFile):
+    pass
+
+
+class ContentAddressedFieldMixin:
+    """
+    Stores the files as `<upload_to>/<hash[:2]>/<hash><extension>` and the hash in `hash_field`.
+    With a `variants_field`, saving a new file queues the job building its resized variants,
+    which sets the boolean `variants_field` once they are available.
+    """
+
+    def __init__(self, *args, hash_field=None, variants_field=None, **kwargs):
+        self.hash_field = hash_field
+        self.variants_field = variants_field
+        super(ContentAddressedFieldMixin, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(ContentAddressedFieldMixin, self).deconstruct()
+        kwargs['hash_field'] = self.hash_field
+        if self.variants_field:
+            kwargs['variants_field'] = self.variants_field
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(ContentAddressedFieldMixin, self).contribute_to_class(cls, name, **kwargs)
+        self.pending_attname = f'_{name}_variants_pending'
+        if self.variants_field and not cls._meta.abstract:
+            post_save.connect(
+                self.schedule_variants, sender=cls, weak=False, dispatch_uid=f'{cls._meta.label}.{name}.variants'
+            )
+
+    def schedule_variants(self, sender, instance, **kwargs):
+        if instance.__dict__.pop(self.pending_attname, False):
+            # queued in the transaction saving the row, a worker sees both once it commits
+            build_field_variants.enqueue(
+                sender._meta.label, instance.pk, self.name,
+                dedup_key=f'variants:{sender._meta.label}:{instance.pk}:{self.name}',
+            )
+
+
+class ContentAddressedFileField(ContentAddressedFieldMixin, models.FileField):
+    attr_class = ContentAddressedFieldFile
+
+
+class ContentAddressedImageField(ContentAddressedFieldMixin, models.ImageField):
+    attr_class = ContentAddressedImageFieldFile
+
+
+def image_variants():
+    """The `IMAGE_VARIANTS` setting as `{name: (width, height)}`."""
+    variants = {}
+    for variant in settings.IMAGE_VARIANTS:
+        name, size = variant.split(':')
+        width, height = size.lower().split('x')
+        variants[name.strip()] = (int(width), int(height))
+    return variants
+
+
+def variant_name(digest, variant):
+    return f'variants/{digest[:2]}/{digest}/{variant}.jpg'
+
+
+def variant_urls(file, digest, ready, request=None):
+    """URLs of the variants of a stored file, empty until they are built."""
+    if not file:
+        return {}
+    return stored_variant_urls(file.storage, file.name, digest, ready, request)
+
+
+def stored_variant_urls(storage, name, digest, ready, request=None):
+    if not (name and digest and ready):
+        return {}
+    urls = {}
+    for variant in image_variants():
+        url = storage.url(variant_name(digest, variant))
+        urls[variant] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def build_variants(storage, name, digest):
+    """
+    Writes the missing variants of the stored image `name`, variants already built for the same
+    content are reused. Returns False when the file isn't an image Pillow can read.
+    """
+    variants = image_variants()
+    missing = {
+        variant: size for variant, size in variants.items() if not storage.exists(variant_name(digest, variant))
+    }
+    if not missing:
+        return True
+    try:
+        with storage.open(name) as file:
+            image = Image.open(file)
+            # JPEGs are decoded straight at the smallest scale still larger than the biggest variant
+            image.draft('RGB', (max(width for width, height in missing.values()),
+                                max(height for width, height in missing.values())))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            for variant, size in missing.items():
+                resized = image.copy()
+                resized.thumbnail(size, Image.LANCZOS)
+                output = io.BytesIO()
+                resized.save(output, 'JPEG', quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+                storage.save(variant_name(digest, variant), ContentFile(output.getvalue()))
+    except (OSError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+@task(queue='images')
+def build_field_variants(label, pk, field_name):
+    """Builds the variants of the file stored in `field_name` of one row and flags them as available."""
+    model = apps.get_model(label)
+    field = model._meta.get_field(field_name)
+    instance = model._default_manager.filter(pk=pk).only(field_name, field.hash_field).first()
+    if instance is None or not getattr(instance, field_name):
+        return False
+    digest = getattr(instance, field.hash_field)
+    if not digest or not build_variants(field.storage, getattr(instance, field_name).name, digest):
+        return False
+    # the hash condition skips rows whose file was replaced meanwhile, their own build flags them
+    updated = model._default_manager.filter(pk=pk, **{field.hash_field: digest}).update(**{field.variants_field: True})
+    if updated:
+        bump_generation(model)
+    return True
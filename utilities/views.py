@@ -0,0 +1,24 @@
+from rest_framework import status
+from rest_framework.generics import GenericAPIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from utilities.caching import cache_stats
+from utilities.middleware import request_metrics
+
+
+class RequestMetricsAPIView(GenericAPIView):
+    """Per-view request metrics aggregated by this process, `?reset=true` clears them after reading."""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        reset = request.query_params.get('reset') in ['1', 'true', ]
+        return Response(request_metrics.snapshot(reset=reset), status=status.HTTP_200_OK)
+
+
+class CacheMetricsAPIView(GenericAPIView):
+    """Response cache hits, misses, 304s and generation invalidations counted by this process."""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache_stats.snapshot(), status=status.HTTP_200_OK)
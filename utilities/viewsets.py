@@ -1,14 +1,137 @@
+from itertools import chain, islice
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
 from django_filters import BooleanFilter
 from django_filters.rest_framework import FilterSet
+from django_restql.mixins import DynamicFieldsMixin, EagerLoadingMixin
 from drf_yasg import openapi
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from posts.models import Like, Post
-from users.models import FriendShip
+from users.graph import friends_queryset
+from utilities.compact import Unsupported
+from utilities.exceptions import Http400
+from utilities.export import EXPORT_FORMATS, NDJSON, export_response
 
 User = get_user_model()
 
 
+class QueryOptimizationMixin(EagerLoadingMixin):
+    """
+    Plans the viewset queryset from the serializer fields the client asked for (including
+    django-restql `query` selections): `select_related` / `prefetch_related` map a serializer
+    field to the relations it renders and `only_fields` maps a serializer field to the model
+    columns it reads, plain model fields are mapped automatically.
+    """
+    select_related = {}
+    prefetch_related = {}
+    only_fields = {}
+    only_actions = ['list', 'retrieve', ]
+
+    @property
+    def parsed_restql_query(self):
+        if not issubclass(self.get_serializer_class(), DynamicFieldsMixin):
+            # the serializer ignores the query and renders every field, their relations are all needed
+            return {'include': ['*'], 'exclude': [], 'arguments': {}, 'aliases': {}}
+        return super(QueryOptimizationMixin, self).parsed_restql_query
+
+    def get_requested_fields(self):
+        serializer_class = self.get_serializer_class()
+        fields = list(serializer_class.Meta.fields)
+        if not issubclass(serializer_class, DynamicFieldsMixin):
+            return fields
+
+        query = self.parsed_restql_query
+        included = set()
+        for field in query['include']:
+            if field == '*':
+                included.update(fields)
+            elif isinstance(field, dict):
+                included.update(field.keys())
+            else:
+                included.add(field)
+        excluded = set(query['exclude'])
+        return [field for field in fields if field in included and field not in excluded]
+
+    def get_only_fields(self, queryset):
+        """
+        Returns the model columns needed to render the requested fields,
+        or None when one of them can't be resolved and every column has to be loaded.
+        """
+        model_fields = {
+            field.name: field for field in queryset.model._meta.get_fields() if field.concrete
+        }
+        columns = [queryset.model._meta.pk.name]
+        for field in self.get_requested_fields():
+            if field in self.only_fields:
+                columns.extend(self.only_fields[field])
+            elif field in model_fields and not model_fields[field].many_to_many:
+                columns.append(field)
+            else:
+                return None
+        return columns
+
+    def get_eager_queryset(self, queryset):
+        queryset = super(QueryOptimizationMixin, self).get_eager_queryset(queryset)
+        if self.action in self.only_actions:
+            columns = self.get_only_fields(queryset)
+            if columns is not None:
+                queryset = queryset.only(*columns)
+        return queryset
+
+
+class CompactListMixin:
+    """
+    Serves `list` with `compact_serializer_class` (see `utilities.compact`) when
+    `COMPACT_SERIALIZERS` is on: the page is read with `values()` and rendered from the row dicts.
+    The requests the compact serializer can't reproduce are served by the regular serializer.
+    """
+    compact_serializer_class = None
+
+    def get_compact_serializer(self):
+        if not settings.COMPACT_SERIALIZERS or self.compact_serializer_class is None:
+            return None
+        try:
+            return self.compact_serializer_class(context=self.get_serializer_context())
+        except Unsupported:
+            return None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_compact_serializer()
+        if serializer is None:
+            return super(CompactListMixin, self).list(request, *args, **kwargs)
+
+        # created_at is read for the keyset cursors
+        rows = serializer.values(self.filter_queryset(self.get_queryset()), 'created_at')
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
+
+
+class ExportMixin:
+    """
+    Adds a staff only `export/` endpoint streaming every row of `exporter` (narrowed by the
+    viewset filters) as NDJSON or CSV, picked by the `export_format` query parameter.
+    """
+    exporter = None
+
+    @action(detail=False, methods=['get', ], url_path='export', url_name='export', permission_classes=[IsAdminUser, ])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', NDJSON)
+        if export_format not in EXPORT_FORMATS:
+            raise Http400(_("export_format must be one of: %s") % ', '.join(EXPORT_FORMATS))
+        queryset = self.filter_queryset(self.exporter.get_queryset())
+        rows = self.exporter.rows(queryset, context=self.get_serializer_context())
+        # the first chunk is serialized before the response starts, an invalid restql query
+        # is answered with a 400 instead of breaking the stream after a 200
+        first = list(islice(rows, 1))
+        return export_response(chain(first, rows), export_format, filename=self.exporter.name)
+
+
 class UserFilterClass(FilterSet):
     friends = BooleanFilter(method='filter_friends')
 
@@ -18,14 +141,7 @@ class UserFilterClass(FilterSet):
 
     def filter_friends(self, queryset, name, value):
         if value:
-            friend_ships = FriendShip.objects.filter(
-                Q(sender_id=self.request.user.id) |
-                Q(receiver_id=self.request.user.id)
-            )
-            queryset = queryset.filter(
-                Q(pk__in=friend_ships.values('sender_id')) |
-                Q(pk__in=friend_ships.values('receiver_id'))
-            )
+            queryset = queryset.filter(pk__in=friends_queryset(self.request.user.id))
         return queryset
 
 
@@ -36,6 +152,7 @@ class PostFilterClass(FilterSet):
         model = Post
         fields = [
             'user',
+            'user__username',
             'is_draft',
         ]
 
@@ -47,6 +164,19 @@ class PostFilterClass(FilterSet):
         return queryset
 
 
+pagination_params = [
+    openapi.Parameter('page_size', in_=openapi.IN_QUERY, required=True, default=20,
+                      description="Number of results to return per page.",
+                      type=openapi.TYPE_INTEGER),
+    openapi.Parameter('pagination', in_=openapi.IN_QUERY, enum=['page', 'cursor', ],
+                      description="Pagination mode, `cursor` pages on (created_at, id) without counting, "
+                                  "without `ordering` or `search`.",
+                      type=openapi.TYPE_STRING),
+    openapi.Parameter('cursor', in_=openapi.IN_QUERY,
+                      description="Opaque cursor taken from the `next`/`previous` links.",
+                      type=openapi.TYPE_STRING),
+]
+
 user_field_expand = [
     openapi.Parameter('friends', in_=openapi.IN_QUERY,
                       description="Filter the returned users list with the authentication user friends.",
@@ -54,10 +184,7 @@ user_field_expand = [
     openapi.Parameter('ordering', in_=openapi.IN_QUERY, enum=['created_at', '-created_at', 'username', '-username', ],
                       description="Ordering the returned users list.",
                       type=openapi.TYPE_STRING),
-    openapi.Parameter('page_size', in_=openapi.IN_QUERY, required=True, default=20,
-                      description="Number of results to return per page.",
-                      type=openapi.TYPE_INTEGER),
-]
+] + pagination_params
 
 post_field_expand = [
     openapi.Parameter('is_liked', in_=openapi.IN_QUERY,
@@ -66,10 +193,7 @@ post_field_expand = [
     openapi.Parameter('ordering', in_=openapi.IN_QUERY, enum=['created_at', '-created_at', 'text', '-text', ],
                       description="Ordering the returned posts list.",
                       type=openapi.TYPE_STRING),
-    openapi.Parameter('page_size', in_=openapi.IN_QUERY, required=True, default=20,
-                      description="Number of results to return per page.",
-                      type=openapi.TYPE_INTEGER),
-]
+] + pagination_params
 
 friendship_field_expand = [
     openapi.Parameter('status', in_=openapi.IN_QUERY, enum=["waiting", "accepted"],
@@ -78,22 +202,21 @@ friendship_field_expand = [
     openapi.Parameter('ordering', in_=openapi.IN_QUERY, enum=['created_at', '-created_at', ],
                       description="Ordering the returned friendships list.",
                       type=openapi.TYPE_STRING),
-    openapi.Parameter('page_size', in_=openapi.IN_QUERY, required=True, default=20,
-                      description="Number of results to return per page.",
-                      type=openapi.TYPE_INTEGER),
-]
+] + pagination_params
 
 comment_field_expand = [
     openapi.Parameter('ordering', in_=openapi.IN_QUERY, enum=['created_at', '-created_at', 'text', '-text', ],
                       description="Ordering the returned posts list.",
                       type=openapi.TYPE_STRING),
-    openapi.Parameter('page_size', in_=openapi.IN_QUERY, required=True, default=20,
-                      description="Number of results to return per page.",
-                      type=openapi.TYPE_INTEGER),
-]
+] + pagination_params
 
-attachment_field_expand = [
-    openapi.Parameter('page_size', in_=openapi.IN_QUERY, required=True, default=20,
-                      description="Number of results to return per page.",
-                      type=openapi.TYPE_INTEGER),
+attachment_field_expand = pagination_params
+
+# the feed always pages by cursor
+feed_field_expand = [param for param in pagination_params if param.name != 'pagination']
+
+export_field_expand = [
+    openapi.Parameter('export_format', in_=openapi.IN_QUERY, enum=['ndjson', 'csv', ], default='ndjson',
+                      description="Format of the streamed rows, one JSON object per line or CSV.",
+                      type=openapi.TYPE_STRING),
 ]